@@ -0,0 +1,322 @@
+"""
+Streaming anomaly detection for battery charger.
+
+Watches the voltage/current stream for behaviour that does not match the
+active charging stage, long before a hard safety limit trips:
+
+- current_rise:  Current creeping up while the PSU regulates voltage
+                 (absorption, float, CV). A shorted cell or thermal runaway
+                 makes the battery draw more instead of tapering. CUSUM on the
+                 per-sample current increments.
+- voltage_step:  Sudden voltage jump while the PSU regulates current (bulk, CC).
+                 Compared against the EWMA of recent voltage changes.
+- noise_burst:   Short-term voltage/current jitter far above its long-term
+                 baseline - typical for a loose clamp or corroded terminal.
+                 Fast vs. slow EWMA of absolute sample-to-sample changes.
+
+Every update is O(1): a handful of float operations, no buffers. The main
+loop feeds the filtered values (see measurement_filter), so a single
+dropout reading does not look like a step or a burst.
+"""
+
+import math
+import time
+import logging
+from dataclasses import dataclass, asdict
+from typing import Optional, List
+
+logger = logging.getLogger(__name__)
+
+SEVERITIES = ('info', 'warning', 'critical')
+ACTIONS = ('none', 'derate', 'stop')
+
+# Stage regimes
+REGIME_NONE = 0  # Unknown / transient (Pulse) - only noise detection
+REGIME_VOLTAGE = 1  # PSU holds voltage, current should taper
+REGIME_CURRENT = 2  # PSU holds current, voltage should rise smoothly
+
+VOLTAGE_REGULATED_STAGES = ('absorption', 'float')
+VOLTAGE_REGULATED_MODES = ('CV', 'Trickle', 'Conditioning')
+CURRENT_REGULATED_MODES = ('CC',)
+
+# Samples ignored after a stage change (setpoint change transient)
+SETTLE_SAMPLES = 2
+
+
+@dataclass
+class AnomalyEvent:
+    """Detected anomaly."""
+    kind: str  # current_rise, voltage_step, noise_burst
+    severity: str  # info, warning, critical
+    action: str  # none, derate, stop
+    message: str
+    timestamp: float
+    sample: int  # Sample index within the session at detection
+    value: float  # Detector statistic that triggered
+
+    def to_dict(self) -> dict:
+        """Convert to dictionary (for MQTT/JSON)."""
+        return asdict(self)
+
+
+class AnomalyDetector:
+    """O(1)-per-sample anomaly detector on the V/I stream."""
+
+    def __init__(self, config: Optional[dict] = None):
+        """
+        Initialize anomaly detector.
+
+        Args:
+            config: anomaly_detection configuration dictionary
+        """
+        config = config or {}
+        self.enabled = config.get('enabled', True)
+        self.warmup_samples = int(config.get('warmup_samples', 6))
+        self.cooldown = float(config.get('cooldown', 300.0))
+        self.derate_factor = float(config.get('derate_factor', 0.5))
+        self.derate_min_current = float(config.get('derate_min_current', 0.5))  # A
+
+        rise = config.get('current_rise', {})
+        self.rise_enabled = rise.get('enabled', True)
+        self.rise_drift = float(rise.get('drift', 0.02))  # A/sample allowed
+        self.rise_threshold = float(rise.get('threshold', 0.5))  # A cumulative
+        self.rise_severity = self._check_severity(rise.get('severity', 'warning'))
+        self.rise_action = self._check_action(rise.get('action', 'none'))
+
+        step = config.get('voltage_step', {})
+        self.step_enabled = step.get('enabled', True)
+        self.step_threshold = float(step.get('threshold', 0.3))  # V minimum step
+        self.step_sigma = float(step.get('sigma', 6.0))  # Std devs above normal change
+        self.step_current_tolerance = float(step.get('current_tolerance', 0.1))  # A
+        self.step_severity = self._check_severity(step.get('severity', 'warning'))
+        self.step_action = self._check_action(step.get('action', 'none'))
+        self.step_alpha = float(step.get('alpha', 0.1))  # EWMA weight for dV statistics
+
+        noise = config.get('noise_burst', {})
+        self.noise_enabled = noise.get('enabled', True)
+        self.noise_ratio = float(noise.get('ratio', 4.0))  # fast/slow jitter ratio
+        self.noise_min_voltage = float(noise.get('min_voltage', 0.05))  # V
+        self.noise_min_current = float(noise.get('min_current', 0.2))  # A
+        self.noise_fast_alpha = float(noise.get('fast_alpha', 0.3))
+        self.noise_slow_alpha = float(noise.get('slow_alpha', 0.02))
+        self.noise_severity = self._check_severity(noise.get('severity', 'warning'))
+        self.noise_action = self._check_action(noise.get('action', 'none'))
+
+        self.events_total = 0
+        self.reset()
+
+    @staticmethod
+    def _check_severity(severity: str) -> str:
+        if severity not in SEVERITIES:
+            raise ValueError(f"Invalid anomaly severity '{severity}' (valid: {', '.join(SEVERITIES)})")
+        return severity
+
+    @staticmethod
+    def _check_action(action: str) -> str:
+        if action not in ACTIONS:
+            raise ValueError(f"Invalid anomaly action '{action}' (valid: {', '.join(ACTIONS)})")
+        return action
+
+    def reset(self):
+        """Reset all statistics (start of session)."""
+        self.sample_count = 0
+        self._regime_key = None
+        self._regime = REGIME_NONE
+        self._regime_samples = 0
+        self._last_voltage = math.nan
+        self._last_current = math.nan
+
+        # current_rise CUSUM
+        self._rise_sum = 0.0
+
+        # voltage_step EWMA of dV and its variance
+        self._dv_mean = 0.0
+        self._dv_var = 0.0
+
+        # noise_burst fast/slow EWMA of |dV| and |dI|
+        self._v_fast = 0.0
+        self._v_slow = 0.0
+        self._i_fast = 0.0
+        self._i_slow = 0.0
+
+        # Cooldown per detector (last event timestamps)
+        self._last_rise_event = 0.0
+        self._last_step_event = 0.0
+        self._last_noise_event = 0.0
+
+    def _classify(self, mode: str, stage: Optional[str]) -> int:
+        """Map mode/stage to the expected regulation regime."""
+        if mode == 'IUoU':
+            if stage in VOLTAGE_REGULATED_STAGES:
+                return REGIME_VOLTAGE
+            if stage == 'bulk':
+                return REGIME_CURRENT
+            return REGIME_NONE
+        if mode in VOLTAGE_REGULATED_MODES:
+            return REGIME_VOLTAGE
+        if mode in CURRENT_REGULATED_MODES:
+            return REGIME_CURRENT
+        return REGIME_NONE
+
+    def update(
+        self,
+        voltage: float,
+        current: float,
+        mode: str = '',
+        stage: Optional[str] = None,
+        now: Optional[float] = None
+    ) -> Optional[List[AnomalyEvent]]:
+        """
+        Feed one sample.
+
+        Args:
+            voltage: Measured voltage in V
+            current: Measured current in A
+            mode: Charging mode name
+            stage: Stage/phase within the mode
+            now: Sample timestamp (defaults to time.time())
+
+        Returns:
+            List of new events, or None if nothing was detected
+        """
+        if not self.enabled:
+            return None
+
+        if now is None:
+            now = time.time()
+        self.sample_count += 1
+
+        # Stage change: expected behaviour changes, restart the residual
+        # statistics (keep the noise baseline - it describes the wiring)
+        regime_key = (mode, stage)
+        if regime_key != self._regime_key:
+            self._regime_key = regime_key
+            self._regime = self._classify(mode, stage)
+            self._regime_samples = 0
+            self._rise_sum = 0.0
+            self._dv_mean = 0.0
+            self._dv_var = 0.0
+            self._v_fast = self._v_slow
+            self._i_fast = self._i_slow
+            self._last_voltage = voltage
+            self._last_current = current
+            return None
+
+        dv = voltage - self._last_voltage
+        di = current - self._last_current
+        self._last_voltage = voltage
+        self._last_current = current
+        self._regime_samples += 1
+        if self._regime_samples <= SETTLE_SAMPLES:
+            return None
+
+        events = None
+
+        # Noise burst: jitter level vs. long-term baseline
+        if self.noise_enabled:
+            abs_dv = abs(dv)
+            abs_di = abs(di)
+            fa = self.noise_fast_alpha
+            self._v_fast += fa * (abs_dv - self._v_fast)
+            self._i_fast += fa * (abs_di - self._i_fast)
+            noisy_v = noisy_i = False
+            if self.sample_count > self.warmup_samples:
+                noisy_v = (self._v_fast > self.noise_min_voltage and
+                           self._v_fast > self.noise_ratio * self._v_slow)
+                noisy_i = (self._i_fast > self.noise_min_current and
+                           self._i_fast > self.noise_ratio * self._i_slow)
+
+            if noisy_v or noisy_i:
+                if now - self._last_noise_event >= self.cooldown:
+                    self._last_noise_event = now
+                    events = self._emit(
+                        events, 'noise_burst', self.noise_severity, self.noise_action, now,
+                        self._v_fast if noisy_v else self._i_fast,
+                        f"Noise burst on {'voltage' if noisy_v else 'current'}: "
+                        f"jitter {self._v_fast:.3f}V/{self._i_fast:.3f}A vs baseline "
+                        f"{self._v_slow:.3f}V/{self._i_slow:.3f}A - check clamps and wiring"
+                    )
+            else:
+                # Only learn the baseline from quiet samples
+                sa = self.noise_slow_alpha
+                self._v_slow += sa * (abs_dv - self._v_slow)
+                self._i_slow += sa * (abs_di - self._i_slow)
+
+        warmed_up = self._regime_samples > SETTLE_SAMPLES + self.warmup_samples
+
+        # Current rise during voltage regulation (one-sided CUSUM)
+        if self._regime == REGIME_VOLTAGE and self.rise_enabled:
+            self._rise_sum = max(0.0, self._rise_sum + di - self.rise_drift)
+            if (warmed_up and self._rise_sum > self.rise_threshold and
+                    now - self._last_rise_event >= self.cooldown):
+                self._last_rise_event = now
+                events = self._emit(
+                    events, 'current_rise', self.rise_severity, self.rise_action, now,
+                    self._rise_sum,
+                    f"Current rising during voltage regulation ({mode} {stage or ''}): "
+                    f"+{self._rise_sum:.2f}A cumulative, now {current:.2f}A at {voltage:.2f}V"
+                )
+                self._rise_sum = 0.0
+
+        # Voltage step during current regulation
+        elif self._regime == REGIME_CURRENT and self.step_enabled:
+            residual = dv - self._dv_mean
+            sigma = math.sqrt(self._dv_var)
+            if (warmed_up and abs(di) < self.step_current_tolerance and
+                    abs(residual) > self.step_threshold and
+                    abs(residual) > self.step_sigma * sigma):
+                if now - self._last_step_event >= self.cooldown:
+                    self._last_step_event = now
+                    events = self._emit(
+                        events, 'voltage_step', self.step_severity, self.step_action, now,
+                        residual,
+                        f"Voltage step {residual:+.3f}V at constant current {current:.2f}A "
+                        f"(normal change {self._dv_mean:+.4f}±{sigma:.4f}V)"
+                    )
+            else:
+                # Steps are excluded from the statistics they are measured against
+                a = self.step_alpha
+                self._dv_mean += a * residual
+                self._dv_var = (1 - a) * (self._dv_var + a * residual * residual)
+
+        return events
+
+    def _emit(self, events, kind, severity, action, now, value, message) -> List[AnomalyEvent]:
+        """Create event, log it and append to the event list."""
+        event = AnomalyEvent(
+            kind=kind,
+            severity=severity,
+            action=action,
+            message=message,
+            timestamp=now,
+            sample=self.sample_count,
+            value=round(value, 4)
+        )
+        self.events_total += 1
+        if severity == 'critical':
+            logger.error(f"ANOMALY: {message}")
+        elif severity == 'warning':
+            logger.warning(f"ANOMALY: {message}")
+        else:
+            logger.info(f"ANOMALY: {message}")
+
+        if events is None:
+            events = []
+        events.append(event)
+        return events
+
+    def get_status(self) -> dict:
+        """
+        Get detector status.
+
+        Returns:
+            Status dictionary
+        """
+        return {
+            'enabled': self.enabled,
+            'samples': self.sample_count,
+            'events_total': self.events_total,
+            'current_rise_cusum': round(self._rise_sum, 4),
+            'voltage_jitter': round(self._v_fast, 4),
+            'current_jitter': round(self._i_fast, 4)
+        }
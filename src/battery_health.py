@@ -0,0 +1,232 @@
+"""
+Battery health regression over the charge history.
+
+Ah delivered per session says little on its own: a 40 Ah charge after a
+deep discharge and a 5 Ah top-up can come from the same healthy battery.
+The engine normalizes every session by the depth of discharge it started
+from before fitting a trend:
+
+- depth of discharge from the resting voltage at charge start (OCV/SOC
+  table, see diagnostic_mode.soc_from_rest_voltage)
+- capacity estimate per session = Ah delivered x charging efficiency /
+  depth of discharge; shallow sessions (< min_depth) are skipped
+- weighted least-squares line of capacity over time (weight = depth of
+  discharge) with one outlier-rejection pass; health is the fitted
+  capacity today relative to the rated capacity, with a 95 % confidence
+  interval from the residuals
+- charge-step resistance per session = (first voltage under charge -
+  resting voltage) / first current, both read once right after the output
+  turns on (not from the downsampled curve, whose first point averages a
+  session-length dependent number of ticks), with its own linear trend
+
+Fits are closed-form sums over at most max_sessions sessions, in plain
+Python (numpy is not a dependency; a few milliseconds including the query),
+so they run after every session.
+"""
+
+import math
+import time
+import logging
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from diagnostic_mode import soc_from_rest_voltage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_DEPTH = 0.2  # Skip sessions starting above 80 % SOC
+DEFAULT_MAX_SESSIONS = 500
+DEFAULT_MIN_SESSIONS = 3  # Fewer usable sessions: no estimate
+MIN_RESISTANCE_CURRENT = 0.5  # A - first-tick current needed for a resistance sample
+OUTLIER_SIGMA = 3.0
+
+# Two-sided 95 % Student t quantiles by degrees of freedom
+_T95 = ((1, 12.71), (2, 4.30), (3, 3.18), (4, 2.78), (5, 2.57), (6, 2.45), (8, 2.31),
+        (10, 2.23), (15, 2.13), (20, 2.09), (30, 2.04), (60, 2.00))
+
+
+def _t95(dof: int) -> float:
+    """95 % t quantile (conservative: nearest tabulated dof at or below)."""
+    if dof >= 120:
+        return 1.96
+    for table_dof, quantile in reversed(_T95):
+        if dof >= table_dof:
+            return quantile
+    return _T95[0][1]
+
+
+class LinearFit:
+    """Weighted least-squares line y = intercept + slope * x."""
+
+    def __init__(self, xs: Sequence[float], ys: Sequence[float], weights: Optional[Sequence[float]] = None):
+        """
+        Fit the line.
+
+        Args:
+            xs: x values
+            ys: y values
+            weights: Per-point weights (default 1)
+        """
+        n = len(xs)
+        if weights is None:
+            weights = [1.0] * n
+        # Normalize weights to mean 1 so residual variance keeps its units
+        total = sum(weights)
+        ws = [w * n / total for w in weights]
+        x_mean = sum(w * x for w, x in zip(ws, xs)) / n
+        y_mean = sum(w * y for w, y in zip(ws, ys)) / n
+        sxx = sum(w * (x - x_mean) ** 2 for w, x in zip(ws, xs))
+        sxy = sum(w * (x - x_mean) * (y - y_mean) for w, x, y in zip(ws, xs, ys))
+
+        self.n = n
+        self.x_mean = x_mean
+        self.sxx = sxx
+        # Two points fit any line exactly - use their mean instead
+        self.has_slope = n >= 3 and sxx > 0
+        self.slope = sxy / sxx if self.has_slope else 0.0
+        self.intercept = y_mean - self.slope * x_mean
+        self.residuals = [y - self.predict(x) for x, y in zip(xs, ys)]
+        dof = n - 2 if self.has_slope else n - 1
+        self.dof = dof
+        self.residual_std = (
+            math.sqrt(sum(w * r * r for w, r in zip(ws, self.residuals)) / dof) if dof > 0 else None
+        )
+
+    def predict(self, x: float) -> float:
+        """Fitted value at x."""
+        return self.intercept + self.slope * x
+
+    def interval(self, x: float) -> Optional[float]:
+        """95 % confidence half-width of the fitted value at x (None if undetermined)."""
+        if self.residual_std is None:
+            return None
+        variance = 1.0 / self.n
+        if self.has_slope:
+            variance += (x - self.x_mean) ** 2 / self.sxx
+        return _t95(self.dof) * self.residual_std * math.sqrt(variance)
+
+
+class BatteryHealthEngine:
+    """Fits capacity fade and resistance trends from BatteryHistoryTracker data."""
+
+    def __init__(self, history, battery_config: Optional[dict] = None, config: Optional[dict] = None,
+                 charging_efficiency: float = 0.83):
+        """
+        Initialize health engine.
+
+        Args:
+            history: BatteryHistoryTracker
+            battery_config: battery configuration (capacity, type,
+                nominal_voltage)
+            config: health configuration (min_depth, max_sessions,
+                min_sessions)
+            charging_efficiency: Ah stored per Ah delivered
+        """
+        battery_config = battery_config or {}
+        config = config or {}
+        self.history = history
+        self.rated_capacity = float(battery_config.get('capacity', 0.0))
+        self.battery_type = 'agm' if 'agm' in str(battery_config.get('type', '')).lower() else 'flooded'
+        self.nominal_voltage = float(battery_config.get('nominal_voltage', 12.0))
+        self.min_depth = float(config.get('min_depth', DEFAULT_MIN_DEPTH))
+        self.max_sessions = int(config.get('max_sessions', DEFAULT_MAX_SESSIONS))
+        self.min_sessions = max(1, int(config.get('min_sessions', DEFAULT_MIN_SESSIONS)))
+        self.charging_efficiency = charging_efficiency
+
+    def _samples(self, rows: List[tuple]) -> Tuple[list, list]:
+        """Split history rows into capacity and resistance samples (days, value, weight)."""
+        capacity, resistance = [], []
+        for timestamp, start_voltage, ah, success, first_voltage, first_current in rows:
+            try:
+                day = datetime.fromisoformat(timestamp).timestamp() / 86400.0
+            except (TypeError, ValueError):
+                continue
+            if start_voltage is None:
+                continue
+            if first_voltage is not None and first_current and first_current >= MIN_RESISTANCE_CURRENT:
+                step = first_voltage - start_voltage
+                if step > 0:
+                    resistance.append((day, step / first_current * 1000.0, 1.0))  # mOhm
+            if not success or not ah:
+                continue
+            soc = soc_from_rest_voltage(start_voltage, self.battery_type, self.nominal_voltage)
+            depth = 1.0 - soc / 100.0
+            if depth < self.min_depth:
+                continue
+            capacity.append((day, ah * self.charging_efficiency / depth, depth))
+        return capacity, resistance
+
+    def _fit(self, samples: list) -> Optional[LinearFit]:
+        """Fit (day, value, weight) samples, refitting once without > 3 sigma outliers."""
+        if len(samples) < self.min_sessions:
+            return None
+        days, values, weights = zip(*samples)
+        fit = LinearFit(days, values, weights)
+        if fit.residual_std:
+            kept = [sample for sample, residual in zip(samples, fit.residuals)
+                    if abs(residual) <= OUTLIER_SIGMA * fit.residual_std]
+            if self.min_sessions <= len(kept) < len(samples):
+                days, values, weights = zip(*kept)
+                fit = LinearFit(days, values, weights)
+        return fit
+
+    def refit(self, battery_model: str) -> Optional[dict]:
+        """
+        Fit health for one battery from its history.
+
+        Args:
+            battery_model: Battery model/profile name
+
+        Returns:
+            Health dictionary (capacity and health with 95 % bounds, fade
+            per year, resistance trend, sessions used), or None without
+            enough usable sessions
+        """
+        started = time.perf_counter()
+        rows = self.history.get_health_data(battery_model, self.max_sessions)
+        capacity_samples, resistance_samples = self._samples(rows)
+        capacity_fit = self._fit(capacity_samples)
+        if capacity_fit is None:
+            logger.debug(f"Health fit for {battery_model}: {len(capacity_samples)} usable sessions - not enough")
+            return None
+
+        today = time.time() / 86400.0
+        capacity = capacity_fit.predict(today)
+        half_width = capacity_fit.interval(today)
+        result = {
+            'battery': battery_model,
+            'capacity_ah': round(capacity, 2),
+            'capacity_low': round(capacity - half_width, 2) if half_width is not None else None,
+            'capacity_high': round(capacity + half_width, 2) if half_width is not None else None,
+            'rated_capacity': self.rated_capacity or None,
+            'health': None,
+            'health_low': None,
+            'health_high': None,
+            'fade_per_year': None,
+            'sessions_used': capacity_fit.n,
+            'sessions_total': len(rows),
+        }
+        if self.rated_capacity > 0:
+            scale = 100.0 / self.rated_capacity
+            result['health'] = round(capacity * scale, 1)
+            if half_width is not None:
+                result['health_low'] = round((capacity - half_width) * scale, 1)
+                result['health_high'] = round((capacity + half_width) * scale, 1)
+            result['fade_per_year'] = round(-capacity_fit.slope * 365.0 * scale, 2)  # % of rated
+
+        resistance_fit = self._fit(resistance_samples)
+        if resistance_fit is not None:
+            first = sorted(value for _, value, _ in resistance_samples[:5])
+            baseline = first[len(first) // 2]  # Median of the first sessions
+            resistance = resistance_fit.predict(today)
+            result['resistance_mohm'] = round(resistance, 1)
+            result['resistance_trend'] = round(resistance_fit.slope * 30.0, 2)  # mOhm per 30 days
+            result['resistance_change'] = round((resistance / baseline - 1.0) * 100.0, 1) if baseline > 0 else None
+
+        result['fit_ms'] = round((time.perf_counter() - started) * 1000.0, 2)
+        result['timestamp'] = datetime.now().isoformat(timespec='seconds')
+        logger.info(
+            f"Battery health {battery_model}: {result['capacity_ah']}Ah "
+            f"({result['health']}%, {capacity_fit.n} sessions, fit {result['fit_ms']}ms)"
+        )
+        return result
@@ -2,53 +2,225 @@
 """
 Battery History & Health Tracking
 Tracks charge cycles, capacity, and battery health over time
+
+Sessions are stored in SQLite (WAL mode): recording a session is one
+INSERT, queries use the (battery, timestamp) index, and other processes
+(e.g. the log analyzer) can read while the charger writes. An existing
+battery_history.json is imported once on first start and renamed to
+battery_history.json.migrated.
+
+Per-battery statistics are running aggregates (battery_stats table, cached
+in memory) updated in the same transaction as each insert: totals, Welford
+mean/variance of Ah per session, an exponentially weighted recent Ah and
+the last RECENT_WINDOW sessions. get_battery_stats() is O(1) however many
+sessions a battery has.
+
+Each session can carry a downsampled V/I/temperature curve (see
+charge_curve.py), stored as JSON columns in session_curves. The first
+voltage/current under charge (the health fit's resistance sample) is
+stored in its own sessions columns: the curve's first point is an average
+whose width depends on the session length.
 """
 
 import json
+import math
+import sqlite3
 import logging
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Dict, List
 
 logger = logging.getLogger(__name__)
 
+SCHEMA_VERSION = 4
+
+RECENT_WINDOW = 10  # Sessions in the "recent" average
+DEFAULT_EW_ALPHA = 0.2  # Weight of the newest session in the EW recent Ah
+
+SESSION_COLUMNS = ('timestamp', 'start_voltage', 'end_voltage', 'ah_delivered',
+                   'wh_delivered', 'duration', 'mode', 'success')
+
 
 class BatteryHistoryTracker:
     """Tracks battery charge history and health."""
 
-    def __init__(self, history_file: str = "battery_history.json"):
+    def __init__(self, history_file: str = "battery_history.db", ew_alpha: float = DEFAULT_EW_ALPHA):
         """
         Initialize battery history tracker.
 
         Args:
-            history_file: Path to history JSON file
+            history_file: Path to history database (a .json path is accepted
+                for compatibility: the database is created next to it and
+                the JSON history imported)
+            ew_alpha: Weight of the newest session in the exponentially
+                weighted recent Ah (0-1)
         """
-        self.history_file = Path(history_file)
-        self.history: Dict[str, List[dict]] = {}
-        self._load_history()
-
-    def _load_history(self):
-        """Load history from file."""
-        if self.history_file.exists():
-            try:
-                with open(self.history_file, 'r') as f:
-                    self.history = json.load(f)
-                logger.info(f"Loaded battery history from {self.history_file}")
-            except Exception as e:
-                logger.error(f"Failed to load history: {e}")
-                self.history = {}
-        else:
-            logger.info("No existing history file, starting fresh")
-            self.history = {}
-
-    def _save_history(self):
-        """Save history to file."""
+        path = Path(history_file)
+        self.history_file = path.with_suffix('.db') if path.suffix == '.json' else path
+        self.legacy_file = self.history_file.with_suffix('.json')
+        self.ew_alpha = ew_alpha
+        self._lock = threading.Lock()
+        self._stats: Dict[str, dict] = {}  # battery -> running aggregates
+
+        self._db = sqlite3.connect(str(self.history_file), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        self._migrate_json()
+        self._load_stats()
+
+    def _create_schema(self):
+        """Create tables and indexes (idempotent)."""
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS battery_stats ("
+                "battery TEXT PRIMARY KEY, "
+                "sessions INTEGER NOT NULL, "
+                "successful INTEGER NOT NULL, "
+                "total_ah REAL NOT NULL, "
+                "total_wh REAL NOT NULL, "
+                "ah_mean REAL NOT NULL, "
+                "ah_m2 REAL NOT NULL, "
+                "ew_ah REAL NOT NULL, "
+                "recent_ah TEXT NOT NULL, "
+                "last_charge TEXT)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "battery TEXT NOT NULL, "
+                "timestamp TEXT NOT NULL, "
+                "start_voltage REAL, "
+                "end_voltage REAL, "
+                "ah_delivered REAL NOT NULL DEFAULT 0, "
+                "wh_delivered REAL NOT NULL DEFAULT 0, "
+                "duration INTEGER, "
+                "mode TEXT, "
+                "success INTEGER NOT NULL DEFAULT 1, "
+                "first_voltage REAL, "
+                "first_current REAL)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(sessions)")}
+            for column in ('first_voltage', 'first_current'):
+                if column not in columns:  # Upgrade from v3 (older sessions stay NULL)
+                    self._db.execute(f"ALTER TABLE sessions ADD COLUMN {column} REAL")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_battery_time ON sessions (battery, timestamp)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS sessions_time ON sessions (timestamp)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS session_curves ("
+                "session_id INTEGER PRIMARY KEY REFERENCES sessions (id) ON DELETE CASCADE, "
+                "points INTEGER NOT NULL, "
+                "curve TEXT NOT NULL)"
+            )
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            if 0 < version < 2:
+                self._rebuild_stats()  # Upgrade: aggregates from existing sessions
+
+    def _migrate_json(self):
+        """Import battery_history.json once (single transaction), then rename it."""
+        if not self.legacy_file.exists():
+            return
+        if self._db.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+            return  # Imported before, only the rename failed
         try:
-            with open(self.history_file, 'w') as f:
-                json.dump(self.history, f, indent=2)
-            logger.debug(f"Saved battery history to {self.history_file}")
+            with open(self.legacy_file, 'r') as f:
+                history = json.load(f)
         except Exception as e:
-            logger.error(f"Failed to save history: {e}")
+            logger.error(f"Failed to read legacy history {self.legacy_file}: {e} - not migrated")
+            return
+
+        rows = [
+            (battery, session.get('timestamp', ''), session.get('start_voltage'),
+             session.get('end_voltage'), session.get('ah_delivered', 0.0),
+             session.get('wh_delivered', 0.0), session.get('duration'),
+             session.get('mode'), int(session.get('success', True)))
+            for battery, sessions in history.items()
+            for session in sessions
+        ]
+        try:
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO sessions (battery, timestamp, start_voltage, end_voltage, "
+                    "ah_delivered, wh_delivered, duration, mode, success) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._db.execute(
+                    "INSERT INTO meta (key, value) VALUES ('migrated_json', ?)",
+                    (str(self.legacy_file),)
+                )
+                self._rebuild_stats()
+            self.legacy_file.rename(self.legacy_file.with_name(self.legacy_file.name + '.migrated'))
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Failed to migrate battery history: {e}")
+            return
+        logger.info(f"Migrated {len(rows)} sessions from {self.legacy_file} to {self.history_file}")
+
+    def _rebuild_stats(self):
+        """Recompute all aggregates from the sessions table (one ordered scan, in a transaction)."""
+        stats: Dict[str, dict] = {}
+        rows = self._db.execute(
+            "SELECT battery, timestamp, ah_delivered, wh_delivered, success FROM sessions "
+            "ORDER BY timestamp, id"
+        )
+        for battery, timestamp, ah, wh, success in rows:
+            entry = stats.get(battery)
+            if entry is None:
+                entry = stats[battery] = self._new_stats()
+            self._apply_session(entry, ah, wh, success, timestamp)
+        self._db.execute("DELETE FROM battery_stats")
+        for battery, entry in stats.items():
+            self._store_stats(battery, entry)
+
+    @staticmethod
+    def _new_stats() -> dict:
+        """Empty running aggregates."""
+        return {'sessions': 0, 'successful': 0, 'total_ah': 0.0, 'total_wh': 0.0,
+                'ah_mean': 0.0, 'ah_m2': 0.0, 'ew_ah': 0.0, 'recent_ah': [], 'last_charge': None}
+
+    def _apply_session(self, entry: dict, ah: float, wh: float, success, timestamp: str):
+        """Fold one session into running aggregates (Welford, EW, recent window)."""
+        ah = ah or 0.0
+        entry['sessions'] += 1
+        entry['successful'] += 1 if success else 0
+        entry['total_ah'] += ah
+        entry['total_wh'] += wh or 0.0
+        delta = ah - entry['ah_mean']
+        entry['ah_mean'] += delta / entry['sessions']
+        entry['ah_m2'] += delta * (ah - entry['ah_mean'])
+        if entry['sessions'] == 1:
+            entry['ew_ah'] = ah
+        else:
+            entry['ew_ah'] += self.ew_alpha * (ah - entry['ew_ah'])
+        entry['recent_ah'] = (entry['recent_ah'] + [ah])[-RECENT_WINDOW:]
+        if entry['last_charge'] is None or timestamp >= entry['last_charge']:
+            entry['last_charge'] = timestamp
+
+    def _store_stats(self, battery: str, entry: dict):
+        """Write one battery's aggregates (caller holds a transaction)."""
+        self._db.execute(
+            "INSERT OR REPLACE INTO battery_stats (battery, sessions, successful, total_ah, total_wh, "
+            "ah_mean, ah_m2, ew_ah, recent_ah, last_charge) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (battery, entry['sessions'], entry['successful'], entry['total_ah'], entry['total_wh'],
+             entry['ah_mean'], entry['ah_m2'], entry['ew_ah'], json.dumps(entry['recent_ah']),
+             entry['last_charge'])
+        )
+
+    def _load_stats(self):
+        """Cache all aggregates (one row per battery)."""
+        self._stats = {}
+        for row in self._db.execute("SELECT * FROM battery_stats"):
+            entry = dict(row)
+            entry['recent_ah'] = json.loads(entry['recent_ah'])
+            self._stats[entry.pop('battery')] = entry
 
     def record_charge_session(
         self,
@@ -59,8 +231,11 @@ class BatteryHistoryTracker:
         wh_delivered: float,
         duration: int,
         mode: str,
-        success: bool = True
-    ):
+        success: bool = True,
+        curve: Optional[Dict[str, list]] = None,
+        first_voltage: Optional[float] = None,
+        first_current: Optional[float] = None
+    ) -> Optional[int]:
         """
         Record a charging session.
 
@@ -73,28 +248,50 @@ class BatteryHistoryTracker:
             duration: Charging duration in seconds
             mode: Charging mode used
             success: Whether charge completed successfully
-        """
-        session = {
-            'timestamp': datetime.now().isoformat(),
-            'start_voltage': round(start_voltage, 3),
-            'end_voltage': round(end_voltage, 3),
-            'ah_delivered': round(ah_delivered, 3),
-            'wh_delivered': round(wh_delivered, 2),
-            'duration': duration,
-            'mode': mode,
-            'success': success
-        }
-
-        # Initialize battery if not exists
-        if battery_model not in self.history:
-            self.history[battery_model] = []
+            curve: Downsampled curve (CurveRecorder.downsample())
+            first_voltage: Voltage right after the output turned on
+            first_current: Current right after the output turned on
 
-        # Add session
-        self.history[battery_model].append(session)
+        Returns:
+            Session id, or None if it could not be saved
+        """
+        session = (
+            battery_model,
+            datetime.now().isoformat(),
+            round(start_voltage, 3),
+            round(end_voltage, 3),
+            round(ah_delivered, 3),
+            round(wh_delivered, 2),
+            duration,
+            mode,
+            int(success),
+            round(first_voltage, 3) if first_voltage is not None else None,
+            round(first_current, 3) if first_current is not None else None
+        )
+
+        with self._lock:
+            entry = dict(self._stats.get(battery_model) or self._new_stats())
+            self._apply_session(entry, session[4], session[5], success, session[1])
+            try:
+                with self._db:
+                    session_id = self._db.execute(
+                        "INSERT INTO sessions (battery, timestamp, start_voltage, end_voltage, "
+                        "ah_delivered, wh_delivered, duration, mode, success, first_voltage, first_current) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        session
+                    ).lastrowid
+                    if curve:
+                        self._db.execute(
+                            "INSERT INTO session_curves (session_id, points, curve) VALUES (?, ?, ?)",
+                            (session_id, len(curve.get('t', [])), json.dumps(curve, separators=(',', ':')))
+                        )
+                    self._store_stats(battery_model, entry)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to save history: {e}")
+                return None
+            self._stats[battery_model] = entry
         logger.info(f"Recorded charge session for {battery_model}: {ah_delivered:.2f}Ah in {duration/3600:.1f}h")
-
-        # Save to file
-        self._save_history()
+        return session_id
 
     def get_battery_stats(self, battery_model: str) -> Optional[Dict]:
         """
@@ -106,23 +303,15 @@ class BatteryHistoryTracker:
         Returns:
             Dictionary with statistics or None
         """
-        if battery_model not in self.history:
-            return None
-
-        sessions = self.history[battery_model]
-        if not sessions:
+        entry = self._stats.get(battery_model)
+        if not entry:
             return None
 
-        total_sessions = len(sessions)
-        successful_sessions = sum(1 for s in sessions if s.get('success', True))
-
-        total_ah = sum(s['ah_delivered'] for s in sessions)
-        total_wh = sum(s['wh_delivered'] for s in sessions)
-        avg_ah = total_ah / total_sessions if total_sessions > 0 else 0
-
-        # Get recent sessions (last 10)
-        recent = sessions[-10:]
-        recent_avg_ah = sum(s['ah_delivered'] for s in recent) / len(recent) if recent else 0
+        total_sessions = entry['sessions']
+        avg_ah = entry['ah_mean']
+        recent = entry['recent_ah']
+        recent_avg_ah = sum(recent) / len(recent) if recent else 0
+        ah_stddev = math.sqrt(entry['ah_m2'] / (total_sessions - 1)) if total_sessions > 1 else 0.0
 
         # Estimate health (capacity degradation)
         # Compare recent average to overall average
@@ -134,18 +323,73 @@ class BatteryHistoryTracker:
         return {
             'battery': battery_model,
             'total_sessions': total_sessions,
-            'successful_sessions': successful_sessions,
-            'total_ah_delivered': round(total_ah, 2),
-            'total_wh_delivered': round(total_wh, 2),
+            'successful_sessions': entry['successful'],
+            'total_ah_delivered': round(entry['total_ah'], 2),
+            'total_wh_delivered': round(entry['total_wh'], 2),
             'avg_ah_per_session': round(avg_ah, 2),
+            'ah_stddev': round(ah_stddev, 2),
             'recent_avg_ah': round(recent_avg_ah, 2),
+            'ew_recent_ah': round(entry['ew_ah'], 2),
             'estimated_health': round(min(health_estimate, 100), 1),
-            'last_charge': sessions[-1]['timestamp'] if sessions else None
+            'last_charge': entry['last_charge']
+        }
+
+    def get_window_stats(self, battery_model: str, days: float = 30.0) -> Optional[Dict]:
+        """
+        Get statistics over a recent time window (index range scan).
+
+        Args:
+            battery_model: Battery model/profile name
+            days: Window length ending now
+
+        Returns:
+            Dictionary with session count, Ah/Wh totals and Ah
+            mean/min/max/stddev in the window, or None if no sessions
+        """
+        since = (datetime.now() - timedelta(days=days)).isoformat()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*), SUM(success), SUM(ah_delivered), SUM(wh_delivered), AVG(ah_delivered), "
+                "MIN(ah_delivered), MAX(ah_delivered), AVG(ah_delivered * ah_delivered) "
+                "FROM sessions WHERE battery = ? AND timestamp >= ?",
+                (battery_model, since)
+            ).fetchone()
+        count, successful, total_ah, total_wh, mean, low, high, mean_square = row
+        if not count:
+            return None
+        variance = (mean_square - mean * mean) * count / (count - 1) if count > 1 else 0.0
+        return {
+            'battery': battery_model,
+            'days': days,
+            'sessions': count,
+            'successful_sessions': successful,
+            'total_ah_delivered': round(total_ah, 2),
+            'total_wh_delivered': round(total_wh, 2),
+            'avg_ah_per_session': round(mean, 2),
+            'min_ah': round(low, 2),
+            'max_ah': round(high, 2),
+            'ah_stddev': round(math.sqrt(max(variance, 0.0)), 2)
         }
 
     def get_all_batteries(self) -> List[str]:
         """Get list of all tracked batteries."""
-        return list(self.history.keys())
+        with self._lock:
+            return sorted(self._stats)
+
+    def _sessions(self, battery_model: str, limit: Optional[int] = None) -> List[dict]:
+        """Sessions of a battery as dictionaries, most recent first."""
+        query = (f"SELECT id, {', '.join(SESSION_COLUMNS)} FROM sessions WHERE battery = ? "
+                 "ORDER BY timestamp DESC, id DESC")
+        params = (battery_model,)
+        if limit is not None:
+            query += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        sessions = [dict(row) for row in rows]
+        for session in sessions:
+            session['success'] = bool(session['success'])
+        return sessions
 
     def get_charge_history(self, battery_model: str, limit: int = 20) -> List[dict]:
         """
@@ -156,13 +400,73 @@ class BatteryHistoryTracker:
             limit: Maximum number of sessions to return
 
         Returns:
-            List of charge sessions (most recent first)
+            List of charge sessions (most recent first; 'id' selects the
+            curve in get_charge_curve)
         """
-        if battery_model not in self.history:
+        try:
+            return self._sessions(battery_model, limit)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read history: {e}")
             return []
 
-        sessions = self.history[battery_model]
-        return list(reversed(sessions[-limit:]))
+    def get_charge_curve(self, session_id: int) -> Optional[Dict[str, list]]:
+        """
+        Get a session's downsampled curve.
+
+        Args:
+            session_id: Session id (from get_charge_history)
+
+        Returns:
+            Dictionary of columns t, v, i, temp, or None if not stored
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT curve FROM session_curves WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_charge_curves(self, battery_model: str, limit: int = 20) -> List[dict]:
+        """
+        Get the most recent sessions that have a curve, with the curve.
+
+        Args:
+            battery_model: Battery model/profile name
+            limit: Maximum number of sessions
+
+        Returns:
+            List of {'id', 'timestamp', 'ah_delivered', 'curve'} (most
+            recent first)
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT s.id, s.timestamp, s.ah_delivered, c.curve FROM sessions s "
+                "JOIN session_curves c ON c.session_id = s.id WHERE s.battery = ? "
+                "ORDER BY s.timestamp DESC, s.id DESC LIMIT ?",
+                (battery_model, limit)
+            ).fetchall()
+        return [{'id': row[0], 'timestamp': row[1], 'ah_delivered': row[2], 'curve': json.loads(row[3])}
+                for row in rows]
+
+    def get_health_data(self, battery_model: str, limit: int = 500) -> List[tuple]:
+        """
+        Get the inputs of the health fit for the most recent sessions.
+
+        Args:
+            battery_model: Battery model/profile name
+            limit: Maximum number of sessions
+
+        Returns:
+            List of (timestamp, start_voltage, ah_delivered, success,
+            first_voltage, first_current), oldest first; the last two are
+            None for sessions recorded before they were captured
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT timestamp, start_voltage, ah_delivered, success, first_voltage, first_current "
+                "FROM sessions WHERE battery = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (battery_model, limit)
+            ).fetchall()
+        return [tuple(row) for row in reversed(rows)]
 
     def export_csv(self, battery_model: str, output_file: str):
         """
@@ -174,19 +478,14 @@ class BatteryHistoryTracker:
         """
         import csv
 
-        if battery_model not in self.history:
+        sessions = list(reversed(self._sessions(battery_model)))
+        if not sessions:
             logger.error(f"No history for battery: {battery_model}")
             return
 
-        sessions = self.history[battery_model]
-
         try:
             with open(output_file, 'w', newline='') as f:
-                writer = csv.DictWriter(
-                    f,
-                    fieldnames=['timestamp', 'start_voltage', 'end_voltage',
-                                'ah_delivered', 'wh_delivered', 'duration', 'mode', 'success']
-                )
+                writer = csv.DictWriter(f, fieldnames=list(SESSION_COLUMNS), extrasaction='ignore')
                 writer.writeheader()
                 writer.writerows(sessions)
 
@@ -194,3 +493,11 @@ class BatteryHistoryTracker:
 
         except Exception as e:
             logger.error(f"Failed to export CSV: {e}")
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            try:
+                self._db.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing battery history: {e}")
@@ -0,0 +1,166 @@
+"""
+Downsampled charge curves for the battery history.
+
+The session log holds the full curve, but logs are rotated away. The
+history keeps a fixed-size, shape-preserving copy of every session's
+voltage/current/temperature curve so dashboards and health analysis can
+compare hundreds of sessions without touching raw logs:
+
+- CurveRecorder collects every control tick into a bounded buffer. When
+  the buffer is full, adjacent points are merged pairwise and the
+  sampling stride doubles, so memory is fixed however long the session.
+- lttb_indices() picks the output points with Largest-Triangle-Three-
+  Buckets over voltage and current together (each scaled to its range),
+  keeping the bulk knee, the absorption taper and stage steps.
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+DEFAULT_POINTS = 256
+DEFAULT_CAPACITY = 4096  # Buffered points before pairwise decimation
+
+
+def lttb_indices(x: Sequence[float], channels: List[Sequence[float]], n_out: int) -> List[int]:
+    """
+    Select points with Largest-Triangle-Three-Buckets.
+
+    The triangle area is summed over all channels, each normalized to its
+    value range, so a flat voltage does not hide a changing current.
+
+    Args:
+        x: Sample times (ascending)
+        channels: Value sequences, same length as x
+        n_out: Number of points to keep (>= 3)
+
+    Returns:
+        Sorted indices into x (first and last always included)
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return list(range(n))
+
+    scaled = []
+    for values in channels:
+        low, high = min(values), max(values)
+        span = high - low
+        if span > 0:
+            scaled.append([(value - low) / span for value in values])
+
+    indices = [0]
+    bucket = (n - 2) / (n_out - 2)
+    a = 0
+    for b in range(n_out - 2):
+        start = int(b * bucket) + 1
+        stop = int((b + 1) * bucket) + 1
+
+        # Average of the next bucket (the third triangle vertex)
+        next_start = stop
+        next_stop = min(int((b + 2) * bucket) + 1, n)
+        count = next_stop - next_start
+        avg_x = sum(x[next_start:next_stop]) / count
+        avg_ys = [sum(values[next_start:next_stop]) / count for values in scaled]
+
+        # Point of this bucket forming the largest triangle with the
+        # previous pick and the next bucket's average
+        ax = x[a]
+        dx_avg = ax - avg_x
+        anchors = [(values, values[a], avg_y - values[a]) for values, avg_y in zip(scaled, avg_ys)]
+        best, best_area = start, -1.0
+        for j in range(start, stop):
+            dx_j = ax - x[j]
+            area = 0.0
+            for values, ay, dy_avg in anchors:
+                area += abs(dx_avg * (values[j] - ay) - dx_j * dy_avg)
+            if area > best_area:
+                best, best_area = j, area
+        indices.append(best)
+        a = best
+    indices.append(n - 1)
+    return indices
+
+
+class CurveRecorder:
+    """Bounded buffer of (t, V, I, temperature) samples for one session."""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        """
+        Initialize recorder.
+
+        Args:
+            capacity: Maximum buffered points (even, >= 2 * output points)
+        """
+        self.capacity = capacity
+        self.reset()
+
+    def reset(self):
+        """Start a new session."""
+        self.t: List[float] = []
+        self.voltage: List[float] = []
+        self.current: List[float] = []
+        self.temperature: List[Optional[float]] = []
+        self.stride = 1  # Samples merged into one buffered point
+        self._pending = 0  # Samples accumulated into the open point
+        self.samples = 0
+
+    def add(self, t: float, voltage: float, current: float, temperature: Optional[float] = None):
+        """
+        Add one sample (amortized O(1)).
+
+        Args:
+            t: Seconds since session start
+            voltage: Measured voltage (V)
+            current: Measured current (A)
+            temperature: Battery temperature (°C) or None
+        """
+        self.samples += 1
+        if self._pending:
+            # Fold into the open point: keep the latest time, average values
+            k = self._pending
+            self.t[-1] = t
+            self.voltage[-1] += (voltage - self.voltage[-1]) / (k + 1)
+            self.current[-1] += (current - self.current[-1]) / (k + 1)
+            if temperature is not None:
+                self.temperature[-1] = temperature
+        else:
+            self.t.append(t)
+            self.voltage.append(voltage)
+            self.current.append(current)
+            self.temperature.append(temperature)
+        self._pending = (self._pending + 1) % self.stride
+
+        if len(self.t) >= self.capacity and not self._pending:
+            self._decimate()
+
+    def _decimate(self):
+        """Merge adjacent point pairs and double the stride."""
+        def pairs(values):
+            return [(values[k] + values[k + 1]) / 2 for k in range(0, len(values) - 1, 2)]
+
+        self.t = self.t[1::2]
+        self.voltage = pairs(self.voltage)
+        self.current = pairs(self.current)
+        self.temperature = [b if b is not None else a for a, b in zip(self.temperature[::2], self.temperature[1::2])]
+        self.stride *= 2
+
+    def downsample(self, points: int = DEFAULT_POINTS) -> Optional[Dict[str, list]]:
+        """
+        Get the LTTB-downsampled curve.
+
+        Args:
+            points: Output points
+
+        Returns:
+            Dictionary of columns t (s), v (V), i (A), temp (°C or None),
+            or None if fewer than 2 samples were recorded
+        """
+        if len(self.t) < 2:
+            return None
+        indices = lttb_indices(self.t, [self.voltage, self.current], points)
+        return {
+            't': [round(self.t[k], 1) for k in indices],
+            'v': [round(self.voltage[k], 3) for k in indices],
+            'i': [round(self.current[k], 3) for k in indices],
+            'temp': [round(self.temperature[k], 1) if self.temperature[k] is not None else None
+                     for k in indices],
+        }
+
@@ -2,25 +2,168 @@
 """
 Charge Scheduler
 Allows scheduling charging sessions (start time, duration, etc.)
+
+Any number of jobs can be queued. Each job carries its own profile, mode,
+duration limit and Ah target and is one of:
+
+- one-shot: runs once at start_time (or immediately)
+- cron: recurring, "minute hour day-of-month month day-of-week"
+  (e.g. "0 2 * * 6" = Saturdays at 02:00)
+- every N days: recurring conditioning charge (e.g. every 30 days from
+  start_time)
+
+Pending starts are kept in a heap ordered by due time, so update() only
+looks at the head of the queue and next_deadline() tells the main loop
+how long it may wait before the next start or stop is due. Cancelled jobs
+are dropped lazily when they reach the head.
+
+Only one scheduled run is active at a time (one PSU). A job that comes
+due while the charger is busy is retried every BUSY_RETRY_INTERVAL
+seconds until the charger is free.
 """
 
+import heapq
+import itertools
 import logging
-import time
 from datetime import datetime, timedelta
-from typing import Optional, Callable
-from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
 
 logger = logging.getLogger(__name__)
 
+BUSY_RETRY_INTERVAL = 60.0  # s - retry a due job while the charger is busy
+CRON_SEARCH_DAYS = 366 * 5  # Give up on expressions that never match (e.g. Feb 30)
+
+CRON_ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+}
+
+
+class CronSpec:
+    """
+    Parsed five-field cron expression.
+
+    Fields: minute (0-59), hour (0-23), day of month (1-31), month
+    (1-12), day of week (0-6, 0 or 7 = Sunday). Each field accepts "*",
+    numbers, ranges "a-b", lists "a,b" and steps "*/n" / "a-b/n". As in
+    cron, if both day fields are restricted either one matching is enough.
+    """
+
+    def __init__(self, expression: str):
+        """
+        Parse expression.
+
+        Args:
+            expression: Cron expression or @hourly/@daily/@weekly/@monthly
+
+        Raises:
+            ValueError: If the expression is malformed
+        """
+        self.expression = expression.strip()
+        parts = CRON_ALIASES.get(self.expression.lower(), self.expression).split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields, got {len(parts)}: '{expression}'")
+        self.minutes = self._parse_field(parts[0], 0, 59)
+        self.hours = self._parse_field(parts[1], 0, 23)
+        self.days = self._parse_field(parts[2], 1, 31)
+        self.months = self._parse_field(parts[3], 1, 12)
+        weekdays = self._parse_field(parts[4], 0, 7)
+        # cron counts from Sunday = 0 (and 7), datetime.weekday() from Monday = 0
+        self.weekdays = frozenset((day - 1) % 7 for day in weekdays)
+        self.any_day = parts[2] == '*'
+        self.any_weekday = parts[4] == '*'
+
+    @staticmethod
+    def _parse_field(text: str, low: int, high: int) -> frozenset:
+        """Parse one field into the set of matching values."""
+        values = set()
+        for item in text.split(','):
+            step = 1
+            if '/' in item:
+                item, step_text = item.split('/', 1)
+                step = int(step_text)
+                if step < 1:
+                    raise ValueError(f"Invalid cron step: '{text}'")
+            if item == '*':
+                start, stop = low, high
+            elif '-' in item:
+                start, stop = (int(value) for value in item.split('-', 1))
+            else:
+                start = int(item)
+                stop = high if step > 1 else start
+            if not low <= start <= stop <= high:
+                raise ValueError(f"Cron field '{text}' out of range {low}-{high}")
+            values.update(range(start, stop + 1, step))
+        return frozenset(values)
+
+    def _day_matches(self, day: datetime) -> bool:
+        """Check the day-of-month / day-of-week fields."""
+        in_month = day.day in self.days
+        in_week = day.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, after: datetime) -> datetime:
+        """
+        Get the first matching minute strictly after a time.
+
+        Skips whole months, days and hours that cannot match, so the search
+        takes at most a few hundred steps.
+
+        Args:
+            after: Reference time
+
+        Returns:
+            Next matching time (seconds = 0)
+
+        Raises:
+            ValueError: If nothing matches within CRON_SEARCH_DAYS
+        """
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after + timedelta(days=CRON_SEARCH_DAYS)
+        while t <= limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron expression never matches: '{self.expression}'")
+
 
 @dataclass
 class ScheduledCharge:
-    """Scheduled charging session."""
-    start_time: Optional[datetime] = None  # When to start (None = disabled)
+    """Scheduled charging job."""
+    job_id: int = 0
+    start_time: Optional[datetime] = None  # First run (None = immediately)
     duration: Optional[int] = None  # Duration in seconds (None = unlimited)
     profile: Optional[str] = None  # Battery profile to use
     mode: Optional[str] = None  # Charging mode to use
-    enabled: bool = False  # Is schedule active
+    ah_target: Optional[float] = None  # Stop after this many Ah (None = unlimited)
+    cron: Optional[str] = None  # Recurring: cron expression
+    every_days: Optional[float] = None  # Recurring: interval in days
+    enabled: bool = False  # Is job queued
+    next_run: Optional[datetime] = None  # Next due time
+    last_run: Optional[datetime] = None
+    runs: int = 0
+    _cron_spec: Optional[CronSpec] = field(default=None, repr=False)
+
+    @property
+    def kind(self) -> str:
+        """'cron', 'every' or 'once'."""
+        if self.cron:
+            return 'cron'
+        if self.every_days:
+            return 'every'
+        return 'once'
 
 
 class ChargeScheduler:
@@ -28,159 +171,342 @@ class ChargeScheduler:
 
     def __init__(self):
         """Initialize charge scheduler."""
-        self.schedule = ScheduledCharge()
+        self.jobs: Dict[int, ScheduledCharge] = {}
         self.on_start_callback: Optional[Callable] = None
         self.on_stop_callback: Optional[Callable] = None
         self.on_profile_callback: Optional[Callable[[str], None]] = None
-        self.charge_started = False
+        self.on_mode_callback: Optional[Callable[[str], None]] = None
+
+        # (due timestamp, sequence, job id) - sequence keeps equal times FIFO
+        self._heap: List[Tuple[float, int, int]] = []
+        self._sequence = itertools.count()
+        self._next_id = itertools.count(1)
+
+        # Active scheduled run
+        self.active_job: Optional[ScheduledCharge] = None
         self.charge_start_time: Optional[datetime] = None
+        self._stop_at: Optional[float] = None
+
+    @property
+    def charge_started(self) -> bool:
+        """Check if a scheduled run is in progress."""
+        return self.active_job is not None
 
     def set_callbacks(
         self,
         on_start: Optional[Callable] = None,
         on_stop: Optional[Callable] = None,
-        on_profile: Optional[Callable[[str], None]] = None
+        on_profile: Optional[Callable[[str], None]] = None,
+        on_mode: Optional[Callable[[str], None]] = None
     ):
         """
         Set callbacks for scheduler actions.
 
+        Callbacks run synchronously on the thread calling update(); a
+        callback returning False counts as failed.
+
         Args:
             on_start: Callback to start charging
             on_stop: Callback to stop charging
             on_profile: Callback to change battery profile
+            on_mode: Callback to change charging mode
         """
         self.on_start_callback = on_start
         self.on_stop_callback = on_stop
         self.on_profile_callback = on_profile
+        self.on_mode_callback = on_mode
 
-    def schedule_charge(
+    def add_job(
         self,
         start_time: Optional[datetime] = None,
         duration: Optional[int] = None,
         profile: Optional[str] = None,
-        mode: Optional[str] = None
-    ):
+        mode: Optional[str] = None,
+        ah_target: Optional[float] = None,
+        cron: Optional[str] = None,
+        every_days: Optional[float] = None
+    ) -> int:
         """
-        Schedule a charging session.
+        Queue a charging job.
 
         Args:
-            start_time: When to start (None = start immediately)
+            start_time: First run (None = now; for cron jobs: earliest
+                match at or after this time)
             duration: How long to charge in seconds (None = until complete)
             profile: Battery profile to use
             mode: Charging mode to use
+            ah_target: Stop after this many Ah delivered
+            cron: Cron expression for a recurring job
+            every_days: Repeat interval in days for a recurring job
+
+        Returns:
+            Job id
+
+        Raises:
+            ValueError: If the recurrence is invalid
         """
-        self.schedule = ScheduledCharge(
+        if cron and every_days:
+            raise ValueError("Use either cron or every_days, not both")
+        if every_days is not None and every_days <= 0:
+            raise ValueError(f"every_days must be positive, got {every_days}")
+        if ah_target is not None and ah_target <= 0:
+            raise ValueError(f"ah_target must be positive, got {ah_target}")
+
+        job = ScheduledCharge(
+            job_id=next(self._next_id),
             start_time=start_time,
             duration=duration,
             profile=profile,
             mode=mode,
+            ah_target=ah_target,
+            cron=cron,
+            every_days=every_days,
             enabled=True
         )
-
-        if start_time:
-            logger.info(f"Charging scheduled for {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
-            if duration:
-                logger.info(f"Duration: {duration}s ({duration/3600:.1f}h)")
+        now = datetime.now()
+        if cron:
+            job._cron_spec = CronSpec(cron)
+            reference = max(now, start_time - timedelta(minutes=1)) if start_time else now
+            job.next_run = job._cron_spec.next_after(reference)
         else:
-            logger.info("Charging scheduled to start immediately")
+            job.next_run = start_time or now
+
+        self.jobs[job.job_id] = job
+        self._push(job)
+
+        repeat = ''
+        if cron:
+            repeat = f", cron '{cron}'"
+        elif every_days:
+            repeat = f", every {every_days:g} days"
+        logger.info(
+            f"Charge job #{job.job_id} scheduled for {job.next_run.strftime('%Y-%m-%d %H:%M:%S')}{repeat}"
+            f" (duration={f'{duration}s' if duration else 'unlimited'}"
+            f", ah_target={f'{ah_target:g}Ah' if ah_target else 'none'}"
+            f", profile={profile or 'current'}, mode={mode or 'current'})"
+        )
+        return job.job_id
+
+    def schedule_charge(
+        self,
+        start_time: Optional[datetime] = None,
+        duration: Optional[int] = None,
+        profile: Optional[str] = None,
+        mode: Optional[str] = None
+    ) -> int:
+        """
+        Schedule a one-shot charging session (see add_job).
+
+        Args:
+            start_time: When to start (None = start immediately)
+            duration: How long to charge in seconds (None = until complete)
+            profile: Battery profile to use
+            mode: Charging mode to use
+
+        Returns:
+            Job id
+        """
+        return self.add_job(start_time=start_time, duration=duration, profile=profile, mode=mode)
+
+    def cancel_schedule(self, job_id: Optional[int] = None) -> bool:
+        """
+        Cancel one job or all jobs.
 
-        if profile:
-            logger.info(f"Profile: {profile}")
-        if mode:
-            logger.info(f"Mode: {mode}")
+        A charge already started by the job keeps running without its
+        duration/Ah limit.
+
+        Args:
+            job_id: Job to cancel (None = all)
 
-    def cancel_schedule(self):
-        """Cancel scheduled charging."""
-        self.schedule.enabled = False
-        logger.info("Charging schedule cancelled")
+        Returns:
+            False if the job does not exist
+        """
+        if job_id is None:
+            for job in self.jobs.values():
+                job.enabled = False
+            self.jobs.clear()
+            self._heap.clear()
+            self._end_run()
+            logger.info("Charging schedule cancelled (all jobs)")
+            return True
+
+        job = self.jobs.pop(job_id, None)
+        active = self.active_job is not None and self.active_job.job_id == job_id
+        if job is None and not active:
+            logger.warning(f"No scheduled charge job #{job_id}")
+            return False
+        if job:
+            job.enabled = False  # Heap entry is dropped when it reaches the head
+        if active:
+            self._end_run()
+        logger.info(f"Charging schedule cancelled (job #{job_id})")
+        return True
 
     def is_scheduled(self) -> bool:
         """Check if charging is scheduled."""
-        return self.schedule.enabled
+        return bool(self.jobs)
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        Get the next time the scheduler has something to do.
+
+        Returns:
+            Unix timestamp of the next job start or duration stop, or None
+            if nothing is pending (Ah targets are checked every update)
+        """
+        heap = self._heap
+        while heap and not self._is_current(heap[0]):
+            heapq.heappop(heap)
+        deadline = heap[0][0] if heap else None
+        if self._stop_at is not None and (deadline is None or self._stop_at < deadline):
+            deadline = self._stop_at
+        return deadline
 
     def get_schedule_info(self) -> dict:
         """
         Get schedule information.
 
         Returns:
-            Dictionary with schedule details
+            Dictionary with schedule details (jobs sorted by next run)
         """
-        if not self.schedule.enabled:
+        if not self.jobs and not self.active_job:
             return {'enabled': False}
 
-        info = {
-            'enabled': True,
-            'start_time': self.schedule.start_time.isoformat() if self.schedule.start_time else 'immediate',
-            'duration': self.schedule.duration,
-            'profile': self.schedule.profile,
-            'mode': self.schedule.mode
-        }
-
-        # Calculate time until start
-        if self.schedule.start_time:
-            now = datetime.now()
-            if self.schedule.start_time > now:
-                time_until = (self.schedule.start_time - now).total_seconds()
-                info['time_until_start'] = int(time_until)
-            else:
-                info['time_until_start'] = 0
-
-        # Calculate time remaining
-        if self.charge_started and self.schedule.duration:
-            elapsed = (datetime.now() - self.charge_start_time).total_seconds()
-            remaining = self.schedule.duration - elapsed
-            info['time_remaining'] = max(0, int(remaining))
-
+        now = datetime.now()
+        jobs = []
+        for job in sorted(self.jobs.values(), key=lambda job: job.next_run):
+            jobs.append({
+                'id': job.job_id,
+                'kind': job.kind,
+                'next_run': job.next_run.isoformat(timespec='seconds'),
+                'time_until_start': max(0, int((job.next_run - now).total_seconds())),
+                'duration': job.duration,
+                'ah_target': job.ah_target,
+                'profile': job.profile,
+                'mode': job.mode,
+                'cron': job.cron,
+                'every_days': job.every_days,
+                'runs': job.runs,
+            })
+        info = {'enabled': bool(self.jobs), 'jobs': jobs, 'active_job': None}
+
+        if self.active_job:
+            info['active_job'] = self.active_job.job_id
+            if self.active_job.duration:
+                elapsed = (now - self.charge_start_time).total_seconds()
+                info['time_remaining'] = max(0, int(self.active_job.duration - elapsed))
+
+        deadline = self.next_deadline()
+        if deadline is not None:
+            info['next_deadline'] = datetime.fromtimestamp(deadline).isoformat(timespec='seconds')
         return info
 
-    def update(self):
+    def update(self, now: Optional[datetime] = None, charging: Optional[bool] = None,
+               ah_delivered: Optional[float] = None):
         """
         Update scheduler (call this periodically).
 
-        Checks if scheduled charge should start or stop.
+        Stops the active run when its duration or Ah target is reached,
+        then starts the first due job. Never sleeps: a profile or mode
+        switch is applied through its callback and the charge is started
+        right after it in the same call.
+
+        Args:
+            now: Current time (default: datetime.now())
+            charging: Charger state - a run ends when charging stops on its
+                own (complete, safety stop, manual stop), and due jobs
+                wait while the charger is busy
+            ah_delivered: Ah delivered in the current session (for Ah
+                targets)
         """
-        if not self.schedule.enabled:
+        now = now or datetime.now()
+        timestamp = now.timestamp()
+
+        job = self.active_job
+        if job:
+            if charging is False:
+                logger.info(f"Scheduled charge job #{job.job_id} finished")
+                self._end_run()
+            elif self._stop_at is not None and timestamp >= self._stop_at:
+                elapsed = (now - self.charge_start_time).total_seconds()
+                self._stop_run(f"duration reached ({elapsed:.0f}s)")
+            elif job.ah_target and ah_delivered is not None and ah_delivered >= job.ah_target:
+                self._stop_run(f"Ah target reached ({ah_delivered:.2f}/{job.ah_target:g}Ah)")
+
+        heap = self._heap
+        while heap and heap[0][0] <= timestamp:
+            entry = heapq.heappop(heap)
+            if not self._is_current(entry):
+                continue
+            job = self.jobs[entry[2]]
+            if self.active_job or charging:
+                logger.info(f"Scheduled charge job #{job.job_id} due but charger is busy - retrying")
+                heapq.heappush(heap, (timestamp + BUSY_RETRY_INTERVAL, next(self._sequence), job.job_id))
+                continue
+            self._start_run(job, now)
+
+    def _push(self, job: ScheduledCharge):
+        """Queue the job's next run."""
+        heapq.heappush(self._heap, (job.next_run.timestamp(), next(self._sequence), job.job_id))
+
+    def _is_current(self, entry: Tuple[float, int, int]) -> bool:
+        """Check that a heap entry belongs to a queued job (lazy deletion)."""
+        job = self.jobs.get(entry[2])
+        return job is not None and job.enabled
+
+    def _start_run(self, job: ScheduledCharge, now: datetime):
+        """Start a due job and queue its next occurrence."""
+        logger.info(f"Starting scheduled charge job #{job.job_id}")
+        job.runs += 1
+        job.last_run = now
+        self._reschedule(job, now)
+
+        if job.profile and self.on_profile_callback:
+            logger.info(f"Switching to profile: {job.profile}")
+            if self.on_profile_callback(job.profile) is False:
+                logger.error(f"Scheduled charge job #{job.job_id} skipped - profile switch failed")
+                return
+        if job.mode and self.on_mode_callback:
+            if self.on_mode_callback(job.mode) is False:
+                logger.error(f"Scheduled charge job #{job.job_id} skipped - mode switch failed")
+                return
+
+        if not self.on_start_callback or self.on_start_callback() is False:
+            logger.error(f"Scheduled charge job #{job.job_id} failed to start")
             return
-
-        now = datetime.now()
-
-        # Check if it's time to start
-        if not self.charge_started:
-            should_start = False
-
-            if self.schedule.start_time is None:
-                # Start immediately
-                should_start = True
-            elif self.schedule.start_time <= now:
-                # Start time reached
-                should_start = True
-
-            if should_start:
-                logger.info("Starting scheduled charge")
-
-                # Switch profile if specified
-                if self.schedule.profile and self.on_profile_callback:
-                    logger.info(f"Switching to profile: {self.schedule.profile}")
-                    self.on_profile_callback(self.schedule.profile)
-                    time.sleep(1)  # Give it time to switch
-
-                # Start charging
-                if self.on_start_callback:
-                    self.on_start_callback()
-                    self.charge_started = True
-                    self.charge_start_time = now
-
-        # Check if it's time to stop (duration limit)
-        elif self.schedule.duration:
-            elapsed = (now - self.charge_start_time).total_seconds()
-            if elapsed >= self.schedule.duration:
-                logger.info(f"Scheduled charge duration reached ({elapsed:.0f}s)")
-                if self.on_stop_callback:
-                    self.on_stop_callback()
-
-                # Disable schedule (one-time)
-                self.schedule.enabled = False
-                self.charge_started = False
+        self.active_job = job
+        self.charge_start_time = now
+        self._stop_at = now.timestamp() + job.duration if job.duration else None
+
+    def _reschedule(self, job: ScheduledCharge, now: datetime):
+        """Queue a recurring job's next occurrence or retire a one-shot job."""
+        if job.kind == 'once':
+            job.enabled = False
+            self.jobs.pop(job.job_id, None)
+            return
+        if job.kind == 'cron':
+            job.next_run = job._cron_spec.next_after(now)
+        else:
+            interval = timedelta(days=job.every_days)
+            next_run = job.next_run + interval
+            while next_run <= now:  # Missed occurrences are not made up
+                next_run += interval
+            job.next_run = next_run
+        self._push(job)
+        logger.info(f"Charge job #{job.job_id} next run: {job.next_run.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    def _stop_run(self, reason: str):
+        """Stop the active run."""
+        logger.info(f"Scheduled charge job #{self.active_job.job_id}: {reason} - stopping")
+        if self.on_stop_callback:
+            self.on_stop_callback()
+        self._end_run()
+
+    def _end_run(self):
+        """Forget the active run."""
+        self.active_job = None
+        self.charge_start_time = None
+        self._stop_at = None
 
     def parse_duration(self, duration_str: str) -> Optional[int]:
         """
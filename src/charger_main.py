@@ -8,10 +8,10 @@ import sys
 import os
 import signal
 import time
+import threading
 import logging
 import argparse
 import yaml
-import csv
 import atexit
 from pathlib import Path
 from datetime import datetime
@@ -21,13 +21,25 @@ from typing import Optional
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from owon_psu import OwonPSU
-from charging_modes import create_charging_mode, ChargingMode
-from safety_monitor import SafetyMonitor, SafetyLimits
+from charging_modes import create_charging_mode, ChargingMode, MODE_NAMES
+from safety_monitor import (
+    SafetyMonitor, SafetyLimits,
+    DEFAULT_VIOLATION_HISTORY, DEFAULT_PLATEAU_MAX_SAMPLES
+)
 from mqtt_client import ChargerMQTTClient
+from mqtt_gateway import MQTTGateway
+from waveform_stream import WaveformStreamer
+from ha_discovery import HADiscovery
 from battery_profiles import BatteryProfileManager
 from charge_scheduler import ChargeScheduler
 from error_recovery import ErrorRecoveryManager
 from battery_history import BatteryHistoryTracker
+from charge_curve import CurveRecorder
+from battery_health import BatteryHealthEngine
+from anomaly_detector import AnomalyDetector
+from measurement_filter import MeasurementFilter
+from session_logger import SessionLogger, create_session_sink
+from log_retention import LogRetentionManager
 
 logger = logging.getLogger(__name__)
 
@@ -39,35 +51,49 @@ except ImportError:
     TEMPERATURE_AVAILABLE = False
     # Note: Will log warning during initialization if needed
 
+# Temperature change (°C) that produces a session log event
+TEMPERATURE_EVENT_DELTA = 0.5
+
 
 class BatteryCharger:
     """Main battery charger application."""
 
-    def __init__(self, config_path: str):
+    def __init__(self, config_path: str, channel: Optional[str] = None,
+                 mqtt_gateway: Optional[MQTTGateway] = None):
         """
         Initialize battery charger.
 
         Args:
             config_path: Path to configuration YAML file
+            channel: Gateway channel name (several chargers per process)
+            mqtt_gateway: Shared MQTT connection for gateway channels
         """
         self.config_path = config_path  # Store for profile switching
         self.config = self._load_config(config_path)
+        self.channel = channel
+        self.mqtt_gateway = mqtt_gateway
         self.psu: Optional[OwonPSU] = None
         self.charging_mode: Optional[ChargingMode] = None
         self.safety_monitor: Optional[SafetyMonitor] = None
         self.mqtt_client: Optional[ChargerMQTTClient] = None
+        self.waveform_streamer: Optional[WaveformStreamer] = None
         self.battery_profile_manager: Optional[BatteryProfileManager] = None
         self.charge_scheduler: Optional[ChargeScheduler] = None
         self.error_recovery: Optional[ErrorRecoveryManager] = None
         self.battery_history: Optional[BatteryHistoryTracker] = None
+        self.health_engine: Optional[BatteryHealthEngine] = None
         self.temperature_monitor = None
+        self.anomaly_detector: Optional[AnomalyDetector] = None
         self.running = False
         self.charging = False
-        self.csv_file = None
-        self.csv_writer = None
+        self.session_logger: Optional[SessionLogger] = None
+        self._event_state: dict = {}  # Last stage/safety/temperature written as log events
+        self.log_retention: Optional[LogRetentionManager] = None
         self._shutdown_called = False  # Prevent double-shutdown
         self._charge_start_voltage = 0.0  # Track for history
         self._charge_start_time = 0.0  # Track for history
+        self._charge_first_vi: Optional[tuple] = None  # (V, A) right after output on - resistance sample
+        self.curve_recorder = CurveRecorder()  # Downsampled V/I/T curve for history
 
         # Set up signal handlers
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -88,6 +114,8 @@ class BatteryCharger:
         """Handle shutdown signals."""
         logger.info(f"Received signal {signum}, shutting down...")
         self.running = False
+        if self.session_logger:
+            self.session_logger.request_flush()
 
     def initialize(self) -> bool:
         """
@@ -110,40 +138,8 @@ class BatteryCharger:
             return False
 
         # Initialize safety monitor
-        safety_config = self.config.get('safety', {})
-        plateau_config = safety_config.get('plateau_detection', {})
-
-        limits = SafetyLimits(
-            absolute_max_voltage=safety_config.get('absolute_max_voltage', 16.0),
-            absolute_max_current=safety_config.get('absolute_max_current', 5.0),
-            min_voltage=safety_config.get('min_voltage', 10.5),
-            warning_voltage=safety_config.get('warning_voltage', 12.5),
-            max_charging_duration=safety_config.get('max_charging_duration', 43200),
-            max_temperature=safety_config.get('max_temperature'),
-            min_temperature=safety_config.get('min_temperature'),
-            # Plateau detection settings
-            plateau_enabled=plateau_config.get('enabled', True),
-            plateau_threshold_voltage=plateau_config.get('threshold_voltage', 16.0),
-            plateau_time_window=plateau_config.get('time_window', 900),
-            plateau_voltage_delta=plateau_config.get('voltage_delta', 0.05),
-            # Energy accounting
-            charging_efficiency=safety_config.get('charging_efficiency', 0.83)
-        )
-        self.safety_monitor = SafetyMonitor(limits)
-
-        # Log plateau detection status (now configured via SafetyLimits)
-        if limits.plateau_enabled:
-            logger.info(
-                f"Voltage plateau detection enabled: "
-                f"threshold={limits.plateau_threshold_voltage}V, "
-                f"window={limits.plateau_time_window}s, "
-                f"delta={limits.plateau_voltage_delta}V"
-            )
-        else:
-            logger.info("Voltage plateau detection disabled")
-
-        # Log charging efficiency (now configured via SafetyLimits)
-        logger.info(f"Charging efficiency: {limits.charging_efficiency:.1%} (factor: {1/limits.charging_efficiency:.2f})")
+        if not self._create_safety_monitor():
+            return False
 
         # Initialize temperature sensor if available and enabled
         if TEMPERATURE_AVAILABLE:
@@ -165,6 +161,18 @@ class BatteryCharger:
             else:
                 logger.info("Temperature monitoring disabled in configuration")
 
+        # Initialize anomaly detector
+        anomaly_config = self.config.get('anomaly_detection', {})
+        if anomaly_config.get('enabled', True):
+            try:
+                self.anomaly_detector = AnomalyDetector(anomaly_config)
+                logger.info("Anomaly detection enabled")
+            except ValueError as e:
+                logger.error(f"Invalid anomaly detection configuration: {e}")
+                return False
+        else:
+            logger.info("Anomaly detection disabled in configuration")
+
         # Initialize battery profile manager
         config_dir = os.path.dirname(self.config_path) or 'config'
         self.battery_profile_manager = BatteryProfileManager(config_dir)
@@ -176,7 +184,8 @@ class BatteryCharger:
         self.charge_scheduler.set_callbacks(
             on_start=self._cmd_start,
             on_stop=self._cmd_stop,
-            on_profile=self._cmd_change_profile
+            on_profile=self._cmd_change_profile,
+            on_mode=self._cmd_change_mode
         )
         logger.info("Charge scheduler initialized")
 
@@ -185,45 +194,155 @@ class BatteryCharger:
         logger.info("Error recovery manager initialized")
 
         # Initialize battery history tracker
-        history_file = "battery_history.json"
+        history_file = f"battery_history_{self.channel}.db" if self.channel else "battery_history.db"
         self.battery_history = BatteryHistoryTracker(history_file)
         logger.info(f"Battery history tracker initialized ({history_file})")
+        self.health_engine = BatteryHealthEngine(
+            self.battery_history,
+            self.config.get('battery', {}),
+            self.config.get('health', {}),
+            charging_efficiency=self.config.get('safety', {}).get('charging_efficiency', 0.83)
+        )
 
-        # Initialize MQTT if enabled
+        # Session log retention (compresses/deletes old logs in the background)
+        self._get_log_retention()
+
+        # Initialize MQTT if enabled (gateway channels always use the shared connection)
         mqtt_config = self.config.get('mqtt', {})
-        if mqtt_config.get('enabled', False):
+        if self.mqtt_gateway:
+            self.mqtt_client = self.mqtt_gateway.add_channel(self.channel, mqtt_config)
+        elif mqtt_config.get('enabled', False):
             self.mqtt_client = ChargerMQTTClient(mqtt_config)
+
+        if self.mqtt_client:
+            # Set up command callbacks
+            self.mqtt_client.set_command_callbacks(
+                on_start=self._cmd_start,
+                on_stop=self._cmd_stop,
+                on_mode=self._cmd_change_mode,
+                on_current=self._cmd_change_current,
+                on_profile=self._cmd_change_profile,
+                on_schedule=self._cmd_schedule,
+                on_schedule_cancel=self._cmd_schedule_cancel,
+                on_stream=self._cmd_stream
+            )
+
+            # Opt-in waveform stream (idle until cmd/stream)
+            self.waveform_streamer = WaveformStreamer(
+                self.psu, self.mqtt_client.publish_stream_frame, mqtt_config.get('stream', {}),
+                on_state=self.mqtt_client.publish_stream_state
+            )
+
+            # Home Assistant discovery (built once, retained)
+            self._create_ha_discovery()
+
+            # Non-blocking: the client keeps (re)connecting in the background
+            # and spools status samples until the broker is reachable
             if not self.mqtt_client.connect():
-                logger.warning("Failed to connect to MQTT broker (continuing without MQTT)")
-                self.mqtt_client = None
-            else:
-                # Set up command callbacks
-                self.mqtt_client.set_command_callbacks(
-                    on_start=self._cmd_start,
-                    on_stop=self._cmd_stop,
-                    on_mode=self._cmd_change_mode,
-                    on_current=self._cmd_change_current,
-                    on_profile=self._cmd_change_profile,
-                    on_schedule=self._cmd_schedule,
-                    on_schedule_cancel=self._cmd_schedule_cancel
-                )
+                logger.warning("MQTT connection could not be started (will retry)")
 
         logger.info("Initialization complete")
         return True
 
-    def _cmd_start(self):
-        """Handle MQTT start command."""
+    def _create_safety_monitor(self) -> bool:
+        """
+        Create safety monitor from the active configuration.
+
+        Compiles the profile's safety rules; called at startup and whenever
+        the battery profile changes.
+
+        Returns:
+            True if successful
+        """
+        safety_config = self.config.get('safety', {})
+        plateau_config = safety_config.get('plateau_detection', {})
+
+        limits = SafetyLimits(
+            absolute_max_voltage=safety_config.get('absolute_max_voltage', 16.0),
+            absolute_max_current=safety_config.get('absolute_max_current', 5.0),
+            min_voltage=safety_config.get('min_voltage', 10.5),
+            warning_voltage=safety_config.get('warning_voltage', 12.5),
+            max_charging_duration=safety_config.get('max_charging_duration', 43200),
+            max_temperature=safety_config.get('max_temperature'),
+            min_temperature=safety_config.get('min_temperature'),
+            # Plateau detection settings
+            plateau_enabled=plateau_config.get('enabled', True),
+            plateau_threshold_voltage=plateau_config.get('threshold_voltage', 16.0),
+            plateau_time_window=plateau_config.get('time_window', 900),
+            plateau_voltage_delta=plateau_config.get('voltage_delta', 0.05),
+            # Energy accounting
+            charging_efficiency=safety_config.get('charging_efficiency', 0.83),
+            # Buffer capacities
+            violation_history_size=safety_config.get('violation_history_size', DEFAULT_VIOLATION_HISTORY),
+            plateau_max_samples=plateau_config.get('max_samples', DEFAULT_PLATEAU_MAX_SAMPLES),
+            # Profile-specific declarative rules
+            rules=safety_config.get('rules') or []
+        )
+
+        try:
+            self.safety_monitor = SafetyMonitor(limits)
+        except ValueError as e:
+            logger.error(f"Invalid safety rule configuration: {e}")
+            return False
+
+        # Log plateau detection status (now configured via SafetyLimits)
+        if limits.plateau_enabled:
+            logger.info(
+                f"Voltage plateau detection enabled: "
+                f"threshold={limits.plateau_threshold_voltage}V, "
+                f"window={limits.plateau_time_window}s, "
+                f"delta={limits.plateau_voltage_delta}V"
+            )
+        else:
+            logger.info("Voltage plateau detection disabled")
+
+        # Log charging efficiency (now configured via SafetyLimits)
+        logger.info(f"Charging efficiency: {limits.charging_efficiency:.1%} (factor: {1/limits.charging_efficiency:.2f})")
+
+        return True
+
+    def _create_ha_discovery(self):
+        """Build Home Assistant discovery configs for the current profile."""
+        mqtt_config = self.config.get('mqtt', {})
+        ha_config = mqtt_config.get('ha_discovery', {})
+        if not self.mqtt_client or not ha_config.get('enabled', True):
+            return
+
+        base_topic = mqtt_config.get('base_topic', 'battery-charger')
+        availability_topic = mqtt_config.get('lwt_topic', f'{base_topic}/status/online')
+        gateway_topic = None
+        if self.mqtt_gateway:
+            availability_topic = f'{self.mqtt_client.base_topic}/status/online'
+            gateway_topic = self.mqtt_gateway.config['lwt_topic']
+            ha_config = dict(ha_config)
+            ha_config.setdefault('device_name', f'Battery Charger ({self.channel})')
+
+        discovery = HADiscovery(
+            self.mqtt_client.base_topic,
+            ha_config,
+            availability_topic=availability_topic,
+            modes=MODE_NAMES,
+            profiles=self.battery_profile_manager.list_profiles() if self.battery_profile_manager else (),
+            max_current=self.config.get('power_supply', {}).get('max_current', 20.0),
+            gateway_availability_topic=gateway_topic
+        )
+        self.mqtt_client.set_ha_discovery(discovery)
+
+    def _cmd_start(self) -> bool:
+        """Handle MQTT start command (True if charging afterwards)."""
         if not self.charging:
             logger.info("Starting charging via MQTT command")
-            self.start_charging()
+            return self.start_charging()
+        return True
 
-    def _cmd_stop(self):
+    def _cmd_stop(self) -> bool:
         """Handle MQTT stop command."""
         if self.charging:
             logger.info("Stopping charging via MQTT command")
             self.stop_charging()
+        return True
 
-    def _cmd_change_mode(self, mode_name: str):
+    def _cmd_change_mode(self, mode_name: str) -> bool:
         """Handle MQTT mode change command."""
         logger.info(f"Mode change requested to: {mode_name}")
         # Stop current charging if active
@@ -234,51 +353,78 @@ class BatteryCharger:
         try:
             charging_config = self.config.get('charging', {})
             mode_config = charging_config.get(mode_name, {})
-            self.charging_mode = create_charging_mode(mode_name, self.psu, mode_config)
+            self.charging_mode = create_charging_mode(
+                mode_name, self.psu, mode_config,
+                measurement_filter=MeasurementFilter(self.config.get('filtering', {}))
+            )
             logger.info(f"Switched to {mode_name} mode")
+            return True
         except Exception as e:
             logger.error(f"Failed to change mode: {e}")
+            return False
 
-    def _cmd_change_current(self, current: float):
+    def _cmd_change_current(self, current: float) -> bool:
         """Handle MQTT current change command."""
         logger.info(f"Current change requested to: {current}A")
         # Update current in active mode if charging
         if self.charging and self.psu:
             try:
-                self.psu.set_current(current)
+                # A manual limit replaces an anomaly derate
+                self._clear_derate('manual current command', restore=False)
+                if self.charging_mode:
+                    self.charging_mode.set_current_limit(current)
+                else:
+                    self.psu.set_current(current)
                 logger.info(f"Current set to {current}A")
+                return True
             except Exception as e:
                 logger.error(f"Failed to set current: {e}")
+                return False
+        logger.warning("Not charging - current change ignored")
+        return False
 
-    def _cmd_change_profile(self, profile_name: str):
+    def _cmd_change_profile(self, profile_name: str) -> bool:
         """Handle MQTT battery profile change command."""
         logger.info(f"Battery profile change requested to: {profile_name}")
 
         # Cannot change profile while charging
         if self.charging:
             logger.error("Cannot change battery profile while charging! Stop charging first.")
-            return
+            return False
 
         # Check if profile exists
         if not self.battery_profile_manager.profile_exists(profile_name):
             available = self.battery_profile_manager.list_profiles()
             logger.error(f"Profile '{profile_name}' not found. Available: {', '.join(available)}")
-            return
+            return False
 
         # Load new profile
         try:
             new_config = self.battery_profile_manager.load_profile(profile_name)
             if not new_config:
                 logger.error(f"Failed to load profile: {profile_name}")
-                return
+                return False
 
             # Update configuration
+            old_config = self.config
             self.config = new_config
+
+            # Rebuild safety limits and rules for the new profile
+            if not self._create_safety_monitor():
+                logger.error(f"Keeping previous profile - safety configuration of '{profile_name}' is invalid")
+                self.config = old_config
+                self._create_safety_monitor()
+                return False
+
+            # Only a validated profile becomes the reported one
             self.config_path = str(self.battery_profile_manager.get_profile_path(profile_name))
 
             # Clear charging mode (will be recreated on next start)
             self.charging_mode = None
 
+            # Republish Home Assistant discovery only if it changed
+            self._create_ha_discovery()
+
             # Log profile info
             info = self.battery_profile_manager.get_profile_info(profile_name)
             if info:
@@ -291,11 +437,13 @@ class BatteryCharger:
                 )
             else:
                 logger.info(f"Switched to battery profile: {profile_name}")
+            return True
 
         except Exception as e:
             logger.error(f"Failed to change battery profile: {e}")
+            return False
 
-    def _cmd_schedule(self, schedule_params: dict):
+    def _cmd_schedule(self, schedule_params: dict) -> bool:
         """
         Handle MQTT schedule command.
 
@@ -305,49 +453,94 @@ class BatteryCharger:
                 - duration: Duration string ("1h", "30m", "3600")
                 - profile: Battery profile to use (optional)
                 - mode: Charging mode to use (optional)
+                - ah_target: Stop after this many Ah (optional)
+                - cron: Repeat on a cron expression ("0 2 * * 6", optional)
+                - every_days: Repeat every N days (optional)
         """
         if not self.charge_scheduler:
             logger.error("Charge scheduler not initialized")
-            return
+            return False
 
         try:
             # Parse start time
             start_time_str = schedule_params.get('start_time', 'now')
             start_time = self.charge_scheduler.parse_start_time(start_time_str)
+            if start_time is None and start_time_str.strip().lower() != 'now':
+                return False
 
             # Parse duration (optional)
             duration = None
             if 'duration' in schedule_params:
-                duration = self.charge_scheduler.parse_duration(schedule_params['duration'])
-
-            # Get profile and mode (optional)
-            profile = schedule_params.get('profile')
-            mode = schedule_params.get('mode')
+                duration = self.charge_scheduler.parse_duration(str(schedule_params['duration']))
+                if duration is None:
+                    return False
 
-            # Schedule the charge
-            self.charge_scheduler.schedule_charge(
+            # Queue the job (runs alongside previously scheduled jobs)
+            self.charge_scheduler.add_job(
                 start_time=start_time,
                 duration=duration,
-                profile=profile,
-                mode=mode
+                profile=schedule_params.get('profile'),
+                mode=schedule_params.get('mode'),
+                ah_target=schedule_params.get('ah_target'),
+                cron=schedule_params.get('cron'),
+                every_days=schedule_params.get('every_days')
             )
-
-            logger.info(f"Charging scheduled: start={start_time_str}, duration={schedule_params.get('duration', 'unlimited')}, profile={profile or 'current'}")
+            return True
 
         except Exception as e:
             logger.error(f"Failed to schedule charge: {e}")
+            return False
 
-    def _cmd_schedule_cancel(self):
-        """Handle MQTT schedule cancel command."""
+    def _cmd_schedule_cancel(self, job_id: Optional[int] = None) -> bool:
+        """Handle MQTT schedule cancel command (one job, or all without an id)."""
         if not self.charge_scheduler:
             logger.error("Charge scheduler not initialized")
-            return
+            return False
 
         try:
-            self.charge_scheduler.cancel_schedule()
-            logger.info("Scheduled charge cancelled")
+            return self.charge_scheduler.cancel_schedule(job_id)
         except Exception as e:
             logger.error(f"Failed to cancel schedule: {e}")
+            return False
+
+    def _cmd_stream(self, stream_params: dict) -> bool:
+        """
+        Handle MQTT waveform stream command.
+
+        Args:
+            stream_params: enabled, rate, frame_interval, timeout (all optional)
+        """
+        if not self.waveform_streamer:
+            logger.error("Waveform streamer not initialized")
+            return False
+
+        try:
+            state = self.waveform_streamer.configure(stream_params)
+            ok = True
+        except (ValueError, TypeError) as e:
+            logger.error(f"Invalid stream command: {e}")
+            state = self.waveform_streamer.get_status()
+            state['error'] = str(e)
+            ok = False
+        self.mqtt_client.publish_stream_state(state)
+        return ok
+
+    def _psu_state(self) -> dict:
+        """
+        Read back PSU state (command acknowledgement).
+
+        Returns:
+            Output state and setpoints as reported by the PSU
+        """
+        if not self.psu or not self.psu.is_connected():
+            return {'connected': False, 'charging': self.charging}
+        return {
+            'connected': True,
+            'charging': self.charging,
+            'output': self.psu.get_output(),
+            'voltage_set': self.psu.get_voltage(),
+            'current_set': self.psu.get_current()
+        }
 
     def start_charging(self) -> bool:
         """
@@ -366,23 +559,42 @@ class BatteryCharger:
                 charging_config = self.config.get('charging', {})
                 default_mode = charging_config.get('default_mode', 'IUoU')
                 mode_config = charging_config.get(default_mode, {})
-                self.charging_mode = create_charging_mode(default_mode, self.psu, mode_config)
+                self.charging_mode = create_charging_mode(
+                    default_mode, self.psu, mode_config,
+                    measurement_filter=MeasurementFilter(self.config.get('filtering', {}))
+                )
+
+            # Resting voltage before the output turns on (OCV for the
+            # depth-of-discharge estimate in the health fit)
+            if self.psu:
+                self._charge_start_voltage = self.psu.measure_voltage()
 
             # Start charging mode
             if not self.charging_mode.start():
                 logger.error("Failed to start charging mode")
                 return False
 
+            # First voltage/current under charge (charge-step resistance
+            # sample for the health fit), read once before any averaging
+            self._charge_first_vi = None
+            if self.psu:
+                try:
+                    self._charge_first_vi = self.psu.measure_output()
+                except Exception as e:
+                    logger.warning(f"Could not read first charge V/I: {e}")
+
             # Start safety monitoring
             self.safety_monitor.start_monitoring()
+            if self.anomaly_detector:
+                self.anomaly_detector.reset()
 
             # Open CSV log file
             self._open_log_file()
 
             # Record start conditions for history
             if self.psu:
-                self._charge_start_voltage = self.psu.measure_voltage()
                 self._charge_start_time = time.time()
+            self.curve_recorder.reset()
 
             self.charging = True
             logger.info("Charging started")
@@ -398,6 +610,9 @@ class BatteryCharger:
             return
 
         try:
+            # Derate lasts one session
+            self._clear_derate('session ended', restore=False)
+
             # Stop charging mode
             if self.charging_mode:
                 self.charging_mode.stop()
@@ -439,8 +654,16 @@ class BatteryCharger:
                         wh_delivered=wh_delivered,
                         duration=duration,
                         mode=mode,
-                        success=True
+                        success=True,
+                        curve=self.curve_recorder.downsample(),
+                        first_voltage=self._charge_first_vi[0] if self._charge_first_vi else None,
+                        first_current=self._charge_first_vi[1] if self._charge_first_vi else None
                     )
+
+                    # Refit capacity fade / resistance trend with this session
+                    health = self.health_engine.refit(battery_model)
+                    if health and self.mqtt_client:
+                        self.mqtt_client.publish_health(health)
                 except Exception as e:
                     logger.error(f"Failed to record battery history: {e}")
 
@@ -460,65 +683,195 @@ class BatteryCharger:
             # Create logs directory
             log_dir = Path(logging_config.get('log_dir', 'logs'))
             log_dir.mkdir(exist_ok=True)
+            retention = self._get_log_retention()
 
-            # Create CSV file with timestamp
+            # Create log file with timestamp (.csv, .jsonl or .bclog)
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            csv_path = log_dir / f'charge_{timestamp}.csv'
-
-            self.csv_file = open(csv_path, 'w', newline='')
-            self.csv_writer = csv.writer(self.csv_file)
+            prefix = f'charge_{self.channel}' if self.channel else 'charge'
+            sink_metadata = self._session_metadata()
+            sink = create_session_sink(
+                logging_config.get('format', 'csv'),
+                log_dir / f'{prefix}_{timestamp}',
+                logging_config.get('fields', []),
+                sink_metadata,
+                float_precision=logging_config.get('float_precision')
+            )
 
-            # Write header
-            fields = logging_config.get('fields', [])
-            self.csv_writer.writerow(fields)
+            # Rows are written by a background thread (batched, flushed on
+            # a time/size policy) so the control loop never waits on the card
+            self.session_logger = SessionLogger(sink, logging_config)
+            self.session_logger.start()
+            self._event_state = {}
+            if retention:
+                retention.session_opened(sink.path, sink_metadata)
 
-            logger.info(f"Logging to {csv_path}")
+            logger.info(f"Logging to {sink.path}")
 
+        except ValueError as e:
+            # Misconfigured fields would only produce empty columns
+            logger.error(f"Session logging disabled: {e}")
+            self.session_logger = None
         except Exception as e:
             logger.error(f"Failed to open log file: {e}")
-            self.csv_file = None
-            self.csv_writer = None
+            self.session_logger = None
+
+    def _get_log_retention(self) -> Optional[LogRetentionManager]:
+        """Get the retention manager for the configured log directory (created on first use)."""
+        logging_config = self.config.get('logging', {})
+        if not logging_config.get('enabled', False):
+            return None
+        log_dir = Path(logging_config.get('log_dir', 'logs'))
+        if self.log_retention and self.log_retention.log_dir == log_dir:
+            return self.log_retention
+
+        if self.log_retention:
+            self.log_retention.stop()
+        try:
+            prefix = f'charge_{self.channel}' if self.channel else 'charge'
+            self.log_retention = LogRetentionManager(log_dir, logging_config, prefix=prefix)
+            self.log_retention.start()
+        except OSError as e:
+            logger.error(f"Log retention disabled: {e}")
+            self.log_retention = None
+        return self.log_retention
+
+    def _session_metadata(self) -> dict:
+        """Describe the session for log headers (profile, mode, PSU)."""
+        battery_config = self.config.get('battery', {})
+        metadata = {
+            'profile': Path(self.config_path).stem,
+            'battery': battery_config.get('model', 'Unknown'),
+            'capacity_ah': battery_config.get('capacity'),
+            'mode': self.charging_mode.config.get('name') if self.charging_mode else None,
+            'channel': self.channel,
+            'psu': self.config.get('power_supply', {}).get('port'),
+        }
+        if self.psu:
+            try:
+                metadata['psu_identity'] = self.psu.identify()
+            except Exception as e:
+                logger.debug(f"PSU identity unavailable: {e}")
+        return metadata
 
     def _close_log_file(self):
-        """Close CSV log file."""
-        if self.csv_file:
+        """Close CSV log file (writes and syncs everything still queued)."""
+        if self.session_logger:
             try:
-                self.csv_file.close()
-                logger.info("Log file closed")
+                self.session_logger.close()
+                stats = self.session_logger.get_stats()
+                logger.info(f"Log file closed ({stats['written']} rows, {stats['dropped']} dropped)")
+                if self.log_retention:
+                    self.log_retention.session_closed(self.session_logger.path, stats)
             except Exception as e:
                 logger.error(f"Error closing log file: {e}")
             finally:
-                self.csv_file = None
-                self.csv_writer = None
+                self.session_logger = None
 
     def _log_data(self, status: dict):
         """
-        Log charging data to CSV.
+        Log charging data to CSV (queued, never blocks).
 
         Args:
             status: Status dictionary
         """
-        if not self.csv_writer:
-            return
+        if self.session_logger:
+            self.session_logger.log(status)
 
-        try:
-            logging_config = self.config.get('logging', {})
-            fields = logging_config.get('fields', [])
-
-            # Extract values for each field
-            row = []
-            for field in fields:
-                if field == 'timestamp':
-                    value = datetime.now().isoformat()
-                else:
-                    value = status.get(field, '')
-                row.append(value)
+    def _log_events(self, status: dict, safety_result: dict, temperature: Optional[float]):
+        """
+        Write stage transitions, safety warning changes and temperature
+        moves as session log events (JSON Lines logs; every tick, not just
+        every log_interval).
+
+        Args:
+            status: Status dictionary
+            safety_result: Result of SafetyMonitor.check_safety
+            temperature: Battery temperature (°C) or None
+        """
+        if not (self.session_logger and self.session_logger.sink_supports_events):
+            return
+        state = self._event_state
+
+        stage = status.get('stage', status.get('phase'))
+        if stage != state.get('stage'):
+            if 'stage' in state or stage is not None:
+                self.session_logger.log_event('stage', {
+                    'from': state.get('stage'),
+                    'to': stage,
+                    'voltage': status.get('voltage'),
+                    'current': status.get('current'),
+                    'ah_delivered': status.get('ah_delivered'),
+                })
+            state['stage'] = stage
+
+        safety = (tuple(safety_result['warnings']), tuple(safety_result['violations']))
+        if safety != state.get('safety', ((), ())):
+            self.session_logger.log_event('safety', {
+                'warnings': list(safety[0]),
+                'violations': list(safety[1]),
+                'should_stop': safety_result['should_stop'],
+            })
+        state['safety'] = safety
+
+        if temperature is not None:
+            last = state.get('temperature')
+            if last is None or abs(temperature - last) >= TEMPERATURE_EVENT_DELTA:
+                self.session_logger.log_event('temperature', {'celsius': round(temperature, 2)})
+                state['temperature'] = temperature
+
+    def _handle_anomalies(self, anomalies: list):
+        """
+        Publish anomaly events and apply their configured action.
 
-            self.csv_writer.writerow(row)
-            self.csv_file.flush()
+        Args:
+            anomalies: List of AnomalyEvent from the detector
+        """
+        for event in anomalies:
+            if self.mqtt_client:
+                self.mqtt_client.publish_event('anomaly', event.to_dict())
+            if self.session_logger:
+                self.session_logger.log_event('anomaly', event.to_dict())
+
+        actions = {event.action for event in anomalies}
+        if 'stop' in actions:
+            logger.error("Anomaly detected - stopping charging")
+            self.stop_charging()
+        elif 'derate' in actions and self.charging_mode:
+            if self.charging_mode.current_scale < 1.0:
+                logger.info("Anomaly detected - current already derated this session")
+                return
+            try:
+                factor = self.anomaly_detector.derate_factor
+                derated = self.charging_mode.set_derate(factor, self.anomaly_detector.derate_min_current)
+                nominal = self.charging_mode.nominal_current
+                logger.warning(
+                    f"Anomaly detected - derating current to {factor:.0%} for the rest of the session"
+                    + (f" ({nominal:.2f}A → {derated:.2f}A)" if derated is not None else "")
+                )
+                self._publish_derate({'active': True, 'factor': factor,
+                                      'nominal_current': nominal, 'current': derated})
+            except Exception as e:
+                logger.error(f"Failed to derate current: {e}")
 
+    def _clear_derate(self, reason: str, restore: bool = True):
+        """Remove an anomaly derate from the charging mode and report it."""
+        if not self.charging_mode or self.charging_mode.current_scale >= 1.0:
+            return
+        try:
+            self.charging_mode.clear_derate(restore=restore)
         except Exception as e:
-            logger.error(f"Failed to log data: {e}")
+            logger.error(f"Failed to restore current after derate: {e}")
+        logger.info(f"Current derate cleared ({reason})")
+        self._publish_derate({'active': False, 'reason': reason,
+                              'nominal_current': self.charging_mode.nominal_current})
+
+    def _publish_derate(self, event: dict):
+        """Publish a derate change to events/derate and the session log."""
+        event['timestamp'] = time.time()
+        if self.mqtt_client:
+            self.mqtt_client.publish_event('derate', event)
+        if self.session_logger:
+            self.session_logger.log_event('derate', event)
 
     def run(self):
         """Run main application loop."""
@@ -537,6 +890,7 @@ class BatteryCharger:
                 if self.charging and self.charging_mode:
                     # Update charging mode
                     status = self.charging_mode.update()
+                    status['current_setpoint'] = self.charging_mode.current_limit
 
                     # Read temperature if available
                     temperature = None
@@ -549,7 +903,24 @@ class BatteryCharger:
                     voltage = status.get('voltage', 0.0)
                     current = status.get('current', 0.0)
                     power = status.get('power', 0.0)
-                    safety_result = self.safety_monitor.check_safety(voltage, current, temperature)
+                    safety_result = self.safety_monitor.check_safety(voltage, current, temperature, power)
+
+                    # Control decisions use filtered values (glitch-tolerant);
+                    # hard safety limits above use the raw readings
+                    voltage_filtered = status.get('voltage_filtered', voltage)
+                    current_filtered = status.get('current_filtered', current)
+
+                    # Streaming anomaly detection (stage-aware residuals) on
+                    # filtered values, so a dropout is not a voltage step or
+                    # noise burst; skipped until the filter window is full
+                    if self.anomaly_detector and self.charging_mode.measurement_filter.ready:
+                        anomalies = self.anomaly_detector.update(
+                            voltage_filtered, current_filtered,
+                            mode=status.get('mode', ''),
+                            stage=status.get('stage', status.get('phase'))
+                        )
+                        if anomalies:
+                            self._handle_anomalies(anomalies)
 
                     # Update energy accounting (Coulomb counting)
                     energy_data = self.safety_monitor.update_energy_accounting(current, power)
@@ -559,8 +930,8 @@ class BatteryCharger:
                     status['progress'] = self.safety_monitor.estimate_progress(
                         mode=status.get('mode', ''),
                         stage=status.get('stage'),
-                        current=current,
-                        voltage=voltage,
+                        current=current_filtered,
+                        voltage=voltage_filtered,
                         target_voltage=status.get('absorption_voltage', 0.0),
                         absorption_current_threshold=status.get('absorption_current_threshold', 1.0)
                     )
@@ -569,7 +940,11 @@ class BatteryCharger:
                     if self.mqtt_client:
                         self.mqtt_client.publish_status(status)
 
-                    # Log to CSV periodically
+                    # Charge curve for history (bounded, downsampled at the end)
+                    self.curve_recorder.add(time.time() - self._charge_start_time, voltage, current, temperature)
+
+                    # Log to CSV periodically (events: as they happen)
+                    self._log_events(status, safety_result, temperature)
                     now = time.time()
                     if now - last_log_time >= log_interval:
                         self._log_data(status)
@@ -582,10 +957,10 @@ class BatteryCharger:
 
                     # Check for voltage plateau (flooded batteries above 16V)
                     # If voltage stops rising, battery is fully charged
-                    plateau_status = self.safety_monitor.check_voltage_plateau(voltage)
+                    plateau_status = self.safety_monitor.check_voltage_plateau(voltage_filtered)
                     if plateau_status['is_plateau']:
                         logger.info(
-                            f"Battery fully charged - voltage plateau detected at {voltage:.3f}V "
+                            f"Battery fully charged - voltage plateau detected at {voltage_filtered:.3f}V "
                             f"(rise {plateau_status['voltage_rise']:.3f}V over {plateau_status['time_at_high_voltage']/60:.1f} min)"
                         )
                         self.stop_charging()
@@ -593,7 +968,7 @@ class BatteryCharger:
                     # Check if charging complete
                     if self.safety_monitor.is_charging_complete(
                         mode=status.get('mode', ''),
-                        current=current,
+                        current=current_filtered,
                         state=status.get('state', ''),
                         min_current=status.get('min_current', 0.5)
                     ):
@@ -602,15 +977,28 @@ class BatteryCharger:
 
                 # Update charge scheduler (if enabled)
                 if self.charge_scheduler:
-                    self.charge_scheduler.update()
+                    self.charge_scheduler.update(
+                        charging=self.charging,
+                        ah_delivered=self.safety_monitor.ah_delivered if self.safety_monitor else None
+                    )
 
                 # Check connections and attempt recovery
                 if self.error_recovery:
                     self.error_recovery.check_psu_connection(self.psu, check_interval=10.0)
                     self.error_recovery.check_mqtt_connection(self.mqtt_client, check_interval=10.0)
 
-                # Sleep until next measurement
-                time.sleep(measurement_interval)
+                # Wait until next measurement (or the next scheduled start/
+                # stop if sooner), executing MQTT commands as they arrive
+                # (main thread - the control loop owns the PSU)
+                wait = measurement_interval
+                if self.charge_scheduler:
+                    deadline = self.charge_scheduler.next_deadline()
+                    if deadline is not None:
+                        wait = min(wait, max(0.0, deadline - time.time()))
+                if self.mqtt_client:
+                    self.mqtt_client.process_commands(wait, psu_state=self._psu_state)
+                else:
+                    time.sleep(wait)
 
             except KeyboardInterrupt:
                 logger.info("Keyboard interrupt received")
@@ -635,6 +1023,11 @@ class BatteryCharger:
         if self.charging:
             self.stop_charging()
 
+        # Session log must reach the card even if stop_charging failed
+        self._close_log_file()
+        if self.log_retention:
+            self.log_retention.stop()
+
         # CRITICAL: Ensure PSU output is OFF (safety!)
         if self.psu and self.psu.is_connected():
             try:
@@ -644,6 +1037,10 @@ class BatteryCharger:
             except Exception as e:
                 logger.error(f"Failed to disable PSU output: {e}")
 
+        # Stop waveform sampler before the PSU/MQTT go away
+        if self.waveform_streamer:
+            self.waveform_streamer.stop()
+
         # Disconnect MQTT
         if self.mqtt_client:
             self.mqtt_client.disconnect()
@@ -652,6 +1049,9 @@ class BatteryCharger:
         if self.psu:
             self.psu.disconnect()
 
+        if self.battery_history:
+            self.battery_history.close()
+
         logger.info("Shutdown complete")
 
 
@@ -685,6 +1085,13 @@ def main():
         action='store_true',
         help='Automatically start charging on startup'
     )
+    parser.add_argument(
+        '--channel',
+        action='append',
+        metavar='NAME=CONFIG',
+        help='Gateway mode: run a charger channel with its own config file '
+             '(repeat per PSU; MQTT connection settings come from --config)'
+    )
 
     args = parser.parse_args()
 
@@ -696,6 +1103,10 @@ def main():
     logger.info("Battery Charger - Raspberry Pi + OWON SPE6205")
     logger.info("=" * 60)
 
+    if args.channel:
+        run_gateway(args)
+        return
+
     # Create and initialize charger
     charger = BatteryCharger(args.config)
     if not charger.initialize():
@@ -722,5 +1133,72 @@ def main():
     sys.exit(0)
 
 
+def run_gateway(args):
+    """
+    Run several chargers in one process over one shared MQTT connection.
+
+    Each charger runs its main loop in its own thread with its own PSU and
+    configuration; MQTT topics are <base_topic>/<channel>/...
+
+    Args:
+        args: Parsed command line arguments
+    """
+    with open(args.config, 'r') as f:
+        gateway_config = (yaml.safe_load(f) or {}).get('mqtt', {})
+    gateway = MQTTGateway(gateway_config)
+
+    chargers = []
+    for spec in args.channel:
+        name, separator, config_path = spec.partition('=')
+        if not separator or not config_path:
+            logger.error(f"Invalid --channel '{spec}' (expected NAME=CONFIG)")
+            sys.exit(1)
+        try:
+            charger = BatteryCharger(config_path, channel=name, mqtt_gateway=gateway)
+            ok = charger.initialize()
+        except ValueError as e:
+            logger.error(str(e))
+            ok = False
+        if not ok:
+            logger.error(f"Initialization of channel '{name}' failed")
+            for started in chargers:
+                started.shutdown()
+            gateway.disconnect()
+            sys.exit(1)
+        chargers.append(charger)
+
+    # One handler stops every channel (each charger registered its own)
+    def stop_all(signum, frame):
+        for charger in chargers:
+            charger._signal_handler(signum, frame)
+    signal.signal(signal.SIGINT, stop_all)
+    signal.signal(signal.SIGTERM, stop_all)
+
+    # atexit runs last-registered first: chargers, then the shared connection
+    atexit.register(gateway.disconnect)
+    for charger in chargers:
+        atexit.register(charger.shutdown)
+
+    if args.auto_start:
+        for charger in chargers:
+            charger.start_charging()
+
+    threads = [
+        threading.Thread(target=charger.run, name=f'charger-{charger.channel}')
+        for charger in chargers
+    ]
+    for thread in threads:
+        thread.start()
+    logger.info(f"Gateway running {len(chargers)} channel(s): {', '.join(c.channel for c in chargers)}")
+
+    # Join with a timeout so the main thread keeps handling signals
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=0.5)
+
+    gateway.disconnect()
+    sys.exit(0)
+
+
 if __name__ == '__main__':
     main()
@@ -7,6 +7,7 @@ import logging
 from abc import ABC, abstractmethod
 from typing import Optional
 from owon_psu import OwonPSU
+from measurement_filter import MeasurementFilter, Measurement
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +27,12 @@ class ChargingMode(ABC):
         self.config = config
         self.start_time = 0.0
         self.state = "idle"  # idle, charging, completed, error
+        # Filters raw PSU readings for control decisions (see _measure)
+        self.measurement_filter = MeasurementFilter()
+        # Anomaly derate: every current limit the mode sets is scaled
+        self.current_scale = 1.0
+        self.min_derated_current = 0.0
+        self.nominal_current: Optional[float] = None  # Last limit requested by the mode
 
     def start(self) -> bool:
         """
@@ -36,6 +43,7 @@ class ChargingMode(ABC):
         """
         self.start_time = time.time()
         self.state = "charging"
+        self.measurement_filter.reset()
         logger.info(f"Starting {self.config.get('name', 'unknown')} mode")
         return True
 
@@ -49,6 +57,74 @@ class ChargingMode(ABC):
         except Exception as e:
             logger.error(f"Error stopping charging: {e}")
 
+    def _set_current(self, current: float):
+        """
+        Set the PSU current limit, scaled by an active derate.
+
+        Args:
+            current: Nominal current limit in Amperes
+        """
+        self.nominal_current = current
+        self.psu.set_current(self._derated(current))
+
+    def _derated(self, current: float) -> float:
+        """Apply the derate factor (never below min_derated_current, never above nominal)."""
+        if self.current_scale >= 1.0:
+            return current
+        return max(current * self.current_scale, min(self.min_derated_current, current))
+
+    @property
+    def current_limit(self) -> Optional[float]:
+        """Current limit the mode has set on the PSU (A, derate applied), None before start."""
+        if self.nominal_current is None:
+            return None
+        return self._derated(self.nominal_current)
+
+    def set_current_limit(self, current: float):
+        """
+        Override the current limit (manual command).
+
+        The mode's next stage change sets its own limit again.
+
+        Args:
+            current: Current limit in Amperes
+        """
+        self._set_current(current)
+
+    def set_derate(self, factor: float, min_current: float = 0.0) -> Optional[float]:
+        """
+        Derate the current for the rest of the session.
+
+        The factor applies to the mode's nominal current (not to the PSU's
+        present limit), so repeated calls do not compound, and limits the
+        mode sets later (stage changes) stay derated.
+
+        Args:
+            factor: Current multiplier (0-1)
+            min_current: Lower bound for the derated current in Amperes
+
+        Returns:
+            New PSU current limit, or None if the mode has not set one yet
+        """
+        self.current_scale = factor
+        self.min_derated_current = min_current
+        if self.nominal_current is None:
+            return None
+        derated = self._derated(self.nominal_current)
+        self.psu.set_current(derated)
+        return derated
+
+    def clear_derate(self, restore: bool = True):
+        """
+        Remove the derate.
+
+        Args:
+            restore: Set the nominal current on the PSU again (while charging)
+        """
+        self.current_scale = 1.0
+        if restore and self.state == "charging" and self.nominal_current is not None:
+            self.psu.set_current(self.nominal_current)
+
     def _update_display(self, text: str):
         """
         Update PSU display with status text.
@@ -62,6 +138,20 @@ class ChargingMode(ABC):
             # Don't fail charging if display update fails
             logger.debug(f"Failed to update display: {e}")
 
+    def _measure(self) -> Measurement:
+        """
+        Read voltage, current and power from the PSU and filter them.
+
+        Returns:
+            Measurement with filtered values (for control decisions) and
+            raw values (for reporting)
+        """
+        return self.measurement_filter.update(
+            self.psu.measure_voltage(),
+            self.psu.measure_current(),
+            self.psu.measure_power()
+        )
+
     def get_elapsed_time(self) -> float:
         """Get elapsed time in seconds."""
         if self.start_time == 0:
@@ -115,7 +205,7 @@ class IUoUMode(ChargingMode):
             bulk_current = self.config.get('bulk_current', 5.0)
             absorption_voltage = self.config.get('absorption_voltage', 14.4)
 
-            self.psu.set_current(bulk_current)
+            self._set_current(bulk_current)
             self.psu.set_voltage(absorption_voltage)
             self.psu.set_output(True)
             self._update_display(f"BULK {bulk_current:.1f}A")
@@ -131,12 +221,15 @@ class IUoUMode(ChargingMode):
     def update(self) -> dict:
         """Update IUoU charging logic."""
         try:
-            voltage = self.psu.measure_voltage()
-            current = self.psu.measure_current()
-            power = self.psu.measure_power()
+            m = self._measure()
+            voltage, current, power = m.voltage, m.current, m.power
+
+            # State machine for 3-stage charging (no transitions until the
+            # filter window is full)
+            if not self.measurement_filter.ready:
+                pass
 
-            # State machine for 3-stage charging
-            if self.stage == "bulk":
+            elif self.stage == "bulk":
                 self._update_bulk_stage(voltage)
 
             elif self.stage == "absorption":
@@ -148,9 +241,11 @@ class IUoUMode(ChargingMode):
 
             status = self.get_status()
             status.update({
-                'voltage': voltage,
-                'current': current,
-                'power': power,
+                'voltage': m.voltage_raw,
+                'current': m.current_raw,
+                'power': m.power_raw,
+                'voltage_filtered': voltage,
+                'current_filtered': current,
                 'stage': self.stage,
                 'bulk_current': self.config.get('bulk_current', 5.0),
                 'absorption_voltage': self.config.get('absorption_voltage', 14.4),
@@ -218,7 +313,7 @@ class ConstantVoltageMode(ChargingMode):
             max_current = self.config.get('max_current', 5.0)
 
             self.psu.set_voltage(voltage)
-            self.psu.set_current(max_current)
+            self._set_current(max_current)
             self.psu.set_output(True)
             self._update_display(f"CV {voltage:.1f}V")
 
@@ -233,21 +328,22 @@ class ConstantVoltageMode(ChargingMode):
     def update(self) -> dict:
         """Update CV charging logic."""
         try:
-            voltage = self.psu.measure_voltage()
-            current = self.psu.measure_current()
-            power = self.psu.measure_power()
+            m = self._measure()
+            voltage, current, power = m.voltage, m.current, m.power
 
             # Check if charging complete (current dropped below threshold)
             min_current = self.config.get('min_current', 0.5)
-            if current < min_current:
+            if self.measurement_filter.ready and current < min_current:
                 logger.info(f"Current dropped to {current:.2f}A, charging complete")
                 self.state = "completed"
 
             status = self.get_status()
             status.update({
-                'voltage': voltage,
-                'current': current,
-                'power': power,
+                'voltage': m.voltage_raw,
+                'current': m.current_raw,
+                'power': m.power_raw,
+                'voltage_filtered': voltage,
+                'current_filtered': current,
                 'target_voltage': self.config.get('voltage', 13.8),
                 'min_current': min_current
             })
@@ -293,9 +389,8 @@ class PulseChargingMode(ChargingMode):
     def update(self) -> dict:
         """Update pulse charging logic."""
         try:
-            voltage = self.psu.measure_voltage()
-            current = self.psu.measure_current()
-            power = self.psu.measure_power()
+            m = self._measure()
+            voltage, current, power = m.voltage, m.current, m.power
 
             phase_elapsed = time.time() - self.phase_start_time
 
@@ -320,9 +415,11 @@ class PulseChargingMode(ChargingMode):
 
             status = self.get_status()
             status.update({
-                'voltage': voltage,
-                'current': current,
-                'power': power,
+                'voltage': m.voltage_raw,
+                'current': m.current_raw,
+                'power': m.power_raw,
+                'voltage_filtered': voltage,
+                'current_filtered': current,
                 'phase': self.phase,
                 'cycle': self.cycle_count,
                 'max_cycles': self.config.get('max_cycles', 20),
@@ -345,7 +442,7 @@ class PulseChargingMode(ChargingMode):
         pulse_current = self.config.get('pulse_current', 5.0)
 
         self.psu.set_voltage(pulse_voltage)
-        self.psu.set_current(pulse_current)
+        self._set_current(pulse_current)
         self.psu.set_output(True)
 
         logger.debug(f"Pulse phase: {pulse_voltage}V, {pulse_current}A")
@@ -357,7 +454,7 @@ class PulseChargingMode(ChargingMode):
 
         rest_voltage = self.config.get('rest_voltage', 13.0)
         self.psu.set_voltage(rest_voltage)
-        self.psu.set_current(0.1)  # Very low current during rest
+        self._set_current(0.1)  # Very low current during rest
 
         logger.debug(f"Rest phase: {rest_voltage}V")
 
@@ -375,7 +472,7 @@ class TrickleChargeMode(ChargingMode):
             current = self.config.get('current', 0.5)
 
             self.psu.set_voltage(voltage)
-            self.psu.set_current(current)
+            self._set_current(current)
             self.psu.set_output(True)
 
             logger.info(f"Trickle mode: {voltage}V, {current}A")
@@ -389,15 +486,16 @@ class TrickleChargeMode(ChargingMode):
     def update(self) -> dict:
         """Update trickle charging logic."""
         try:
-            voltage = self.psu.measure_voltage()
-            current = self.psu.measure_current()
-            power = self.psu.measure_power()
+            m = self._measure()
+            voltage, current, power = m.voltage, m.current, m.power
 
             status = self.get_status()
             status.update({
-                'voltage': voltage,
-                'current': current,
-                'power': power,
+                'voltage': m.voltage_raw,
+                'current': m.current_raw,
+                'power': m.power_raw,
+                'voltage_filtered': voltage,
+                'current_filtered': current,
                 'target_voltage': self.config.get('voltage', 13.5),
                 'target_current': self.config.get('current', 0.5)
             })
@@ -477,12 +575,13 @@ class ConditioningMode(ChargingMode):
 
             # Set voltage and current
             self.psu.set_voltage(voltage)
-            self.psu.set_current(max_current)
+            self._set_current(max_current)
             self.psu.set_output(True)
             self._update_display(f"COND {voltage:.1f}V")
 
             self.state = "charging"
             self.start_time = time.time()
+            self.measurement_filter.reset()
 
             logger.info("Conditioning started - monitor current for electrolysis detection")
 
@@ -496,9 +595,8 @@ class ConditioningMode(ChargingMode):
     def update(self) -> dict:
         """Update conditioning mode logic."""
         try:
-            voltage = self.psu.measure_voltage()
-            current = self.psu.measure_current()
-            power = self.psu.measure_power()
+            m = self._measure()
+            voltage, current, power = m.voltage, m.current, m.power
 
             elapsed = self.get_elapsed_time()
             duration = self.config.get('duration', 86400)
@@ -526,9 +624,11 @@ class ConditioningMode(ChargingMode):
 
             status = self.get_status()
             status.update({
-                'voltage': voltage,
-                'current': current,
-                'power': power,
+                'voltage': m.voltage_raw,
+                'current': m.current_raw,
+                'power': m.power_raw,
+                'voltage_filtered': voltage,
+                'current_filtered': current,
                 'phase': self.phase,
                 'target_voltage': self.config.get('voltage', 15.5),
                 'duration': duration,
@@ -577,12 +677,13 @@ class ConstantCurrentMode(ChargingMode):
             logger.info("Battery will charge with constant current until voltage plateaus")
 
             # Set current and high voltage limit (safety only)
-            self.psu.set_current(current)
+            self._set_current(current)
             self.psu.set_voltage(max_voltage)
             self.psu.set_output(True)
 
             self.state = "charging"
             self.start_time = time.time()
+            self.measurement_filter.reset()
 
             logger.info("Constant Current charging started")
             logger.info("Monitor for voltage plateau - charging complete when voltage stops rising")
@@ -597,18 +698,19 @@ class ConstantCurrentMode(ChargingMode):
     def update(self) -> dict:
         """Update constant current charging logic."""
         try:
-            voltage = self.psu.measure_voltage()
-            current = self.psu.measure_current()
-            power = self.psu.measure_power()
+            m = self._measure()
+            voltage, current, power = m.voltage, m.current, m.power
 
             # Pure constant current - just measure and report
             # Plateau detection is handled by safety_monitor in main loop
 
             status = self.get_status()
             status.update({
-                'voltage': voltage,
-                'current': current,
-                'power': power,
+                'voltage': m.voltage_raw,
+                'current': m.current_raw,
+                'power': m.power_raw,
+                'voltage_filtered': voltage,
+                'current_filtered': current,
                 'target_current': self.config.get('current', 4.4),
                 'max_voltage': self.config.get('max_voltage', 18.0),
                 'charging_method': 'constant_current'
@@ -623,7 +725,23 @@ class ConstantCurrentMode(ChargingMode):
 
 
 # Mode factory
-def create_charging_mode(mode_name: str, psu: OwonPSU, config: dict) -> ChargingMode:
+MODE_CLASSES = {
+    'IUoU': IUoUMode,
+    'CV': ConstantVoltageMode,
+    'CC': ConstantCurrentMode,
+    'Conditioning': ConditioningMode,
+    'Pulse': PulseChargingMode,
+    'Trickle': TrickleChargeMode
+}
+MODE_NAMES = tuple(MODE_CLASSES)
+
+
+def create_charging_mode(
+    mode_name: str,
+    psu: OwonPSU,
+    config: dict,
+    measurement_filter: Optional[MeasurementFilter] = None
+) -> ChargingMode:
     """
     Factory function to create charging mode instance.
 
@@ -631,24 +749,19 @@ def create_charging_mode(mode_name: str, psu: OwonPSU, config: dict) -> Charging
         mode_name: Name of mode (IUoU, CV, Pulse, Trickle)
         psu: OWON PSU instance
         config: Mode configuration dictionary
+        measurement_filter: Filter for control decisions (default: median-of-3)
 
     Returns:
         ChargingMode instance
     """
-    modes = {
-        'IUoU': IUoUMode,
-        'CV': ConstantVoltageMode,
-        'CC': ConstantCurrentMode,
-        'Conditioning': ConditioningMode,
-        'Pulse': PulseChargingMode,
-        'Trickle': TrickleChargeMode
-    }
-
-    mode_class = modes.get(mode_name)
+    mode_class = MODE_CLASSES.get(mode_name)
     if not mode_class:
         raise ValueError(f"Unknown charging mode: {mode_name}")
 
     # Add name to config
     config['name'] = mode_name
 
-    return mode_class(psu, config)
+    mode = mode_class(psu, config)
+    if measurement_filter is not None:
+        mode.measurement_filter = measurement_filter
+    return mode
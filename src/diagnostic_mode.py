@@ -9,6 +9,61 @@ from owon_psu import OwonPSU
 
 logger = logging.getLogger(__name__)
 
+# SOC lookup tables based on battery type (for 12V, 6-cell battery)
+# Source: https://wiki.w311.info/index.php?title=Batterie_Heute
+# (resting voltage, SOC %), highest first; scaled for other voltages
+
+# AGM batteries have higher resting voltages (12V baseline)
+SOC_TABLE_AGM = [
+    (12.90, 100),
+    (12.75, 90),
+    (12.65, 80),
+    (12.50, 70),
+    (12.40, 60),
+    (12.25, 50),
+    (11.80, 20),
+    (10.50, 5),
+]
+
+# Flooded lead-calcium batteries (12V baseline)
+SOC_TABLE_FLOODED = [
+    (12.70, 100),
+    (12.60, 90),
+    (12.50, 80),  # ⚠️ Critical threshold - recharge immediately!
+    (12.40, 70),
+    (12.30, 60),
+    (12.20, 50),
+    (12.10, 40),
+    (11.90, 30),
+    (11.80, 20),
+    (11.50, 10),
+    (10.50, 0),
+]
+
+
+def soc_from_rest_voltage(voltage: float, battery_type: str = 'flooded', nominal_voltage: float = 12.0) -> float:
+    """
+    Interpolate state of charge from a resting (open-circuit) voltage.
+
+    Args:
+        voltage: Resting voltage in V
+        battery_type: 'flooded' or 'agm'
+        nominal_voltage: Nominal battery voltage (2V, 6V, 12V, 24V, etc.)
+
+    Returns:
+        SOC in percent (0-100)
+    """
+    table = SOC_TABLE_AGM if battery_type == 'agm' else SOC_TABLE_FLOODED
+    scale = nominal_voltage / 12.0
+    if voltage >= table[0][0] * scale:
+        return float(table[0][1])
+    for (v_high, soc_high), (v_low, soc_low) in zip(table, table[1:]):
+        v_high *= scale
+        v_low *= scale
+        if voltage >= v_low:
+            return soc_low + (soc_high - soc_low) * (voltage - v_low) / (v_high - v_low)
+    return float(table[-1][1])
+
 
 class BatteryDiagnostics:
     """Battery diagnostic tests using only the PSU."""
@@ -56,37 +111,7 @@ class BatteryDiagnostics:
         Returns:
             Dictionary with SOC estimate and battery status
         """
-        # SOC lookup tables based on battery type (for 12V, 6-cell battery)
-        # Source: https://wiki.w311.info/index.php?title=Batterie_Heute
-        # These will be scaled for other voltages
-
-        if battery_type == 'agm':
-            # AGM batteries have higher resting voltages (12V baseline)
-            soc_table_12v = [
-                (12.90, 100),
-                (12.75, 90),
-                (12.65, 80),
-                (12.50, 70),
-                (12.40, 60),
-                (12.25, 50),
-                (11.80, 20),
-                (10.50, 5),
-            ]
-        else:  # flooded (default)
-            # Flooded lead-calcium batteries (12V baseline)
-            soc_table_12v = [
-                (12.70, 100),
-                (12.60, 90),
-                (12.50, 80),  # ⚠️ Critical threshold - recharge immediately!
-                (12.40, 70),
-                (12.30, 60),
-                (12.20, 50),
-                (12.10, 40),
-                (11.90, 30),
-                (11.80, 20),
-                (11.50, 10),
-                (10.50, 0),
-            ]
+        soc_table_12v = SOC_TABLE_AGM if battery_type == 'agm' else SOC_TABLE_FLOODED
 
         # Scale voltages based on nominal voltage
         # 12V = 6 cells, so scale factor = nominal_voltage / 12.0
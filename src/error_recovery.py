@@ -20,6 +20,7 @@ class ErrorRecoveryManager:
         self.mqtt_disconnects = 0
         self.last_psu_check = 0.0
         self.last_mqtt_check = 0.0
+        self.mqtt_connected: Optional[bool] = None  # Last observed MQTT state
         self.recovery_enabled = True
 
         # Callbacks
@@ -79,7 +80,11 @@ class ErrorRecoveryManager:
 
     def check_mqtt_connection(self, mqtt_client, check_interval: float = 10.0) -> bool:
         """
-        Check MQTT connection and attempt recovery.
+        Check MQTT connection state.
+
+        Reconnecting is handled by the MQTT client's own network thread
+        (jittered backoff), so this never blocks the control loop; it only
+        tracks disconnect/reconnect transitions.
 
         Args:
             mqtt_client: MQTT client instance
@@ -94,24 +99,28 @@ class ErrorRecoveryManager:
 
         self.last_mqtt_check = now
 
-        if not mqtt_client or not mqtt_client.is_connected():
-            self.mqtt_disconnects += 1
-            logger.warning(f"MQTT disconnected (count: {self.mqtt_disconnects})")
-
-            if self.recovery_enabled and mqtt_client:
-                logger.info("Attempting MQTT reconnection...")
-                try:
-                    if mqtt_client.connect():
-                        logger.info("MQTT reconnected successfully")
-                        if self.on_mqtt_reconnect:
-                            self.on_mqtt_reconnect()
-                        return True
-                except Exception as e:
-                    logger.error(f"MQTT reconnection failed: {e}")
-
+        if not mqtt_client:
             return False
 
-        return True
+        connected = mqtt_client.is_connected()
+        if connected != self.mqtt_connected:
+            previous = self.mqtt_connected
+            self.mqtt_connected = connected
+            if not connected:
+                self.mqtt_disconnects += 1
+                logger.warning(f"MQTT disconnected (count: {self.mqtt_disconnects}) - reconnecting in background")
+            elif previous is not None:
+                stats = mqtt_client.get_connection_stats()
+                logger.info(f"MQTT reconnected after {stats['last_reconnect_latency']:.1f}s "
+                            f"({stats['failed_attempts']} failed attempts total)")
+                if self.on_mqtt_reconnect:
+                    self.on_mqtt_reconnect()
+
+        # Restart the network loop if it never came up (no-op while it is retrying)
+        if not connected and self.recovery_enabled:
+            mqtt_client.connect()
+
+        return connected
 
     def get_stats(self) -> dict:
         """
@@ -0,0 +1,244 @@
+"""
+Home Assistant MQTT discovery for the battery charger.
+
+Discovery configs are generated from the status fields the MQTT client
+actually publishes (STATUS_FIELDS) and the registered commands
+(COMMAND_SPECS), so new fields show up in Home Assistant without
+hand-written YAML. They are built once, published retained, and only
+republished when Home Assistant sends its birth message
+(<prefix>/status = "online") or the generated set changes (schema hash).
+Nothing runs per status update.
+"""
+
+import re
+import json
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from mqtt_client import STATUS_FIELDS
+from mqtt_commands import COMMAND_SPECS
+
+logger = logging.getLogger(__name__)
+
+# Status field -> (entity name, extra sensor config). Fields without an
+# entry become plain sensors named after the field.
+FIELD_METADATA = {
+    'voltage': ('Voltage', {'unit_of_measurement': 'V', 'device_class': 'voltage',
+                            'state_class': 'measurement', 'suggested_display_precision': 2}),
+    'current': ('Current', {'unit_of_measurement': 'A', 'device_class': 'current',
+                            'state_class': 'measurement', 'suggested_display_precision': 2}),
+    'power': ('Power', {'unit_of_measurement': 'W', 'device_class': 'power',
+                        'state_class': 'measurement', 'suggested_display_precision': 1}),
+    'mode': ('Charging Mode', {'icon': 'mdi:cog'}),
+    'state': ('Charging State', {'icon': 'mdi:battery-charging'}),
+    'stage': ('Charging Stage', {'icon': 'mdi:stairs'}),
+    'elapsed': ('Elapsed', {'unit_of_measurement': 's', 'device_class': 'duration',
+                            'state_class': 'measurement'}),
+    'progress': ('Progress', {'unit_of_measurement': '%', 'state_class': 'measurement',
+                              'icon': 'mdi:percent'}),
+    'ah_delivered': ('Charge Delivered', {'unit_of_measurement': 'Ah', 'state_class': 'total_increasing',
+                                          'icon': 'mdi:battery-plus'}),
+    'wh_delivered': ('Energy Delivered', {'unit_of_measurement': 'Wh', 'device_class': 'energy',
+                                          'state_class': 'total_increasing'}),
+    'ah_stored': ('Charge Stored', {'unit_of_measurement': 'Ah', 'state_class': 'total_increasing',
+                                    'icon': 'mdi:battery-arrow-up'}),
+    'current_setpoint': ('Current Setpoint', {'unit_of_measurement': 'A', 'device_class': 'current',
+                                              'entity_category': 'diagnostic'}),
+}
+
+
+def _object_id(name: str) -> str:
+    """Make a topic/unique_id-safe identifier."""
+    return re.sub(r'[^a-zA-Z0-9_-]+', '_', name).strip('_').lower()
+
+
+class HADiscovery:
+    """Builds and tracks Home Assistant discovery configs."""
+
+    def __init__(
+        self,
+        base_topic: str,
+        config: Optional[dict] = None,
+        availability_topic: Optional[str] = None,
+        modes: Iterable[str] = (),
+        profiles: Iterable[str] = (),
+        max_current: float = 20.0,
+        status_fields: Iterable[str] = STATUS_FIELDS,
+        gateway_availability_topic: Optional[str] = None
+    ):
+        """
+        Initialize discovery.
+
+        Args:
+            base_topic: Charger base topic
+            config: ha_discovery configuration dictionary
+            availability_topic: Online/LWT topic ("true"/"false")
+            modes: Charging mode names (cmd/mode select options)
+            profiles: Battery profile names (cmd/profile select options)
+            max_current: Upper limit of the cmd/current number entity
+            status_fields: Fields published under status/
+            gateway_availability_topic: Gateway LWT topic (gateway channels:
+                entities are available only while both are "true")
+        """
+        config = config or {}
+        self.base_topic = base_topic
+        self.prefix = config.get('prefix', 'homeassistant')
+        self.status_topic = config.get('status_topic', f'{self.prefix}/status')
+        self.node_id = _object_id(config.get('node_id', base_topic))
+        self.availability_topic = availability_topic or f'{base_topic}/status/online'
+        self.gateway_availability_topic = gateway_availability_topic
+        self.device = {
+            'identifiers': [self.node_id],
+            'name': config.get('device_name', 'Battery Charger'),
+            'manufacturer': config.get('manufacturer', 'OWON'),
+            'model': config.get('model', 'SPE6205'),
+        }
+
+        self.configs = self._build(list(status_fields), list(modes), list(profiles), max_current)
+        self.schema_hash = hashlib.sha1(
+            json.dumps(self.configs, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+        # Published state (owned by the MQTT client)
+        self.published_hash: Optional[str] = None
+        self.published_topics: List[str] = []
+
+    def _entity(self, component: str, object_id: str, name: str, extra: dict,
+                availability: bool = True) -> Tuple[str, str]:
+        """Build one discovery (topic, payload)."""
+        unique_id = f"{self.node_id}_{object_id}"
+        payload = {
+            'name': name,
+            'unique_id': unique_id,
+            'object_id': unique_id,
+            'device': self.device,
+        }
+        if availability and self.gateway_availability_topic:
+            payload['availability'] = [
+                {'topic': topic, 'payload_available': 'true', 'payload_not_available': 'false'}
+                for topic in (self.availability_topic, self.gateway_availability_topic)
+            ]
+            payload['availability_mode'] = 'all'
+        elif availability:
+            payload['availability_topic'] = self.availability_topic
+            payload['payload_available'] = 'true'
+            payload['payload_not_available'] = 'false'
+        payload.update(extra)
+        topic = f"{self.prefix}/{component}/{self.node_id}/{object_id}/config"
+        return topic, json.dumps(payload, sort_keys=True)
+
+    def _build(self, fields: List[str], modes: List[str], profiles: List[str], max_current: float) -> Dict[str, str]:
+        """Generate all discovery configs."""
+        base = self.base_topic
+        entities = []
+
+        # Sensors for every published status field
+        for field in fields:
+            name, extra = FIELD_METADATA.get(field, (field.replace('_', ' ').title(), {}))
+            entities.append(self._entity('sensor', field, name, dict(
+                extra, state_topic=f"{base}/status/{field}"
+            )))
+
+        entities.append(self._entity('sensor', 'battery_health', 'Battery Health', {
+            'state_topic': f"{base}/status/health",
+            'value_template': '{{ value_json.health }}',
+            'json_attributes_topic': f"{base}/status/health",
+            'unit_of_measurement': '%',
+            'state_class': 'measurement',
+            'entity_category': 'diagnostic',
+            'icon': 'mdi:battery-heart-variant',
+        }))
+
+        entities.append(self._entity('binary_sensor', 'online', 'Online', {
+            'state_topic': self.availability_topic,
+            'payload_on': 'true',
+            'payload_off': 'false',
+            'device_class': 'connectivity',
+            'entity_category': 'diagnostic',
+        }, availability=False))
+
+        # Controls for registered commands
+        for spec in COMMAND_SPECS:
+            command_topic = f"{base}/cmd/{spec.name}"
+            object_id = _object_id(spec.name)
+            if spec.name in ('start', 'stop'):
+                entities.append(self._entity('button', object_id, f"{spec.name.title()} Charging", {
+                    'command_topic': command_topic,
+                    'payload_press': '',
+                    'icon': 'mdi:play' if spec.name == 'start' else 'mdi:stop',
+                }))
+            elif spec.name == 'schedule/cancel':
+                entities.append(self._entity('button', object_id, 'Cancel Schedule', {
+                    'command_topic': command_topic,
+                    'payload_press': '',
+                    'icon': 'mdi:calendar-remove',
+                }))
+            elif spec.name == 'mode' and modes:
+                entities.append(self._entity('select', 'mode_select', 'Charging Mode Select', {
+                    'command_topic': command_topic,
+                    'state_topic': f"{base}/status/mode",
+                    'options': modes,
+                    'icon': 'mdi:cog',
+                }))
+            elif spec.name == 'profile' and profiles:
+                entities.append(self._entity('select', 'profile', 'Battery Profile', {
+                    'command_topic': command_topic,
+                    'options': profiles,
+                    'icon': 'mdi:car-battery',
+                }))
+            elif spec.name == 'current':
+                # State is the limit set on the PSU, not the measured
+                # current (which tapers in absorption/float)
+                entities.append(self._entity('number', 'current_set', 'Charging Current', {
+                    'command_topic': command_topic,
+                    'state_topic': f"{base}/status/current_setpoint",
+                    'min': 0.0,
+                    'max': max_current,
+                    'step': 0.1,
+                    'mode': 'box',
+                    'unit_of_measurement': 'A',
+                    'device_class': 'current',
+                }))
+            elif spec.name == 'stream':
+                entities.append(self._entity('switch', 'stream', 'Waveform Stream', {
+                    'command_topic': command_topic,
+                    'state_topic': f"{base}/stream/state",
+                    'value_template': "{{ 'on' if value_json.enabled else 'off' }}",
+                    'payload_on': 'on',
+                    'payload_off': 'off',
+                    'state_on': 'on',
+                    'state_off': 'off',
+                    'entity_category': 'diagnostic',
+                    'icon': 'mdi:sine-wave',
+                }))
+            # JSON-only commands (schedule) have no matching HA entity
+
+        return dict(entities)
+
+    def pending(self, force: bool = False) -> List[Tuple[str, str]]:
+        """
+        Get the messages needed to bring the broker up to date.
+
+        Args:
+            force: Republish everything (Home Assistant birth message)
+
+        Returns:
+            List of (topic, payload); an empty payload removes an entity
+            that no longer exists
+        """
+        if not force and self.published_hash == self.schema_hash:
+            return []
+        messages = [(topic, '') for topic in self.published_topics if topic not in self.configs]
+        messages.extend(self.configs.items())
+        return messages
+
+    def mark_published(self):
+        """Record that the current configs are on the broker."""
+        self.published_hash = self.schema_hash
+        self.published_topics = list(self.configs)
+
+    def inherit(self, previous: 'HADiscovery'):
+        """Take over the published state of a discovery it replaces."""
+        self.published_hash = previous.published_hash
+        self.published_topics = previous.published_topics
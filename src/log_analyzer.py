@@ -0,0 +1,561 @@
+"""
+Streaming analyzer for charge session log archives.
+
+Summarizes any number of session logs (CSV, JSON Lines or binary, plain
+or gzip-compressed) without loading a whole file: every file is read as a
+generator of fixed-size column chunks and folded into O(1) running state,
+so memory stays bounded however long a session ran. Files are analyzed in
+parallel by a process pool.
+
+Per session:
+
+- Ah / Wh delivered (trapezoidal integration of I and V*I over time)
+- time spent in each stage, voltage/current at every stage transition
+- plateau: when the voltage last rose by plateau_delta, if it then stayed
+  flat for at least plateau_window (the point the charge was effectively
+  complete)
+- anomalies: the charger's streaming AnomalyDetector replayed on the data
+
+Usage:
+    python src/log_analyzer.py logs/ /mnt/archive/unit2 -j 4
+    python src/log_analyzer.py logs/ --format csv -o summary.csv
+    python src/log_analyzer.py logs/ --config config/charging_config.yaml
+
+NumPy (optional) vectorizes the per-chunk integration and stage durations.
+"""
+
+import os
+import csv
+import sys
+import gzip
+import json
+import math
+import time
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from log_fields import ALIASES
+from session_log import SessionLogReader
+from anomaly_detector import AnomalyDetector
+
+# Optional NumPy support
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+DEFAULT_CHUNK_ROWS = 10000
+DEFAULT_MAX_GAP = 900.0  # s - longer gaps (logging stopped) are not integrated
+DEFAULT_PLATEAU_DELTA = 0.05  # V
+DEFAULT_PLATEAU_WINDOW = 900.0  # s
+MAX_TRANSITIONS = 100  # Per session (bounded even for flapping stages)
+
+LOG_SUFFIXES = ('.csv', '.jsonl', '.bclog')
+
+# Chunk: parallel column lists (unix time, voltage, current, stage, mode)
+Chunk = Tuple[list, list, list, list, list]
+
+
+def find_logs(paths: List[str]) -> List[Path]:
+    """
+    Expand files and directories into session log files.
+
+    Args:
+        paths: Log files or directories (searched non-recursively)
+
+    Returns:
+        Sorted list of log files (.csv, .jsonl, .bclog, optionally .gz)
+    """
+    found = []
+    for path in map(Path, paths):
+        candidates = sorted(path.iterdir()) if path.is_dir() else [path]
+        for candidate in candidates:
+            name = candidate.name[:-3] if candidate.name.endswith('.gz') else candidate.name
+            if name.endswith(LOG_SUFFIXES) and candidate.is_file():
+                found.append(candidate)
+    return sorted(set(found))
+
+
+def _open_text(path: Path):
+    """Open a (possibly gzipped) text log."""
+    if path.name.endswith('.gz'):
+        return gzip.open(path, 'rt', newline='')
+    return open(path, 'r', newline='')
+
+
+def _float(value) -> Optional[float]:
+    """Parse a logged number ('' / None / garbage -> None)."""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _TimeParser:
+    """ISO 8601 / Unix time -> Unix seconds (date part parsed once per second)."""
+
+    def __init__(self):
+        self._prefix = None
+        self._base = 0.0
+
+    def __call__(self, value) -> Optional[float]:
+        if type(value) is float or type(value) is int:
+            return float(value)
+        if not value:
+            return None
+        prefix, _, fraction = value.partition('.')
+        if prefix != self._prefix:
+            try:
+                self._base = datetime.fromisoformat(prefix).timestamp()
+            except ValueError:
+                return _float(value)
+            self._prefix = prefix
+        return self._base + (float('0.' + fraction) if fraction else 0.0)
+
+
+def _column_map(names: List[str]) -> Dict[str, str]:
+    """Map canonical field -> logged name for the columns the analyzer needs."""
+    columns = {}
+    for name in names:
+        canonical = ALIASES.get(name, name)
+        columns.setdefault(canonical, name)
+    return columns
+
+
+def _chunks_from_rows(rows: Iterator, columns: Dict[str, str], get, chunk_rows: int,
+                      default_mode: str = '') -> Iterator[Chunk]:
+    """Build column chunks from rows accessed with get(row, name)."""
+    unix_key = columns.get('unix_time')
+    time_key = unix_key or columns.get('timestamp')
+    elapsed_key = columns.get('elapsed')
+    voltage_key = columns.get('voltage')
+    current_key = columns.get('current')
+    stage_key = columns.get('stage') or columns.get('phase')
+    mode_key = columns.get('mode')
+    if not (voltage_key and current_key and (time_key or elapsed_key)):
+        raise ValueError("Log has no time/elapsed, voltage or current column")
+
+    parse_time = _float if unix_key else _TimeParser()
+    chunk: Chunk = ([], [], [], [], [])
+    ts, vs, cs, stages, modes = chunk
+    for row in rows:
+        t = parse_time(get(row, time_key)) if time_key else _float(get(row, elapsed_key))
+        voltage = _float(get(row, voltage_key))
+        current = _float(get(row, current_key))
+        if t is None or voltage is None or current is None:
+            continue
+        ts.append(t)
+        vs.append(voltage)
+        cs.append(current)
+        stages.append((get(row, stage_key) if stage_key else '') or '')
+        modes.append((get(row, mode_key) if mode_key else default_mode) or default_mode)
+        if len(ts) >= chunk_rows:
+            yield chunk
+            chunk = ([], [], [], [], [])
+            ts, vs, cs, stages, modes = chunk
+    if ts:
+        yield chunk
+
+
+def _csv_chunks(path: Path, chunk_rows: int) -> Iterator[Chunk]:
+    with _open_text(path) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return
+        positions = {name: i for i, name in enumerate(header)}
+        width = len(header)
+
+        def get(row, name):
+            return row[positions[name]] if len(row) == width else None
+
+        yield from _chunks_from_rows(reader, _column_map(header), get, chunk_rows)
+
+
+def _jsonl_chunks(path: Path, chunk_rows: int) -> Iterator[Chunk]:
+    with _open_text(path) as f:
+        first = f.readline()
+        header = json.loads(first) if first.strip() else {}
+        if header.get('type') != 'session':
+            raise ValueError("Not a JSON Lines session log (no session header)")
+        rows = (json.loads(line) for line in f if line.startswith('{"type":"sample"'))
+        yield from _chunks_from_rows(rows, _column_map(header.get('fields', [])), dict.get,
+                                     chunk_rows, default_mode=header.get('mode') or '')
+
+
+def _binary_chunks(path: Path, chunk_rows: int) -> Iterator[Chunk]:
+    reader = SessionLogReader(path)
+    try:
+        mode = reader.header.get('mode') or ''
+        count = len(reader)
+        for start in range(0, count, chunk_rows):
+            stop = min(start + chunk_rows, count)
+            if NUMPY_AVAILABLE:
+                data = reader.to_numpy(start, stop)
+                stage_names = reader.header['enums']['stage']
+                yield (data['unix_time'].tolist(), data['voltage'].tolist(), data['current'].tolist(),
+                       [stage_names[code] for code in data['stage'].tolist()], [mode] * (stop - start))
+            else:
+                records = list(reader.iter_records(start, stop))
+                yield ([r['unix_time'] for r in records], [r['voltage'] for r in records],
+                       [r['current'] for r in records], [r['stage'] for r in records],
+                       [mode] * len(records))
+    finally:
+        reader.close()
+
+
+def iter_chunks(path, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[Chunk]:
+    """
+    Stream a session log as column chunks.
+
+    Args:
+        path: .csv, .jsonl or .bclog file (optionally .gz)
+        chunk_rows: Rows per chunk
+
+    Yields:
+        (unix_time, voltage, current, stage, mode) column sequences
+
+    Raises:
+        ValueError: If the file is not a usable session log
+    """
+    path = Path(path)
+    name = path.name[:-3] if path.name.endswith('.gz') else path.name
+    if name.endswith('.bclog'):
+        return _binary_chunks(path, chunk_rows)
+    if name.endswith('.jsonl'):
+        return _jsonl_chunks(path, chunk_rows)
+    return _csv_chunks(path, chunk_rows)
+
+
+class SessionAnalysis:
+    """Running per-session statistics, fed chunk by chunk (O(1) state)."""
+
+    def __init__(self, anomaly_config: Optional[dict] = None,
+                 plateau_delta: float = DEFAULT_PLATEAU_DELTA,
+                 plateau_window: float = DEFAULT_PLATEAU_WINDOW,
+                 max_gap: float = DEFAULT_MAX_GAP):
+        """
+        Initialize analysis.
+
+        Args:
+            anomaly_config: anomaly_detection configuration (None = skip
+                anomaly replay)
+            plateau_delta: Voltage rise (V) that counts as still rising
+            plateau_window: Flat time (s) required for a plateau
+            max_gap: Sample gaps longer than this (s) are not integrated
+        """
+        self.detector = AnomalyDetector(anomaly_config) if anomaly_config is not None else None
+        self.plateau_delta = plateau_delta
+        self.plateau_window = plateau_window
+        self.max_gap = max_gap
+
+        self.rows = 0
+        self.first_time: Optional[float] = None
+        self.last_time: Optional[float] = None
+        self.ah = 0.0
+        self.wh = 0.0
+        self.max_voltage = -math.inf
+        self.stage_seconds: Dict[str, float] = {}
+        self.transitions: List[dict] = []
+        self.anomalies: Dict[str, int] = {}
+        self._last_voltage = 0.0
+        self._last_current = 0.0
+        self._last_stage: Optional[str] = None
+        self._rise_voltage = -math.inf  # Voltage at the last rise by plateau_delta
+        self._rise_time = 0.0
+
+    def update(self, chunk: Chunk):
+        """Fold one chunk into the running statistics."""
+        ts, vs, cs, stages, modes = chunk
+        if not len(ts):
+            return
+        if NUMPY_AVAILABLE:
+            self._integrate_numpy(ts, vs, cs, stages)
+        else:
+            self._integrate(ts, vs, cs, stages)
+        self._scan(ts, vs, cs, stages, modes)
+        self.rows += len(ts)
+        self.last_time = float(ts[-1])
+        self._last_voltage = float(vs[-1])
+        self._last_current = float(cs[-1])
+
+    def _integrate(self, ts, vs, cs, stages):
+        """Energy and stage time (pure Python)."""
+        max_gap = self.max_gap
+        stage_seconds = self.stage_seconds
+        ah_s = wh_s = 0.0
+        if self.last_time is None:
+            t0, v0, i0, s0 = ts[0], vs[0], cs[0], stages[0]
+        else:
+            t0, v0, i0, s0 = self.last_time, self._last_voltage, self._last_current, self._last_stage
+        for t, v, i, s in zip(ts, vs, cs, stages):
+            dt = t - t0
+            if 0 < dt <= max_gap:
+                ah_s += (i + i0) * dt
+                wh_s += (v * i + v0 * i0) * dt
+                stage_seconds[s0] = stage_seconds.get(s0, 0.0) + dt
+            t0, v0, i0, s0 = t, v, i, s
+        self.ah += ah_s / 7200.0
+        self.wh += wh_s / 7200.0
+
+    def _integrate_numpy(self, ts, vs, cs, stages):
+        """Energy and stage time (vectorized)."""
+        t = np.asarray(ts, dtype=np.float64)
+        v = np.asarray(vs, dtype=np.float64)
+        i = np.asarray(cs, dtype=np.float64)
+        if self.last_time is not None:
+            t = np.concatenate(([self.last_time], t))
+            v = np.concatenate(([self._last_voltage], v))
+            i = np.concatenate(([self._last_current], i))
+            stages = [self._last_stage] + list(stages)
+        dt = np.diff(t)
+        dt[(dt <= 0) | (dt > self.max_gap)] = 0.0
+        self.ah += float(np.sum((i[1:] + i[:-1]) * dt)) / 7200.0
+        p = v * i
+        self.wh += float(np.sum((p[1:] + p[:-1]) * dt)) / 7200.0
+
+        # Stage of each interval = stage at its start; sum per run of equal stages
+        elapsed = np.concatenate(([0.0], np.cumsum(dt)))
+        start = 0
+        for index in range(1, len(stages)):
+            if stages[index] != stages[start]:
+                self.stage_seconds[stages[start]] = (
+                    self.stage_seconds.get(stages[start], 0.0) + float(elapsed[index] - elapsed[start]))
+                start = index
+        last = len(stages) - 1
+        if last > start:
+            self.stage_seconds[stages[start]] = (
+                self.stage_seconds.get(stages[start], 0.0) + float(elapsed[last] - elapsed[start]))
+
+    def _scan(self, ts, vs, cs, stages, modes):
+        """Transitions, plateau, max voltage and anomaly replay (per row)."""
+        if self.first_time is None:
+            self.first_time = float(ts[0])
+        detector = self.detector
+        delta = self.plateau_delta
+        last_stage = self._last_stage
+        rise_voltage = self._rise_voltage
+        rise_time = self._rise_time
+        max_voltage = self.max_voltage
+
+        for t, v, i, stage, mode in zip(ts, vs, cs, stages, modes):
+            if stage != last_stage:
+                if last_stage is not None and len(self.transitions) < MAX_TRANSITIONS:
+                    self.transitions.append({
+                        'from': last_stage, 'to': stage,
+                        'elapsed': round(float(t) - self.first_time, 1),
+                        'voltage': round(float(v), 3), 'current': round(float(i), 3)
+                    })
+                last_stage = stage
+            if v > max_voltage:
+                max_voltage = v
+            if v >= rise_voltage + delta:
+                rise_voltage = v
+                rise_time = t
+            if detector:
+                events = detector.update(v, i, mode=mode, stage=stage or None, now=t)
+                if events:
+                    for event in events:
+                        self.anomalies[event.kind] = self.anomalies.get(event.kind, 0) + 1
+
+        self._last_stage = last_stage
+        self._rise_voltage = rise_voltage
+        self._rise_time = rise_time
+        self.max_voltage = max_voltage
+
+    def summary(self) -> dict:
+        """
+        Get the session summary.
+
+        Returns:
+            Dictionary with rows, start, duration, Ah/Wh, stage durations,
+            transitions, plateau and anomaly counts
+        """
+        if not self.rows:
+            return {'rows': 0}
+        duration = self.last_time - self.first_time
+        plateau_time = None
+        if self.last_time - self._rise_time >= self.plateau_window:
+            plateau_time = round(float(self._rise_time) - self.first_time, 1)
+        return {
+            'rows': self.rows,
+            'start': datetime.fromtimestamp(self.first_time).isoformat(timespec='seconds')
+            if self.first_time > 1e8 else None,  # Elapsed-only logs have no wall clock
+            'duration': round(duration, 1),
+            'ah': round(self.ah, 3),
+            'wh': round(self.wh, 2),
+            'max_voltage': round(float(self.max_voltage), 3),
+            'final_voltage': round(self._last_voltage, 3),
+            'stages': {stage or '-': round(seconds, 1) for stage, seconds in self.stage_seconds.items()},
+            'transitions': self.transitions,
+            'plateau_time': plateau_time,
+            'plateau_voltage': round(float(self._rise_voltage), 3) if plateau_time is not None else None,
+            'anomalies': self.anomalies,
+        }
+
+
+def analyze_file(path, chunk_rows: int = DEFAULT_CHUNK_ROWS, anomaly_config: Optional[dict] = None,
+                 plateau_delta: float = DEFAULT_PLATEAU_DELTA,
+                 plateau_window: float = DEFAULT_PLATEAU_WINDOW) -> dict:
+    """
+    Analyze one session log (runs in a worker process).
+
+    Args:
+        path: Session log file
+        chunk_rows: Rows per chunk
+        anomaly_config: anomaly_detection configuration (None = skip)
+        plateau_delta: Voltage rise (V) that counts as still rising
+        plateau_window: Flat time (s) required for a plateau
+
+    Returns:
+        Session summary with 'file', 'seconds' (analysis time) and 'error'
+        (None if the file was analyzed)
+    """
+    started = time.perf_counter()
+    analysis = SessionAnalysis(anomaly_config, plateau_delta, plateau_window)
+    error = None
+    try:
+        for chunk in iter_chunks(path, chunk_rows):
+            analysis.update(chunk)
+    except (OSError, ValueError, EOFError, KeyError, csv.Error) as e:
+        error = f"{type(e).__name__}: {e}"
+    result = analysis.summary()
+    result['file'] = str(path)
+    result['seconds'] = time.perf_counter() - started
+    result['error'] = error
+    return result
+
+
+def analyze_files(paths: List[Path], jobs: Optional[int] = None, **options) -> Iterator[dict]:
+    """
+    Analyze files in a process pool.
+
+    Args:
+        paths: Session log files
+        jobs: Worker processes (default: CPU count; 1 = in this process)
+        **options: analyze_file() keyword arguments
+
+    Yields:
+        Session summaries in input order
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield analyze_file(path, **options)
+        return
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as pool:
+        futures = [pool.submit(analyze_file, path, **options) for path in paths]
+        for future in futures:
+            yield future.result()
+
+
+SUMMARY_COLUMNS = ('file', 'start', 'rows', 'hours', 'ah', 'wh', 'bulk_min', 'absorption_min',
+                   'float_min', 'plateau_min', 'plateau_v', 'max_v', 'anomalies', 'rows_per_s')
+
+
+def _summary_row(result: dict) -> dict:
+    """Flatten a session summary into the table columns."""
+    stages = result.get('stages', {})
+    plateau = result.get('plateau_time')
+    seconds = result.get('seconds') or 0.0
+    return {
+        'file': Path(result['file']).name,
+        'start': result.get('start') or '',
+        'rows': result.get('rows', 0),
+        'hours': round(result.get('duration', 0.0) / 3600, 2),
+        'ah': result.get('ah', ''),
+        'wh': result.get('wh', ''),
+        'bulk_min': round(stages.get('bulk', 0.0) / 60, 1),
+        'absorption_min': round(stages.get('absorption', 0.0) / 60, 1),
+        'float_min': round(stages.get('float', 0.0) / 60, 1),
+        'plateau_min': round(plateau / 60, 1) if plateau is not None else '',
+        'plateau_v': result.get('plateau_voltage') or '',
+        'max_v': result.get('max_voltage', ''),
+        'anomalies': sum(result.get('anomalies', {}).values()),
+        'rows_per_s': round(result.get('rows', 0) / seconds) if seconds else '',
+    }
+
+
+def _print_table(rows: List[dict], output):
+    """Print summary rows as an aligned text table."""
+    widths = {column: max([len(column)] + [len(str(row[column])) for row in rows]) for column in SUMMARY_COLUMNS}
+    print('  '.join(column.ljust(widths[column]) for column in SUMMARY_COLUMNS), file=output)
+    for row in rows:
+        print('  '.join(str(row[column]).rjust(widths[column]) if column != 'file'
+                        else str(row[column]).ljust(widths[column])
+                        for column in SUMMARY_COLUMNS), file=output)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line tool: analyze session logs and print a summary."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Summarize charge session logs')
+    parser.add_argument('paths', nargs='+', help='Log files or directories')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--format', choices=('table', 'csv', 'json'), default='table',
+                        help='Summary format (json includes transitions and anomaly kinds)')
+    parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+    parser.add_argument('--config', help='Charger config: anomaly_detection settings for the replay')
+    parser.add_argument('--no-anomalies', action='store_true', help='Skip the anomaly replay (faster)')
+    parser.add_argument('--plateau-delta', type=float, default=DEFAULT_PLATEAU_DELTA,
+                        help='Voltage rise (V) that counts as still rising')
+    parser.add_argument('--plateau-window', type=float, default=DEFAULT_PLATEAU_WINDOW,
+                        help='Flat time (s) required for a plateau')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='Rows per chunk')
+    args = parser.parse_args(argv)
+
+    anomaly_config = None
+    if not args.no_anomalies:
+        anomaly_config = {}
+        if args.config:
+            import yaml
+            with open(args.config) as f:
+                anomaly_config = (yaml.safe_load(f) or {}).get('anomaly_detection', {})
+        anomaly_config = dict(anomaly_config, enabled=True)
+
+    paths = find_logs(args.paths)
+    if not paths:
+        print("No session logs found", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    results = []
+    for result in analyze_files(paths, args.jobs, chunk_rows=args.chunk_rows, anomaly_config=anomaly_config,
+                                plateau_delta=args.plateau_delta, plateau_window=args.plateau_window):
+        if result['error']:
+            print(f"{result['file']}: {result['error']}", file=sys.stderr)
+        results.append(result)
+    elapsed = time.perf_counter() - started
+
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'json':
+            json.dump(results, output, indent=1)
+            output.write('\n')
+        else:
+            rows = [_summary_row(result) for result in results if result.get('rows')]
+            if args.format == 'csv':
+                writer = csv.DictWriter(output, fieldnames=SUMMARY_COLUMNS)
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                _print_table(rows, output)
+    finally:
+        if args.output:
+            output.close()
+
+    total_rows = sum(result.get('rows', 0) for result in results)
+    failed = sum(1 for result in results if result['error'])
+    print(f"{len(results)} files ({failed} failed), {total_rows} rows in {elapsed:.2f}s "
+          f"({total_rows / elapsed if elapsed else 0:,.0f} rows/s)", file=sys.stderr)
+    return 0 if not failed else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Session log field registry.
+
+Maps the names allowed in logging.fields to accessors on the status
+dictionary. Three kinds of fields:
+
+- status fields: read straight from the status dictionary
+- aliases: older/descriptive names for a status field
+  (voltage_measured -> voltage, progress_percent -> progress, ...)
+- computed fields: derived per row (timestamp, setpoints that depend on
+  the mode/stage, unless the main loop reports the PSU limit directly)
+
+compile_fields() resolves a configured list once per session and generates
+one function producing a whole row (a single list display of dict.get
+calls, computed fields bound as locals), so there is no per-row loop or
+name resolution. Unknown names raise ValueError at session start instead
+of producing silently empty columns.
+"""
+
+import time
+from typing import Callable, Dict, List
+
+# Fields read directly from the status dictionary ('' if absent)
+STATUS_FIELDS = (
+    'voltage', 'current', 'power',
+    'voltage_filtered', 'current_filtered',
+    'mode', 'state', 'elapsed', 'progress',
+    'ah_delivered', 'wh_delivered', 'ah_stored',
+    'temperature',
+    'target_voltage', 'target_current', 'min_current', 'max_voltage',
+    'bulk_current', 'absorption_voltage', 'float_voltage',
+    'phase', 'phase_elapsed', 'cycle', 'max_cycles', 'duration',
+)
+
+# Alternative name -> canonical field
+ALIASES = {
+    'voltage_measured': 'voltage',
+    'current_measured': 'current',
+    'power_measured': 'power',
+    'charging_mode': 'mode',
+    'charging_state': 'state',
+    'charging_stage': 'stage',
+    'elapsed_time': 'elapsed',
+    'progress_percent': 'progress',
+    'temperature_c': 'temperature',
+}
+
+
+class _LocalTimestamp:
+    """ISO 8601 local time, formatting the date/time part once per second."""
+
+    def __init__(self):
+        self._second = None
+        self._prefix = ''
+
+    def __call__(self, status: dict) -> str:
+        now = time.time()
+        second = int(now)
+        if second != self._second:
+            self._second = second
+            self._prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(second))
+        return f"{self._prefix}.{int((now - second) * 1e6):06d}"
+
+
+def _unix_time(status: dict) -> float:
+    return round(time.time(), 3)
+
+
+def _stage(status: dict):
+    # Pulse/conditioning modes report their phase instead of a stage
+    stage = status.get('stage')
+    return stage if stage is not None else status.get('phase', '')
+
+
+def _voltage_setpoint(status: dict):
+    if 'target_voltage' in status:
+        return status['target_voltage']
+    if status.get('stage') == 'float':
+        return status.get('float_voltage', '')
+    return status.get('absorption_voltage', '')
+
+
+def _current_setpoint(status: dict):
+    # Limit actually set on the PSU (includes an anomaly derate), if reported
+    setpoint = status.get('current_setpoint')
+    if setpoint is not None:
+        return setpoint
+    if 'target_current' in status:
+        return status['target_current']
+    return status.get('bulk_current', '')
+
+
+# Computed field -> factory returning the accessor (fresh per session)
+COMPUTED_FIELDS: Dict[str, Callable[[], Callable[[dict], object]]] = {
+    'timestamp': _LocalTimestamp,
+    'unix_time': lambda: _unix_time,
+    'stage': lambda: _stage,
+    'voltage_setpoint': lambda: _voltage_setpoint,
+    'current_setpoint': lambda: _current_setpoint,
+}
+
+
+def available_fields() -> List[str]:
+    """Get every valid field name (status, computed and alias names)."""
+    return sorted(set(STATUS_FIELDS) | set(COMPUTED_FIELDS) | set(ALIASES))
+
+
+def compile_fields(names: List[str]) -> Callable[[dict], list]:
+    """
+    Compile a configured field list into a row extractor.
+
+    Args:
+        names: logging.fields
+
+    Returns:
+        Function status -> list of column values
+
+    Raises:
+        ValueError: If any name is unknown (all unknown names are listed)
+    """
+    canonical = [ALIASES.get(name, name) for name in names]
+    unknown = [name for name, field in zip(names, canonical)
+               if field not in COMPUTED_FIELDS and field not in STATUS_FIELDS]
+    if unknown:
+        raise ValueError(
+            f"Unknown log field(s): {', '.join(unknown)} (valid: {', '.join(available_fields())})"
+        )
+
+    # Generated once per session, e.g.
+    #   def extract(status):
+    #       get = status.get
+    #       return [_f0(status), get('voltage', ''), get('current', '')]
+    namespace = {}
+    columns = []
+    for index, field in enumerate(canonical):
+        if field in COMPUTED_FIELDS:
+            namespace[f'_f{index}'] = COMPUTED_FIELDS[field]()
+            columns.append(f'_f{index}(status)')
+        else:
+            columns.append(f"get({field!r}, '')")
+    source = (
+        "def extract(status):\n"
+        "    get = status.get\n"
+        f"    return [{', '.join(columns)}]\n"
+    )
+    exec(source, namespace)
+    return namespace['extract']
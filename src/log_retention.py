@@ -0,0 +1,335 @@
+"""
+Session log retention: rotation, size cap and background compression.
+
+Units run unattended for months on small SD cards, so the log directory
+must not grow forever. The retention manager:
+
+- keeps an index of sessions (<log_dir>/<prefix>_sessions.json) so
+  listing sessions never scans the directory (the directory is only
+  scanned once, to build a missing index)
+- gzips closed session logs in a background worker running at the lowest
+  CPU priority (the control loop never waits for it)
+- deletes the oldest sessions beyond logging.max_files or
+  logging.max_total_mb (the active session is never touched)
+- recovers sessions left open by a power cut: on load every session still
+  marked open is closed, re-sized from disk and queued for compression
+
+Binary logs keep their small .idx sidecar uncompressed; SessionLogReader
+reads .bclog.gz files directly.
+"""
+
+import os
+import re
+import gzip
+import json
+import queue
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_FILES = 30
+DEFAULT_MAX_TOTAL_MB = 500
+COMPRESS_EXTENSIONS = ('.csv', '.bclog', '.jsonl')
+_STOP = object()
+
+
+def _lower_thread_priority():
+    """Run the calling thread at nice 19 (Linux: per thread; no-op elsewhere)."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError) as e:
+        logger.debug(f"Could not lower compression thread priority: {e}")
+
+
+class LogRetentionManager:
+    """Indexes session logs, compresses closed ones and enforces limits."""
+
+    def __init__(self, log_dir, config: Optional[dict] = None, prefix: str = 'charge'):
+        """
+        Initialize retention manager.
+
+        Args:
+            log_dir: Session log directory
+            config: logging configuration dictionary (max_files,
+                max_total_mb, compress, compress_level)
+            prefix: Session file prefix (charge or charge_<channel>)
+        """
+        config = config or {}
+        self.log_dir = Path(log_dir)
+        self.prefix = prefix
+        self.max_files = int(config.get('max_files', DEFAULT_MAX_FILES))
+        self.max_total_bytes = int(float(config.get('max_total_mb', DEFAULT_MAX_TOTAL_MB)) * 1024 * 1024)
+        self.compress = bool(config.get('compress', True))
+        self.compress_level = int(config.get('compress_level', 6))
+
+        self.index_path = self.log_dir / f'{prefix}_sessions.json'
+        self._pattern = re.compile(rf'^{re.escape(prefix)}_(\d{{8}}_\d{{6}})\.')
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, dict] = {}  # name -> entry, oldest first
+        self._active: Optional[str] = None
+
+        self._jobs: queue.Queue = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+
+        self.deleted_count = 0
+        self.compressed_count = 0
+        self.saved_bytes = 0
+
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Load the session index (built by one directory scan if missing)."""
+        if self.index_path.exists():
+            try:
+                entries = json.loads(self.index_path.read_text())
+                self._sessions = {entry['name']: entry for entry in entries}
+                self._recover_open_sessions()
+                return
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Session index {self.index_path} unreadable ({e}) - rebuilding")
+
+        sessions: Dict[str, dict] = {}
+        for path in sorted(self.log_dir.iterdir()):
+            match = self._pattern.match(path.name)
+            if not match:
+                continue
+            name = f"{self.prefix}_{match.group(1)}"
+            entry = sessions.setdefault(name, {'name': name, 'files': [], 'closed': True, 'compressed': False})
+            entry['files'].append(path.name)
+            if path.name.endswith('.gz'):
+                entry['compressed'] = True
+        for entry in sessions.values():
+            entry['size'] = self._files_size(entry['files'])
+        self._sessions = dict(sorted(sessions.items()))
+        self._save_index()
+        logger.info(f"Built session index {self.index_path} ({len(self._sessions)} sessions)")
+
+    def _recover_open_sessions(self):
+        """Close sessions left open by a crash or power cut (no session is active yet)."""
+        recovered = [entry for name, entry in self._sessions.items()
+                     if not entry.get('closed') and name != self._active]
+        for entry in recovered:
+            entry['closed'] = True
+            entry['size'] = self._files_size(entry['files'])
+        if recovered:
+            self._save_index()
+            logger.warning(
+                f"Recovered {len(recovered)} session log(s) left open by an unclean shutdown: "
+                f"{', '.join(entry['name'] for entry in recovered)}"
+            )
+
+    def _save_index(self):
+        """Write the index atomically (lock held or single-threaded)."""
+        tmp_path = self.index_path.with_suffix('.tmp')
+        try:
+            tmp_path.write_text(json.dumps(list(self._sessions.values()), indent=1))
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.error(f"Failed to write session index: {e}")
+
+    def _files_size(self, files: List[str]) -> int:
+        """Total size of existing session files."""
+        total = 0
+        for name in files:
+            try:
+                total += (self.log_dir / name).stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def start(self):
+        """Start the worker and queue leftovers (uncompressed closed logs, limits)."""
+        if self._worker and self._worker.is_alive():
+            return
+        self._worker = threading.Thread(target=self._run, name='log-retention', daemon=True)
+        self._worker.start()
+        self._jobs.put(None)  # Enforce limits first - no point compressing doomed logs
+        with self._lock:
+            pending = [name for name, entry in self._sessions.items()
+                       if entry.get('closed') and not entry.get('compressed')]
+        for name in pending:
+            self._jobs.put(name)
+
+    def session_opened(self, path, metadata: Optional[dict] = None):
+        """
+        Register a new session (becomes the active session).
+
+        Args:
+            path: Main log file (a .idx sidecar is added automatically)
+            metadata: Session description (profile, mode, format...)
+        """
+        path = Path(path)
+        name = path.name.split('.', 1)[0]
+        files = [path.name]
+        if path.suffix == '.bclog':
+            files.append(f"{path.name}.idx")
+        entry = {'name': name, 'files': files, 'closed': False, 'compressed': False, 'size': 0}
+        if metadata:
+            entry.update({k: v for k, v in metadata.items() if k in ('profile', 'mode', 'channel')})
+        with self._lock:
+            self._sessions[name] = entry
+            self._active = name
+            self._save_index()
+        self._jobs.put(None)  # Make room for the new session
+
+    def session_closed(self, path, stats: Optional[dict] = None):
+        """
+        Mark the active session closed and queue it for compression.
+
+        Args:
+            path: Main log file
+            stats: SessionLogger statistics (rows written)
+        """
+        name = Path(path).name.split('.', 1)[0]
+        with self._lock:
+            entry = self._sessions.get(name)
+            if entry is None:
+                return
+            entry['closed'] = True
+            entry['size'] = self._files_size(entry['files'])
+            if stats:
+                entry['rows'] = stats.get('written', 0)
+            if self._active == name:
+                self._active = None
+            self._save_index()
+        self._jobs.put(name)
+
+    def list_sessions(self) -> List[dict]:
+        """
+        Get all indexed sessions, oldest first (no directory scan).
+
+        Returns:
+            List of session entries (copies)
+        """
+        with self._lock:
+            return [dict(entry) for entry in self._sessions.values()]
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Stop the worker after the job in progress.
+
+        Args:
+            timeout: Seconds to wait
+        """
+        if not self._worker:
+            return
+        self._jobs.put(_STOP)
+        self._worker.join(timeout=timeout)
+        if self._worker.is_alive():
+            logger.warning("Log compression still running at shutdown - it will be redone next start")
+        self._worker = None
+
+    def _run(self):
+        """Worker loop (background thread, lowest priority)."""
+        _lower_thread_priority()
+        while True:
+            job = self._jobs.get()
+            if job is _STOP:
+                return
+            try:
+                if job is not None and self.compress:
+                    self._compress_session(job)
+                self._enforce_limits()
+            except Exception as e:
+                logger.error(f"Log retention job failed: {e}")
+
+    def _compress_session(self, name: str):
+        """Gzip a closed session's log file (not the .idx sidecar)."""
+        with self._lock:
+            entry = self._sessions.get(name)
+            if not entry or not entry.get('closed') or entry.get('compressed'):
+                return
+            files = list(entry['files'])
+
+        new_files = []
+        before = after = 0
+        for file_name in files:
+            source = self.log_dir / file_name
+            if not file_name.endswith(COMPRESS_EXTENSIONS) or not source.exists():
+                new_files.append(file_name)
+                continue
+            target = source.with_name(file_name + '.gz')
+            tmp = source.with_name(file_name + '.gz.tmp')
+            with open(source, 'rb') as src, gzip.open(tmp, 'wb', compresslevel=self.compress_level) as dst:
+                shutil.copyfileobj(src, dst, 256 * 1024)
+            os.replace(tmp, target)
+            before += source.stat().st_size
+            after += target.stat().st_size
+            source.unlink()
+            new_files.append(target.name)
+
+        with self._lock:
+            entry = self._sessions.get(name)
+            if entry is None:
+                # Deleted by retention meanwhile - drop the files just written
+                for file_name in new_files:
+                    try:
+                        (self.log_dir / file_name).unlink()
+                    except FileNotFoundError:
+                        pass
+                return
+            entry['files'] = new_files
+            entry['compressed'] = True
+            entry['size'] = self._files_size(new_files)
+            self._save_index()
+        self.compressed_count += 1
+        self.saved_bytes += before - after
+        if before:
+            logger.info(f"Compressed session log {name}: {before / 1024:.0f} KB -> {after / 1024:.0f} KB")
+
+    def _enforce_limits(self):
+        """Delete the oldest closed sessions beyond max_files / max_total_mb."""
+        with self._lock:
+            names = list(self._sessions)
+            total = sum(entry.get('size', 0) for entry in self._sessions.values())
+            doomed = []
+            count = len(names)
+            for name in names:
+                if count <= self.max_files and total <= self.max_total_bytes:
+                    break
+                if name == self._active:
+                    continue
+                entry = self._sessions[name]
+                doomed.append(entry)
+                count -= 1
+                total -= entry.get('size', 0)
+            for entry in doomed:
+                del self._sessions[entry['name']]
+            if doomed:
+                self._save_index()
+
+        for entry in doomed:
+            for file_name in entry['files']:
+                try:
+                    (self.log_dir / file_name).unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error(f"Failed to delete old log {file_name}: {e}")
+            self.deleted_count += 1
+            logger.info(f"Deleted old session log {entry['name']} (retention)")
+
+    def get_stats(self) -> dict:
+        """
+        Get retention statistics.
+
+        Returns:
+            Dictionary with session count, total size and worker counters
+        """
+        with self._lock:
+            total = sum(entry.get('size', 0) for entry in self._sessions.values())
+            count = len(self._sessions)
+        return {
+            'sessions': count,
+            'bytes': total,
+            'max_files': self.max_files,
+            'max_bytes': self.max_total_bytes,
+            'compressed': self.compressed_count,
+            'saved_bytes': self.saved_bytes,
+            'deleted': self.deleted_count
+        }
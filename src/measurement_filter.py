@@ -0,0 +1,284 @@
+"""
+Measurement filtering between PSU acquisition and charging control logic.
+
+A single glitched reading (including the 0.0 the PSU driver returns on a
+parse error) must not end a charge or switch a stage. Each channel runs
+through a short filter chain:
+
+1. Dropout rejection - an exact 0.0 V or 0.0 A reading while the output
+   is on is a read error, not a measurement; the last value is held (for
+   at most dropout_hold consecutive readings, so a real zero still shows).
+2. Median-of-N spike rejector - removes isolated spikes.
+3. Smoother - EWMA or scalar Kalman filter (optional).
+
+The filter is not ready until the median window is full. Modes make no
+stage or completion decisions before that, so a glitch in the first
+samples after a (re)start cannot end a charge either.
+
+Filters run inline on the samples the control loop already takes, so they
+add no extra PSU reads or loop latency. Modes see both filtered and raw
+values (see Measurement).
+"""
+
+import math
+import logging
+from collections import deque
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+SMOOTHERS = ('none', 'ewma', 'kalman')
+
+
+class Measurement(NamedTuple):
+    """One PSU sample, filtered and raw."""
+    voltage: float  # Filtered voltage in V (use for control decisions)
+    current: float  # Filtered current in A
+    power: float  # Filtered power in W
+    voltage_raw: float  # Raw PSU reading in V
+    current_raw: float  # Raw PSU reading in A
+    power_raw: float  # Raw PSU reading in W
+
+
+class MedianFilter:
+    """Median-of-N spike rejector."""
+
+    def __init__(self, window: int = 3):
+        if window < 1:
+            raise ValueError(f"Median window must be >= 1, got {window}")
+        self.window = window
+        self.samples = deque(maxlen=window)
+
+    def reset(self):
+        self.samples.clear()
+
+    @property
+    def full(self) -> bool:
+        return len(self.samples) == self.window
+
+    def update(self, value: float) -> float:
+        self.samples.append(value)
+        if self.window == 1:
+            return value
+        ordered = sorted(self.samples)
+        n = len(ordered)
+        mid = n // 2
+        if n % 2:
+            return ordered[mid]
+        return (ordered[mid - 1] + ordered[mid]) / 2.0
+
+
+class EWMAFilter:
+    """Exponentially weighted moving average."""
+
+    def __init__(self, alpha: float = 0.3):
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError(f"EWMA alpha must be in (0, 1], got {alpha}")
+        self.alpha = alpha
+        self.value = math.nan
+
+    def reset(self):
+        self.value = math.nan
+
+    def update(self, value: float) -> float:
+        if self.value != self.value:  # First sample
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class KalmanFilter:
+    """
+    Scalar Kalman filter (random-walk model).
+
+    process_noise (Q) is how much the true value may change per sample,
+    measurement_noise (R) the variance of a single PSU reading.
+    """
+
+    def __init__(self, process_noise: float = 1e-4, measurement_noise: float = 1e-3):
+        if process_noise <= 0 or measurement_noise <= 0:
+            raise ValueError("Kalman process_noise and measurement_noise must be positive")
+        self.q = process_noise
+        self.r = measurement_noise
+        self.value = math.nan
+        self.p = 1.0  # Estimate variance
+
+    def reset(self):
+        self.value = math.nan
+        self.p = 1.0
+
+    def update(self, value: float) -> float:
+        if self.value != self.value:  # First sample
+            self.value = value
+            self.p = self.r
+            return value
+        self.p += self.q
+        gain = self.p / (self.p + self.r)
+        self.value += gain * (value - self.value)
+        self.p *= (1.0 - gain)
+        return self.value
+
+
+class ChannelFilter:
+    """Filter chain for one measurement channel."""
+
+    def __init__(
+        self,
+        median_window: int = 3,
+        smoother: str = 'none',
+        alpha: float = 0.3,
+        process_noise: float = 1e-4,
+        measurement_noise: float = 1e-3,
+        reject_zero: bool = False,
+        dropout_hold: int = 3
+    ):
+        """
+        Initialize channel filter.
+
+        Args:
+            median_window: Median window size (1 = disabled)
+            smoother: none, ewma or kalman
+            alpha: EWMA weight
+            process_noise: Kalman Q
+            measurement_noise: Kalman R
+            reject_zero: Treat exact 0.0 as a read error and hold the last value
+            dropout_hold: Consecutive 0.0 readings held before accepting them
+        """
+        if smoother not in SMOOTHERS:
+            raise ValueError(f"Unknown smoother '{smoother}' (valid: {', '.join(SMOOTHERS)})")
+
+        self.median = MedianFilter(median_window)
+        if smoother == 'ewma':
+            self.smoother = EWMAFilter(alpha)
+        elif smoother == 'kalman':
+            self.smoother = KalmanFilter(process_noise, measurement_noise)
+        else:
+            self.smoother = None
+        self.reject_zero = reject_zero
+        self.dropout_hold = dropout_hold
+        self.last_input = math.nan
+        self.held = 0  # Consecutive dropouts held
+        self.rejected = 0  # Dropout readings replaced this session
+
+    @classmethod
+    def from_config(cls, config: dict, defaults: dict) -> 'ChannelFilter':
+        """Create from channel config, falling back to shared defaults."""
+        merged = dict(defaults)
+        merged.update(config or {})
+        return cls(
+            median_window=int(merged.get('median_window', 3)),
+            smoother=merged.get('smoother', 'none'),
+            alpha=float(merged.get('alpha', 0.3)),
+            process_noise=float(merged.get('process_noise', 1e-4)),
+            measurement_noise=float(merged.get('measurement_noise', 1e-3)),
+            reject_zero=bool(merged.get('reject_zero', False)),
+            dropout_hold=int(merged.get('dropout_hold', 3))
+        )
+
+    def reset(self):
+        self.median.reset()
+        if self.smoother:
+            self.smoother.reset()
+        self.last_input = math.nan
+        self.held = 0
+        self.rejected = 0
+
+    @property
+    def ready(self) -> bool:
+        """Check if the median window is full (output is a real median)."""
+        return self.median.full
+
+    def update(self, value: float) -> float:
+        # Dropout: hold previous input instead of feeding 0.0 into the chain
+        if self.reject_zero and value == 0.0 and self.held < self.dropout_hold:
+            self.rejected += 1
+            self.held += 1
+            if self.last_input != self.last_input:
+                # Nothing to hold yet - leave the sample out (window stays unfilled)
+                return value
+            value = self.last_input
+        else:
+            self.held = 0
+            self.last_input = value
+
+        value = self.median.update(value)
+        if self.smoother:
+            value = self.smoother.update(value)
+        return value
+
+
+class MeasurementFilter:
+    """Filters voltage, current and power samples for control decisions."""
+
+    def __init__(self, config: Optional[dict] = None):
+        """
+        Initialize measurement filter.
+
+        Args:
+            config: filtering configuration dictionary:
+                enabled: bool
+                median_window, smoother, alpha, process_noise,
+                measurement_noise: shared defaults
+                dropout_hold: consecutive 0.0 V / 0.0 A readings held
+                voltage/current/power: per-channel overrides
+        """
+        config = config or {}
+        self.enabled = config.get('enabled', True)
+
+        defaults = {
+            key: config[key] for key in
+            ('median_window', 'smoother', 'alpha', 'process_noise', 'measurement_noise',
+             'dropout_hold')
+            if key in config
+        }
+        # With the output on, a connected battery never reads exactly 0.0 V or
+        # 0.0 A - that is a parse error (a real zero shows after dropout_hold)
+        dropout_defaults = dict(defaults, reject_zero=True)
+
+        self.voltage = ChannelFilter.from_config(config.get('voltage', {}), dropout_defaults)
+        self.current = ChannelFilter.from_config(config.get('current', {}), dropout_defaults)
+        self.power = ChannelFilter.from_config(config.get('power', {}), defaults)
+
+    @property
+    def ready(self) -> bool:
+        """Check if voltage and current are settled enough for control decisions."""
+        return not self.enabled or (self.voltage.ready and self.current.ready)
+
+    def reset(self):
+        """Reset filter state (start of session / after setpoint jumps)."""
+        self.voltage.reset()
+        self.current.reset()
+        self.power.reset()
+
+    def update(self, voltage: float, current: float, power: float) -> Measurement:
+        """
+        Filter one sample.
+
+        Args:
+            voltage: Raw voltage in V
+            current: Raw current in A
+            power: Raw power in W
+
+        Returns:
+            Measurement with filtered and raw values
+        """
+        if not self.enabled:
+            return Measurement(voltage, current, power, voltage, current, power)
+
+        return Measurement(
+            self.voltage.update(voltage),
+            self.current.update(current),
+            self.power.update(power),
+            voltage,
+            current,
+            power
+        )
+
+    def get_stats(self) -> dict:
+        """Get filter statistics."""
+        return {
+            'enabled': self.enabled,
+            'voltage_dropouts': self.voltage.rejected,
+            'current_dropouts': self.current.rejected
+        }
@@ -2,26 +2,81 @@
 MQTT client for battery charger monitoring and control.
 """
 
+import os
 import json
+import socket
 import logging
+import queue
+import random
+import threading
 import time
 from typing import Optional, Callable, Dict
 import paho.mqtt.client as mqtt
+from paho.mqtt.properties import Properties
+from paho.mqtt.packettypes import PacketTypes
+
+from telemetry_codec import TelemetryEncoder
+from telemetry_spool import TelemetrySpool
+from mqtt_commands import CommandRequest, CommandSpec, CommandLatencyTracker, COMMAND_SPECS
 
 logger = logging.getLogger(__name__)
 
+# Per-field deadbands for change-driven status publishing. A numeric field is
+# only republished when it moved at least this far from the last published
+# value (or the heartbeat interval expired). Fields without a deadband are
+# published whenever they change.
+DEFAULT_DEADBANDS = {
+    'voltage': 0.005,  # V (±5 mV)
+    'current': 0.001,  # A (±1 mA)
+    'power': 0.01,  # W
+    'elapsed': 60,  # s
+    'progress': 1,  # %
+    'ah_delivered': 0.001,  # Ah
+    'wh_delivered': 0.01,  # Wh
+    'ah_stored': 0.001,  # Ah
+}
+DEFAULT_HEARTBEAT_INTERVAL = 300.0  # seconds - max silence per field
+
+# Fields published as <base_topic>/status/<field> by publish_status
+STATUS_FIELDS = (
+    'voltage', 'current', 'power', 'mode', 'state', 'stage',
+    'elapsed', 'progress', 'ah_delivered', 'wh_delivered', 'ah_stored',
+    'current_setpoint'
+)
+
+
+def default_client_id(prefix: str = 'battery-charger') -> str:
+    """
+    Build a client ID that is unique per process.
+
+    The broker drops an existing session when another client connects with
+    the same ID, so a fixed ID makes two chargers on one network (or one
+    Pi) kick each other off in a loop.
+
+    Args:
+        prefix: ID prefix
+
+    Returns:
+        "<prefix>-<hostname>-<pid>"
+    """
+    return f"{prefix}-{socket.gethostname()}-{os.getpid()}"
+
 
 class ChargerMQTTClient:
     """MQTT client for charger monitoring and control."""
 
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, gateway=None):
         """
         Initialize MQTT client.
 
         Args:
             config: MQTT configuration dictionary
+            gateway: MQTTGateway whose connection this client shares
+                (see mqtt_gateway.py); None opens a connection of its own
         """
         self.config = config
+        self.gateway = gateway
+        self.channel_name: Optional[str] = None  # Set by MQTTGateway.add_channel
         self.client: Optional[mqtt.Client] = None
         self.connected = False
 
@@ -33,175 +88,541 @@ class ChargerMQTTClient:
         self.on_profile_callback: Optional[Callable[[str], None]] = None
         self.on_schedule_callback: Optional[Callable[[dict], None]] = None
         self.on_schedule_cancel_callback: Optional[Callable] = None
+        self.on_stream_callback: Optional[Callable[[dict], None]] = None
+
+        # Commands are executed on the main thread (see process_commands)
+        self.command_queue: queue.Queue = queue.Queue(maxsize=config.get('command_queue_size', 32))
+        self.command_latency = CommandLatencyTracker()
 
         # Status tracking
         self.last_publish_time = 0.0
         self.base_topic = config.get('base_topic', 'battery-charger')
 
+        # Dispatch table: full command topic -> CommandSpec (built once)
+        self._commands: Dict[str, CommandSpec] = {}
+        self._cmd_prefix_len = len(f"{self.base_topic}/cmd/")
+        for spec in COMMAND_SPECS:
+            self.register_command(spec)
+
+        # Home Assistant discovery (see ha_discovery.py, set by the charger)
+        self.ha_discovery = None
+
+        # Change-driven publishing
+        self.deadbands = dict(DEFAULT_DEADBANDS)
+        self.deadbands.update(config.get('deadbands') or {})
+        self.heartbeat_interval = config.get('heartbeat_interval', DEFAULT_HEARTBEAT_INTERVAL)
+        self._last_values: Dict[str, object] = {}  # Last published value per field
+        self._last_field_publish: Dict[str, float] = {}  # Last publish time per field
+        self._last_json_publish = 0.0
+        self._last_stats_publish = 0.0
+
+        # Optional compact binary telemetry (see telemetry_codec.py)
+        self.telemetry_encoder: Optional[TelemetryEncoder] = None
+        if config.get('binary_telemetry', False):
+            self.telemetry_encoder = TelemetryEncoder()
+        self.json_status_enabled = config.get('json_status', True)
+
+        # Publish statistics
+        self.publish_count = 0
+        self.publish_bytes = 0
+        self.suppressed_count = 0
+
+        # Disk spool for samples taken while disconnected (see telemetry_spool.py)
+        self.spool: Optional[TelemetrySpool] = None
+        spool_config = config.get('spool', {})
+        if spool_config.get('enabled', True):
+            try:
+                self.spool = TelemetrySpool(
+                    spool_config.get('path', 'telemetry_spool.db'),
+                    int(spool_config.get('max_size_mb', 20) * 1024 * 1024)
+                )
+            except Exception as e:
+                logger.error(f"Telemetry spool disabled: {e}")
+        self.backfill_rate = float(spool_config.get('backfill_rate', 10.0))  # messages/s
+        self.backfill_count = 0
+        self._backfill_thread: Optional[threading.Thread] = None
+        self._backfill_stop = threading.Event()
+
+        # Reconnect handling (paho network thread, jittered backoff)
+        self.reconnect_min_delay = float(config.get('reconnect_min_delay', 1.0))
+        self.reconnect_max_delay = float(config.get('reconnect_max_delay', 60.0))
+        self._loop_started = False
+        self._reconnect_failures = 0  # Consecutive failed attempts
+        self._disconnected_since: Optional[float] = None
+        self.connect_count = 0  # Successful connections (incl. reconnects)
+        self.connect_attempts = 0  # Failed attempts
+        self.last_reconnect_latency = 0.0  # s from losing to regaining the broker
+
+        # MQTT v5: topic aliases and message expiry for high-rate telemetry,
+        # request/response properties for commands
+        self.mqtt5 = str(config.get('protocol', '3.1.1')) in ('5', '5.0', 'v5')
+        mqtt5_config = config.get('mqtt5', {})
+        self.topic_alias_limit = int(mqtt5_config.get('topic_aliases', 16))
+        self.message_expiry = int(mqtt5_config.get('message_expiry', 900))
+        self.telemetry_qos = int(mqtt5_config.get('telemetry_qos', 0))
+        self._topic_aliases: Dict[str, int] = {}  # Per connection
+        self._alias_maximum = 0  # min(topic_alias_limit, broker TopicAliasMaximum)
+        self.aliased_count = 0
+
     def connect(self) -> bool:
         """
-        Connect to MQTT broker.
+        Start connecting to the MQTT broker (non-blocking).
+
+        The client object is created once and reused. Connecting and every
+        later reconnect run on paho's network thread with jittered
+        exponential backoff, so a broker outage never blocks the caller.
+        Calling connect() again while the network loop runs is a no-op.
+        A gateway channel attaches to the gateway's connection instead.
 
         Returns:
-            True if connected successfully
+            True if the connection process was started
         """
+        if self.gateway:
+            return self.gateway.attach(self)
+        if self._loop_started:
+            return True
+
         try:
-            client_id = self.config.get('client_id', 'battery-charger')
-            self.client = mqtt.Client(client_id=client_id)
-
-            # Set up callbacks
-            self.client.on_connect = self._on_connect
-            self.client.on_disconnect = self._on_disconnect
-            self.client.on_message = self._on_message
-
-            # Set username/password if provided
-            username = self.config.get('username', '')
-            password = self.config.get('password', '')
-            if username:
-                self.client.username_pw_set(username, password)
-
-            # Set Last Will and Testament
-            lwt_topic = self.config.get('lwt_topic', f'{self.base_topic}/status/online')
-            lwt_payload = self.config.get('lwt_payload', 'false')
-            qos = self.config.get('qos', 1)
-            retain = self.config.get('retain', True)
-            self.client.will_set(lwt_topic, lwt_payload, qos=qos, retain=retain)
-
-            # Connect to broker
+            if self.client is None:
+                self.client = self._create_client()
+
             broker = self.config.get('broker', 'localhost')
             port = self.config.get('port', 1883)
             logger.info(f"Connecting to MQTT broker {broker}:{port}...")
-            self.client.connect(broker, port, keepalive=60)
+            self._disconnected_since = time.time()
+            self.client.connect_async(broker, port, keepalive=60)
 
-            # Start network loop in background thread
+            # Network loop in background thread (handles reconnects)
             self.client.loop_start()
-
-            # Wait for connection (up to 5 seconds)
-            timeout = time.time() + 5.0
-            while not self.connected and time.time() < timeout:
-                time.sleep(0.1)
-
-            if self.connected:
-                logger.info("MQTT connected successfully")
-                return True
-            else:
-                logger.error("MQTT connection timeout")
-                return False
+            self._loop_started = True
+            return True
 
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
             return False
 
+    def _create_client(self) -> mqtt.Client:
+        """Create and configure the paho client (once per process)."""
+        client_id = self.config.get('client_id') or default_client_id()
+        protocol = mqtt.MQTTv5 if self.mqtt5 else mqtt.MQTTv311
+        client = mqtt.Client(client_id=client_id, protocol=protocol)
+
+        # Set up callbacks
+        client.on_connect = self._on_connect
+        client.on_connect_fail = self._on_connect_fail
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+
+        # Set username/password if provided
+        username = self.config.get('username', '')
+        password = self.config.get('password', '')
+        if username:
+            client.username_pw_set(username, password)
+
+        # Set Last Will and Testament
+        lwt_topic = self.config.get('lwt_topic', f'{self.base_topic}/status/online')
+        lwt_payload = self.config.get('lwt_payload', 'false')
+        qos = self.config.get('qos', 1)
+        retain = self.config.get('retain', True)
+        client.will_set(lwt_topic, lwt_payload, qos=qos, retain=retain)
+
+        client.reconnect_delay_set(min_delay=self.reconnect_min_delay, max_delay=self.reconnect_max_delay)
+        return client
+
+    def _schedule_reconnect(self):
+        """
+        Set the delay before paho's next reconnect attempt.
+
+        Exponential backoff with "equal jitter": the delay is drawn from
+        [d/2, d] with d = min_delay * 2^failures (capped at max_delay), so a
+        fleet of chargers does not hit a restarted broker in lockstep.
+        paho restarts its own backoff from min_delay after
+        reconnect_delay_set(), so setting min == max pins the next wait.
+        """
+        delay = min(self.reconnect_max_delay, self.reconnect_min_delay * (2 ** self._reconnect_failures))
+        delay = random.uniform(delay / 2.0, delay)
+        self._reconnect_failures += 1
+        self.client.reconnect_delay_set(min_delay=delay, max_delay=delay)
+        logger.debug(f"Next MQTT reconnect attempt in {delay:.1f}s")
+
     def disconnect(self):
         """Disconnect from MQTT broker."""
-        if self.client:
+        self._backfill_stop.set()
+        if self._backfill_thread:
+            self._backfill_thread.join(timeout=2.0)
+
+        if self.gateway:
+            # The connection belongs to the gateway - only leave it
+            self._publish_online_status(False)
+            self.gateway.detach(self)
+        elif self.client:
             try:
                 # Publish offline status
                 self._publish_online_status(False)
 
-                # Stop loop and disconnect
-                self.client.loop_stop()
+                # Disconnect first so the network loop exits instead of reconnecting
                 self.client.disconnect()
+                self.client.loop_stop()
                 logger.info("Disconnected from MQTT broker")
             except Exception as e:
                 logger.error(f"Error during MQTT disconnect: {e}")
 
         self.connected = False
+        self._loop_started = False
+
+        if self.spool:
+            self.spool.close()
+            self.spool = None
+
+    def _fallback_to_v311(self):
+        """Recreate the client with MQTT v3.1.1 (broker refused v5)."""
+        old_client = self.client
+        try:
+            old_client.disconnect()
+            old_client.loop_stop()
+        except Exception as e:
+            logger.debug(f"Error stopping MQTT v5 client: {e}")
+        self.mqtt5 = False
+        self.client = None
+        self._loop_started = False
+        self.connect()
 
-    def _on_connect(self, client, userdata, flags, rc):
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
         """Callback when connected to broker."""
+        if self.mqtt5 and rc == 132:  # Unsupported protocol version
+            logger.warning("MQTT broker does not support v5 - falling back to v3.1.1")
+            threading.Thread(target=self._fallback_to_v311, name='mqtt-fallback', daemon=True).start()
+            return
+
         if rc == 0:
             self.connected = True
-            logger.info("MQTT connected")
+            self.connect_count += 1
 
-            # Publish online status
-            self._publish_online_status(True)
+            # Topic aliases are per connection; the broker announces its limit
+            self._topic_aliases.clear()
+            if self.mqtt5:
+                broker_maximum = getattr(properties, 'TopicAliasMaximum', 0)
+                self._alias_maximum = min(self.topic_alias_limit, broker_maximum)
+                logger.info(f"MQTT v5 session: {self._alias_maximum} topic aliases, "
+                            f"telemetry expiry {self.message_expiry}s")
 
-            # Subscribe to command topics
-            self._subscribe_commands()
+            # Reconnect latency: first failure -> connected again
+            if self._disconnected_since is not None:
+                self.last_reconnect_latency = time.time() - self._disconnected_since
+                self._disconnected_since = None
+            logger.info(f"MQTT connected (after {self._reconnect_failures} failed attempts, "
+                        f"{self.last_reconnect_latency:.1f}s)")
+            self._reconnect_failures = 0
+            client.reconnect_delay_set(min_delay=self.reconnect_min_delay, max_delay=self.reconnect_max_delay)
+
+            self._start_session(client)
         else:
+            # Broker refused (auth, client id...) - it closes the socket and
+            # _on_disconnect schedules the next attempt
             self.connected = False
+            self.connect_attempts += 1
             logger.error(f"MQTT connection failed with code {rc}")
 
-    def _on_disconnect(self, client, userdata, rc):
+    def _start_session(self, client):
+        """
+        Set up a new broker session (after connect or reconnect).
+
+        Args:
+            client: Connected paho client (shared in gateway mode)
+        """
+        # Republish every field after (re)connect
+        self._last_values.clear()
+        self._last_field_publish.clear()
+
+        # Publish online status
+        self._publish_online_status(True)
+
+        # Publish binary telemetry schema (retained, once per connection)
+        if self.telemetry_encoder:
+            self._publish(
+                f"{self.base_topic}/telemetry/schema",
+                self.telemetry_encoder.schema_json,
+                qos=self.config.get('qos', 1), retain=True
+            )
+
+        # Gateway channels are covered by the gateway's aggregated subscriptions
+        if not self.gateway:
+            # Subscribe to command topics
+            self._subscribe_commands()
+
+            # Home Assistant discovery: publish once, then on HA birth message
+            if self.ha_discovery:
+                client.subscribe(self.ha_discovery.status_topic, self.config.get('qos', 1))
+        if self.ha_discovery:
+            self._publish_discovery()
+
+        # Replay samples spooled during the outage
+        self.start_backfill()
+
+    def _on_connect_fail(self, client, userdata):
+        """Callback when the TCP connection to the broker could not be opened."""
+        self.connect_attempts += 1
+        if self._reconnect_failures == 0:
+            logger.warning("MQTT broker unreachable - retrying in background")
+        self._schedule_reconnect()
+
+    def _on_disconnect(self, client, userdata, rc, properties=None):
         """Callback when disconnected from broker."""
         self.connected = False
         if rc != 0:
+            if self._disconnected_since is None:
+                self._disconnected_since = time.time()
             logger.warning(f"Unexpected MQTT disconnect (code {rc})")
+            self._schedule_reconnect()
         else:
             logger.info("MQTT disconnected")
 
     def _on_message(self, client, userdata, msg):
-        """Callback when message received."""
+        """
+        Callback when message received (network thread).
+
+        Commands are looked up in the dispatch table, parsed and queued;
+        they execute on the main thread in process_commands(). Unknown
+        commands and parse errors are answered directly.
+        """
         try:
             topic = msg.topic
             payload = msg.payload.decode('utf-8').strip()
             logger.debug(f"MQTT message: {topic} = {payload}")
 
-            # Parse command topic
-            if topic == f"{self.base_topic}/cmd/start":
-                logger.info("MQTT command: START")
-                if self.on_start_callback:
-                    self.on_start_callback()
-
-            elif topic == f"{self.base_topic}/cmd/stop":
-                logger.info("MQTT command: STOP")
-                if self.on_stop_callback:
-                    self.on_stop_callback()
-
-            elif topic == f"{self.base_topic}/cmd/mode":
-                logger.info(f"MQTT command: SET MODE to {payload}")
-                if self.on_mode_callback:
-                    self.on_mode_callback(payload)
-
-            elif topic == f"{self.base_topic}/cmd/current":
-                try:
-                    current = float(payload)
-                    logger.info(f"MQTT command: SET CURRENT to {current}A")
-                    if self.on_current_callback:
-                        self.on_current_callback(current)
-                except ValueError:
-                    logger.error(f"Invalid current value: {payload}")
-
-            elif topic == f"{self.base_topic}/cmd/profile":
-                logger.info(f"MQTT command: SET PROFILE to {payload}")
-                if self.on_profile_callback:
-                    self.on_profile_callback(payload)
-
-            elif topic == f"{self.base_topic}/cmd/schedule":
-                logger.info(f"MQTT command: SCHEDULE charging")
-                try:
-                    # Parse JSON payload with schedule parameters
-                    schedule_params = json.loads(payload)
-                    if self.on_schedule_callback:
-                        self.on_schedule_callback(schedule_params)
-                except json.JSONDecodeError:
-                    logger.error(f"Invalid schedule JSON: {payload}")
-
-            elif topic == f"{self.base_topic}/cmd/schedule/cancel":
-                logger.info("MQTT command: CANCEL schedule")
-                if self.on_schedule_cancel_callback:
-                    self.on_schedule_cancel_callback()
+            # Home Assistant restarted - it lost the (retained) discovery configs
+            if self.ha_discovery and topic == self.ha_discovery.status_topic:
+                if payload == 'online':
+                    self._publish_discovery(force=True)
+                return
+
+            spec = self._commands.get(topic)
+            request = self._new_request(msg, spec.name if spec else topic[self._cmd_prefix_len:])
+            if spec is None:
+                logger.warning(f"Unknown MQTT command topic: {topic}")
+                self._reply(request, {'result': 'rejected', 'error': 'Unknown command'})
+                return
+
+            payload = self._unwrap_payload(payload, request)
+            try:
+                args = spec.parser(payload)
+            except ValueError as e:
+                logger.error(f"Invalid {spec.name} command: {e}")
+                self._reply(request, {'result': 'rejected', 'error': str(e)})
+                return
+
+            logger.info(f"MQTT command: {spec.name.upper()}{' ' + payload if args else ''}")
+            self._enqueue(request, getattr(self, spec.callback), *args)
 
         except Exception as e:
             logger.error(f"Error processing MQTT message: {e}")
 
+    def register_command(self, spec: CommandSpec):
+        """
+        Add (or replace) a command in the dispatch table.
+
+        Args:
+            spec: Command spec; its callback attribute must exist on this client
+        """
+        self._commands[f"{self.base_topic}/cmd/{spec.name}"] = spec
+
+    def _new_request(self, msg, command: str) -> CommandRequest:
+        """Create a request, taking ResponseTopic/CorrelationData from MQTT v5 properties."""
+        request = CommandRequest(command=command, handler=None)
+        properties = getattr(msg, 'properties', None)
+        response_topic = getattr(properties, 'ResponseTopic', None)
+        correlation_data = getattr(properties, 'CorrelationData', None)
+        if response_topic:
+            request.response_topic = response_topic
+        if correlation_data is not None:
+            request.correlation_data = correlation_data
+            request.correlation_id = correlation_data.decode('utf-8', errors='replace')
+        return request
+
+    def _unwrap_payload(self, payload: str, request: CommandRequest) -> str:
+        """
+        Strip request metadata from a JSON payload.
+
+        A command may be sent as JSON carrying "correlation_id" and
+        "response_topic"; the remaining "value" (or the remaining object for
+        JSON commands) is the plain payload.
+
+        Returns:
+            Payload with metadata removed
+        """
+        if not payload.startswith('{'):
+            return payload
+        try:
+            document = json.loads(payload)
+        except json.JSONDecodeError:
+            return payload
+        if not isinstance(document, dict) or not ({'correlation_id', 'response_topic'} & document.keys()):
+            return payload
+
+        correlation_id = document.pop('correlation_id', None)
+        if correlation_id is not None:
+            request.correlation_id = str(correlation_id)
+        response_topic = document.pop('response_topic', None)
+        if response_topic:
+            request.response_topic = str(response_topic)
+        if 'value' in document and len(document) == 1:
+            return str(document['value'])
+        return json.dumps(document)
+
+    def _enqueue(self, request: CommandRequest, handler: Optional[Callable], *args):
+        """Queue a parsed command for the main thread."""
+        if handler is None:
+            self._reply(request, {'result': 'rejected', 'error': 'Command not supported'})
+            return
+        request.handler = handler
+        request.args = args
+        try:
+            self.command_queue.put_nowait(request)
+        except queue.Full:
+            logger.error(f"Command queue full - rejecting {request.command}")
+            self._reply(request, {'result': 'rejected', 'error': 'Command queue full'})
+
+    def process_commands(self, timeout: float = 0.0, psu_state: Optional[Callable[[], dict]] = None) -> int:
+        """
+        Execute queued commands on the calling (main) thread.
+
+        Blocks for up to timeout seconds waiting for commands, so the main
+        loop can use it instead of sleeping and still react to a stop
+        command within milliseconds.
+
+        Args:
+            timeout: Seconds to wait for commands
+            psu_state: Callable reading back the PSU state after a command
+
+        Returns:
+            Number of commands executed
+        """
+        deadline = time.monotonic() + timeout
+        executed = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    request = self.command_queue.get(timeout=remaining)
+                else:
+                    request = self.command_queue.get_nowait()
+            except queue.Empty:
+                return executed
+            self._execute(request, psu_state)
+            executed += 1
+
+    def _execute(self, request: CommandRequest, psu_state: Optional[Callable[[], dict]]):
+        """Run one command, read back the PSU and reply with timings."""
+        started = time.monotonic()
+        error = None
+        try:
+            ok = request.handler(*request.args) is not False
+        except Exception as e:
+            ok = False
+            error = str(e)
+            logger.error(f"Command {request.command} failed: {e}")
+        executed = time.monotonic()
+
+        state = None
+        if psu_state:
+            try:
+                state = psu_state()
+            except Exception as e:
+                state = {'error': str(e)}
+        acknowledged = time.monotonic()
+
+        total = acknowledged - request.received
+        self.command_latency.add(request.command, total)
+
+        response = {
+            'result': 'ok' if ok else 'failed',
+            'psu': state,
+            'timing_ms': {
+                'queue_wait': round((started - request.received) * 1000.0, 1),
+                'execution': round((executed - started) * 1000.0, 1),
+                'psu_ack': round((acknowledged - executed) * 1000.0, 1),
+                'total': round(total * 1000.0, 1)
+            }
+        }
+        if error:
+            response['error'] = error
+        self._reply(request, response)
+
+        self._publish(f"{self.base_topic}/status/command_latency",
+                      json.dumps(self.command_latency.summary()),
+                      qos=self.config.get('qos', 1), retain=True)
+
+    def _reply(self, request: CommandRequest, response: dict):
+        """
+        Publish a command response.
+
+        Goes to the request's response topic (MQTT v5 ResponseTopic or JSON
+        "response_topic"), else <base>/response/<command>. MQTT v5
+        CorrelationData is echoed as a property.
+
+        Args:
+            request: Command request
+            response: Response fields (command, correlation_id added here)
+        """
+        document = {
+            'command': request.command,
+            'correlation_id': request.correlation_id,
+            'received_at': round(request.received_at, 3)
+        }
+        document.update(response)
+
+        topic = request.response_topic or f"{self.base_topic}/response/{request.command}"
+        properties = None
+        if self.mqtt5 and request.correlation_data is not None:
+            properties = Properties(PacketTypes.PUBLISH)
+            properties.CorrelationData = request.correlation_data
+        self._publish(topic, json.dumps(document), qos=self.config.get('qos', 1),
+                      retain=False, properties=properties)
+
     def _subscribe_commands(self):
-        """Subscribe to command topics."""
+        """Subscribe to all command topics (single wildcard subscription)."""
+        topic = f"{self.base_topic}/cmd/#"
+        self.client.subscribe(topic, self.config.get('qos', 1))
+        logger.debug(f"Subscribed to {topic}")
+
+    def set_ha_discovery(self, discovery):
+        """
+        Set (or replace) the Home Assistant discovery configs.
+
+        A replacement is only published if its schema hash differs from
+        what is already on the broker; removed entities are cleared.
+
+        Args:
+            discovery: HADiscovery instance
+        """
+        if self.ha_discovery:
+            discovery.inherit(self.ha_discovery)
+        self.ha_discovery = discovery
+        if self.gateway:
+            self.gateway.subscribe_ha_status(discovery.status_topic)
+        elif self.connected:
+            self.client.subscribe(discovery.status_topic, self.config.get('qos', 1))
+        if self.connected:
+            self._publish_discovery()
+
+    def _publish_discovery(self, force: bool = False):
+        """Publish pending discovery configs (retained)."""
+        discovery = self.ha_discovery
+        messages = discovery.pending(force)
+        if not messages:
+            return
+
         qos = self.config.get('qos', 1)
-        topics = [
-            (f"{self.base_topic}/cmd/start", qos),
-            (f"{self.base_topic}/cmd/stop", qos),
-            (f"{self.base_topic}/cmd/mode", qos),
-            (f"{self.base_topic}/cmd/current", qos),
-            (f"{self.base_topic}/cmd/profile", qos),
-            (f"{self.base_topic}/cmd/schedule", qos),
-            (f"{self.base_topic}/cmd/schedule/cancel", qos),
-        ]
-
-        for topic, topic_qos in topics:
-            self.client.subscribe(topic, topic_qos)
-            logger.debug(f"Subscribed to {topic}")
+        failed = 0
+        for topic, payload in messages:
+            if not self._publish(topic, payload, qos=qos, retain=True):
+                failed += 1
+        if failed:
+            logger.warning(f"Home Assistant discovery incomplete ({failed} configs not published)")
+            return
+        discovery.mark_published()
+        logger.info(f"Published {len(messages)} Home Assistant discovery configs "
+                    f"(schema {discovery.schema_hash[:8]})")
 
     def _publish_online_status(self, online: bool):
         """Publish online/offline status."""
@@ -211,22 +632,98 @@ class ChargerMQTTClient:
         retain = self.config.get('retain', True)
         self._publish(topic, payload, qos=qos, retain=retain)
 
-    def _publish(self, topic: str, payload: str, qos: int = 1, retain: bool = False):
+    def _publish(
+        self,
+        topic: str,
+        payload,
+        qos: int = 1,
+        retain: bool = False,
+        telemetry: bool = False,
+        properties: Optional[Properties] = None,
+        pending: Optional[dict] = None
+    ) -> bool:
         """
         Publish message to topic.
 
         Args:
             topic: MQTT topic
-            payload: Message payload
+            payload: Message payload (str or bytes)
             qos: Quality of Service
             retain: Retain flag
+            telemetry: High-rate telemetry (MQTT v5: telemetry_qos, topic
+                alias and message expiry)
+            properties: MQTT v5 publish properties
+            pending: Status sample this message belongs to (gateway mode:
+                spooled if the batch publish fails, see _on_publish_failed)
+
+        Returns:
+            True if the message was handed to the client (gateway mode:
+            queued for the gateway's next batch)
         """
+        if self.gateway:
+            if not (self.connected and self.gateway.submit(
+                    topic, payload, qos, retain, telemetry, properties, channel=self, pending=pending)):
+                return False
+            self.publish_count += 1
+            self.publish_bytes += len(topic) + (
+                len(payload) if isinstance(payload, bytes) else len(payload.encode('utf-8'))
+            )
+            return True
+
         if self.client and self.connected:
             try:
-                self.client.publish(topic, payload, qos=qos, retain=retain)
+                wire_topic = topic
+                if telemetry and self.mqtt5:
+                    qos = self.telemetry_qos
+                    wire_topic, properties = self._telemetry_properties(topic, qos)
+                info = self.client.publish(wire_topic, payload, qos=qos, retain=retain, properties=properties)
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    logger.debug(f"Publish to {topic} failed (rc {info.rc})")
+                    return False
+                self.publish_count += 1
+                self.publish_bytes += len(wire_topic) + (
+                    len(payload) if isinstance(payload, bytes) else len(payload.encode('utf-8'))
+                )
                 logger.debug(f"Published: {topic} = {payload}")
+                return True
             except Exception as e:
                 logger.error(f"Failed to publish to {topic}: {e}")
+        return False
+
+    def _telemetry_properties(self, topic: str, qos: int):
+        """
+        Build MQTT v5 properties for a telemetry publish.
+
+        The first publish on a topic sends the full name and registers an
+        alias; later QoS 0 publishes send an empty topic plus the 2-byte
+        alias. QoS 1/2 messages always carry the full topic and no alias:
+        paho may retransmit them on a new connection, where the alias
+        mapping no longer exists.
+
+        Args:
+            topic: Full topic name
+            qos: QoS of the publish
+
+        Returns:
+            (topic to send, Properties)
+        """
+        properties = Properties(PacketTypes.PUBLISH)
+        if self.message_expiry > 0:
+            properties.MessageExpiryInterval = self.message_expiry
+        if qos > 0:
+            return topic, properties
+
+        alias = self._topic_aliases.get(topic)
+        if alias is not None:
+            properties.TopicAlias = alias
+            self.aliased_count += 1
+            return '', properties
+
+        if len(self._topic_aliases) < self._alias_maximum:
+            alias = len(self._topic_aliases) + 1
+            self._topic_aliases[topic] = alias
+            properties.TopicAlias = alias
+        return topic, properties
 
     def publish_status(self, status: dict):
         """
@@ -235,9 +732,6 @@ class ChargerMQTTClient:
         Args:
             status: Status dictionary from charging mode
         """
-        if not self.connected:
-            return
-
         # Check update interval
         update_interval = self.config.get('update_interval', 5.0)
         now = time.time()
@@ -246,6 +740,16 @@ class ChargerMQTTClient:
 
         self.last_publish_time = now
 
+        # Broker unreachable - keep the sample on disk for backfill
+        if not self.connected:
+            if self.spool:
+                self.spool.append(now, 'json', json.dumps(self._json_status(status, now)))
+            return
+
+        # Spooled instead if the connection drops while the sample is in flight
+        pending = {'timestamp': now, 'status': status} if self.spool else None
+        failed = False
+
         # Publish individual status fields
         qos = self.config.get('qos', 1)
         retain = self.config.get('retain', True)
@@ -262,24 +766,269 @@ class ChargerMQTTClient:
             'progress': int(status.get('progress', 0)),
             'ah_delivered': round(status.get('ah_delivered', 0.0), 3),
             'wh_delivered': round(status.get('wh_delivered', 0.0), 2),
-            'ah_stored': round(status.get('ah_stored', 0.0), 3)
+            'ah_stored': round(status.get('ah_stored', 0.0), 3),
+            'current_setpoint': round(status.get('current_setpoint') or 0.0, 3)
         }
 
+        heartbeat = self.heartbeat_interval
+        changed = False
         for key, value in fields.items():
+            if not self._field_changed(key, value, now):
+                self.suppressed_count += 1
+                continue
             topic = f"{self.base_topic}/status/{key}"
-            self._publish(topic, str(value), qos=qos, retain=retain)
+            changed = True
+            if not self._publish(topic, str(value), qos=qos, retain=retain, telemetry=True, pending=pending):
+                # Not delivered - keep comparing against what subscribers last saw
+                failed = True
+                continue
+            self._last_values[key] = value
+            self._last_field_publish[key] = now
+
+        # JSON document only when something changed (or heartbeat)
+        if not changed and now - self._last_json_publish < heartbeat:
+            self.suppressed_count += 1
+            if failed:
+                self._spool_pending(pending)
+            return
+        self._last_json_publish = now
+
+        # Compact binary frame (versioned fixed layout)
+        if self.telemetry_encoder:
+            if not self._publish(
+                f"{self.base_topic}/telemetry/bin",
+                self.telemetry_encoder.encode(status, now),
+                qos=qos, retain=False, telemetry=True, pending=pending
+            ):
+                failed = True
+
+        # Publish statistics once per heartbeat
+        if now - self._last_stats_publish >= heartbeat:
+            self._last_stats_publish = now
+            self._publish(
+                f"{self.base_topic}/status/publish_stats",
+                json.dumps(self.get_publish_stats()),
+                qos=qos, retain=False
+            )
+
+        if self.json_status_enabled:
+            # Also publish as JSON for convenience (with rounded values)
+            json_topic = f"{self.base_topic}/status/json"
+            json_payload = json.dumps(self._json_status(status))
+            if not self._publish(json_topic, json_payload, qos=qos, retain=False,
+                                 telemetry=True, pending=pending):
+                failed = True
+
+        if failed:
+            self._spool_pending(pending)
+
+    def _spool_pending(self, pending: Optional[dict]):
+        """
+        Spool a status sample whose publish failed.
+
+        Spools each sample once, however many of its messages failed
+        (dict.pop is atomic, so the gateway flusher and the main thread
+        cannot both spool it).
+
+        Args:
+            pending: Sample from publish_status (None: spool disabled)
+        """
+        status = pending.pop('status', None) if pending else None
+        if status is None or not self.spool:
+            return
+        timestamp = pending['timestamp']
+        self.spool.append(timestamp, 'json', json.dumps(self._json_status(status, timestamp)))
+        logger.debug("Status sample spooled after a failed publish")
+
+    def _on_publish_failed(self, topic: str, pending: Optional[dict]):
+        """
+        Handle a queued message the gateway could not publish.
+
+        A status field is forgotten by the deadband so its next value is
+        published even if unchanged.
+
+        Args:
+            topic: Full MQTT topic
+            pending: Status sample the message belongs to (or None)
+        """
+        prefix = f"{self.base_topic}/status/"
+        if topic.startswith(prefix):
+            self._last_values.pop(topic[len(prefix):], None)
+        self._spool_pending(pending)
+
+    def _json_status(self, status: dict, timestamp: Optional[float] = None) -> dict:
+        """
+        Build the JSON status document (rounded values).
 
-        # Also publish as JSON for convenience (with rounded values)
+        Args:
+            status: Status dictionary from charging mode
+            timestamp: Sample time to embed (spooled samples)
+
+        Returns:
+            JSON-serializable dictionary
+        """
         json_status = status.copy()
         json_status['elapsed'] = round(json_status.get('elapsed', 0), 1)  # Round to 0.1s
         json_status['progress'] = round(json_status.get('progress', 0), 1)  # Round to 0.1%
         json_status['ah_delivered'] = round(json_status.get('ah_delivered', 0.0), 3)  # 3 decimals
         json_status['wh_delivered'] = round(json_status.get('wh_delivered', 0.0), 2)  # 2 decimals
         json_status['ah_stored'] = round(json_status.get('ah_stored', 0.0), 3)  # 3 decimals
+        if timestamp is not None:
+            json_status['timestamp'] = round(timestamp, 3)
+        return json_status
+
+    def start_backfill(self):
+        """Replay spooled samples in a background thread (no-op if idle or empty)."""
+        if not self.spool or self.spool.is_empty():
+            return
+        if self._backfill_thread and self._backfill_thread.is_alive():
+            return
 
-        json_topic = f"{self.base_topic}/status/json"
-        json_payload = json.dumps(json_status)
-        self._publish(json_topic, json_payload, qos=qos, retain=False)
+        self._backfill_stop.clear()
+        self._backfill_thread = threading.Thread(
+            target=self._backfill_loop, name='mqtt-backfill', daemon=True
+        )
+        self._backfill_thread.start()
+
+    def _backfill_loop(self):
+        """
+        Publish spooled samples oldest-first to <base>/backfill/<topic>.
+
+        Rate limited to backfill_rate messages/s so live telemetry and
+        commands are not starved. Records are only removed from the spool
+        once handed to the client; a new disconnect leaves the rest queued.
+        """
+        spool = self.spool  # disconnect() may drop the reference
+        qos = self.config.get('qos', 1)
+        interval = 1.0 / self.backfill_rate if self.backfill_rate > 0 else 0.0
+        pending = spool.count
+        sent = 0
+        logger.info(f"Backfilling {pending} spooled samples ({self.backfill_rate:.0f} msg/s)")
+
+        while self.connected and not self._backfill_stop.is_set():
+            batch = spool.peek(50)
+            if not batch:
+                break
+
+            last_id = None
+            for record_id, _, topic, payload in batch:
+                if not self._publish(f"{self.base_topic}/backfill/{topic}", payload, qos=qos, retain=False):
+                    break
+                last_id = record_id
+                sent += 1
+                if self._backfill_stop.wait(interval):
+                    break
+
+            if last_id is None:
+                break
+            spool.ack(last_id)
+
+        self.backfill_count += sent
+        logger.info(f"Backfill {'complete' if spool.is_empty() else 'paused'}: "
+                    f"{sent} samples sent, {spool.count} pending")
+
+    def _field_changed(self, key: str, value, now: float) -> bool:
+        """
+        Check whether a status field must be republished.
+
+        Args:
+            key: Field name
+            value: Current value
+            now: Current timestamp
+
+        Returns:
+            True if value left its deadband, changed, or heartbeat expired
+        """
+        if key not in self._last_values:
+            return True
+        if now - self._last_field_publish.get(key, 0.0) >= self.heartbeat_interval:
+            return True
+
+        last = self._last_values[key]
+        deadband = self.deadbands.get(key)
+        if deadband is None or isinstance(value, str) or isinstance(last, str):
+            return value != last
+        return abs(value - last) >= deadband
+
+    def get_publish_stats(self) -> dict:
+        """
+        Get publish statistics.
+
+        Returns:
+            Dictionary with message/byte counts and suppressed updates
+        """
+        stats = {
+            'published': self.publish_count,
+            'bytes': self.publish_bytes,
+            'suppressed': self.suppressed_count
+        }
+        if self.spool:
+            stats['spool'] = self.spool.get_stats()
+            stats['backfilled'] = self.backfill_count
+        stats['connection'] = self.get_connection_stats()
+        if self.mqtt5:
+            stats['aliased'] = self.aliased_count
+        return stats
+
+    def get_connection_stats(self) -> dict:
+        """
+        Get connection statistics.
+
+        Returns:
+            Dictionary with connect/failed attempt counts and reconnect latency
+        """
+        if self.gateway:
+            return self.gateway.get_connection_stats()
+        return {
+            'connects': self.connect_count,
+            'failed_attempts': self.connect_attempts,
+            'reconnects': max(0, self.connect_count - 1),
+            'last_reconnect_latency': round(self.last_reconnect_latency, 2)
+        }
+
+    def publish_stream_frame(self, frame: str):
+        """
+        Publish a batched waveform frame (QoS 0 - a lost frame is not resent).
+
+        Args:
+            frame: JSON frame from WaveformStreamer
+        """
+        self._publish(f"{self.base_topic}/stream/vi", frame, qos=0, retain=False, telemetry=True)
+
+    def publish_stream_state(self, state: dict):
+        """
+        Publish waveform stream state (after cmd/stream and on auto-off).
+
+        Args:
+            state: WaveformStreamer status
+        """
+        self._publish(f"{self.base_topic}/stream/state", json.dumps(state),
+                      qos=self.config.get('qos', 1), retain=False)
+
+    def publish_health(self, health: dict):
+        """
+        Publish the battery health estimate (retained, after each session).
+
+        Args:
+            health: BatteryHealthEngine.refit() result
+        """
+        self._publish(f"{self.base_topic}/status/health", json.dumps(health),
+                      qos=self.config.get('qos', 1), retain=True)
+
+    def publish_event(self, event_type: str, event: dict):
+        """
+        Publish an event (e.g. anomaly) as JSON.
+
+        Args:
+            event_type: Event type, used as topic suffix (events/<type>)
+            event: Event data
+        """
+        if not self.connected:
+            return
+
+        qos = self.config.get('qos', 1)
+        topic = f"{self.base_topic}/events/{event_type}"
+        self._publish(topic, json.dumps(event), qos=qos, retain=False)
 
     def set_command_callbacks(
         self,
@@ -289,7 +1038,8 @@ class ChargerMQTTClient:
         on_current: Optional[Callable[[float], None]] = None,
         on_profile: Optional[Callable[[str], None]] = None,
         on_schedule: Optional[Callable[[dict], None]] = None,
-        on_schedule_cancel: Optional[Callable] = None
+        on_schedule_cancel: Optional[Callable] = None,
+        on_stream: Optional[Callable[[dict], None]] = None
     ):
         """
         Set callbacks for MQTT commands.
@@ -301,7 +1051,8 @@ class ChargerMQTTClient:
             on_current: Callback for current change (receives current value)
             on_profile: Callback for battery profile change (receives profile name)
             on_schedule: Callback for scheduling charge (receives schedule params dict)
-            on_schedule_cancel: Callback for canceling schedule
+            on_schedule_cancel: Callback for canceling schedule (receives optional job id)
+            on_stream: Callback for waveform stream control (receives params dict)
         """
         self.on_start_callback = on_start
         self.on_stop_callback = on_stop
@@ -310,6 +1061,7 @@ class ChargerMQTTClient:
         self.on_profile_callback = on_profile
         self.on_schedule_callback = on_schedule
         self.on_schedule_cancel_callback = on_schedule_cancel
+        self.on_stream_callback = on_stream
 
     def is_connected(self) -> bool:
         """Check if connected to broker."""
@@ -0,0 +1,194 @@
+"""
+MQTT command table, requests and latency metrics.
+
+All commands live under <base_topic>/cmd/ and are received through a single
+cmd/# subscription. COMMAND_SPECS maps each command to a payload parser and
+the client attribute holding its handler; ChargerMQTTClient turns it into a
+topic -> spec dictionary once, so dispatch is one dict lookup per message.
+JSON commands declare a schema (allowed keys and types) that is checked
+before the command is queued.
+
+Commands arrive on paho's network thread but must not touch the PSU there:
+the control loop owns it. Each command is parsed into a CommandRequest,
+queued, and executed by the main loop (see ChargerMQTTClient.process_commands).
+The reply reports how long the command waited in the queue, how long it
+took to execute and how long the PSU took to confirm the resulting state.
+"""
+
+import json
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Latency samples kept per command for percentiles
+LATENCY_WINDOW = 200
+PERCENTILES = (50, 90, 99)
+
+
+def parse_none(payload: str) -> tuple:
+    """Command without arguments (payload ignored)."""
+    return ()
+
+
+def parse_job_id(payload: str) -> tuple:
+    """Optional integer job id (empty payload: no argument)."""
+    if not payload.strip():
+        return ()
+    try:
+        return (int(payload),)
+    except ValueError:
+        raise ValueError(f"Invalid job id: {payload}")
+
+
+def parse_string(payload: str) -> tuple:
+    """Non-empty string argument."""
+    if not payload:
+        raise ValueError("Empty payload")
+    return (payload,)
+
+
+def parse_current(payload: str) -> tuple:
+    """Current in A (finite, >= 0)."""
+    try:
+        value = float(payload)
+    except ValueError:
+        raise ValueError(f"Invalid current value: {payload}")
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(f"Invalid current value: {payload}")
+    return (value,)
+
+
+def json_object_parser(schema: Dict[str, tuple]) -> Callable[[str], tuple]:
+    """
+    Create a parser for a JSON object payload.
+
+    Args:
+        schema: Allowed keys mapped to accepted Python types
+
+    Returns:
+        Parser returning (dict,)
+    """
+    def parse(payload: str) -> tuple:
+        try:
+            document = json.loads(payload)
+        except json.JSONDecodeError:
+            raise ValueError(f"Invalid JSON: {payload}")
+        if not isinstance(document, dict):
+            raise ValueError("Expected a JSON object")
+        for key, value in document.items():
+            types = schema.get(key)
+            if types is None:
+                raise ValueError(f"Unknown field '{key}' (valid: {', '.join(schema)})")
+            # bool is an int subclass - only accept it where declared
+            if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+                names = '/'.join(t.__name__ for t in types)
+                raise ValueError(f"Field '{key}' must be {names}")
+        return (document,)
+    return parse
+
+
+SCHEDULE_SCHEMA = {
+    'start_time': (str,),
+    'duration': (str, int, float),
+    'profile': (str,),
+    'mode': (str,),
+    'ah_target': (int, float),
+    'cron': (str,),
+    'every_days': (int, float),
+}
+
+STREAM_SCHEMA = {
+    'enabled': (bool,),
+    'rate': (int, float),
+    'frame_interval': (int, float),
+    'timeout': (int, float),
+}
+
+_parse_stream_object = json_object_parser(STREAM_SCHEMA)
+
+
+def parse_stream(payload: str) -> tuple:
+    """Either "on"/"off" or a STREAM_SCHEMA object."""
+    switch = payload.lower()
+    if switch in ('on', 'true', '1'):
+        return ({'enabled': True},)
+    if switch in ('off', 'false', '0'):
+        return ({'enabled': False},)
+    return _parse_stream_object(payload)
+
+
+@dataclass(frozen=True)
+class CommandSpec:
+    """One MQTT command."""
+    name: str  # Topic suffix after cmd/
+    parser: Callable[[str], tuple]  # payload -> handler args, raises ValueError
+    callback: str  # ChargerMQTTClient attribute holding the handler
+
+
+COMMAND_SPECS = (
+    CommandSpec('start', parse_none, 'on_start_callback'),
+    CommandSpec('stop', parse_none, 'on_stop_callback'),
+    CommandSpec('mode', parse_string, 'on_mode_callback'),
+    CommandSpec('current', parse_current, 'on_current_callback'),
+    CommandSpec('profile', parse_string, 'on_profile_callback'),
+    CommandSpec('schedule', json_object_parser(SCHEDULE_SCHEMA), 'on_schedule_callback'),
+    CommandSpec('schedule/cancel', parse_job_id, 'on_schedule_cancel_callback'),
+    CommandSpec('stream', parse_stream, 'on_stream_callback'),
+)
+
+
+@dataclass
+class CommandRequest:
+    """One received command, waiting for execution on the main thread."""
+    command: str  # Topic suffix after cmd/ (e.g. "stop", "schedule/cancel")
+    handler: Optional[Callable]  # Registered callback
+    args: Tuple[Any, ...] = ()
+    correlation_id: Optional[str] = None
+    response_topic: Optional[str] = None
+    correlation_data: Optional[bytes] = None  # MQTT v5 CorrelationData (echoed)
+    received: float = field(default_factory=time.monotonic)
+    received_at: float = field(default_factory=time.time)  # Wall clock for clients
+
+
+class CommandLatencyTracker:
+    """Sliding-window latency percentiles per command."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+
+    def add(self, command: str, latency: float):
+        """
+        Record one end-to-end latency.
+
+        Args:
+            command: Command name
+            latency: Seconds from receipt to PSU acknowledgement
+        """
+        samples = self._samples.get(command)
+        if samples is None:
+            samples = self._samples[command] = deque(maxlen=self.window)
+        samples.append(latency)
+        self._counts[command] = self._counts.get(command, 0) + 1
+
+    def summary(self) -> dict:
+        """
+        Get percentile summary (nearest rank over the window).
+
+        Returns:
+            {command: {count, p50_ms, p90_ms, p99_ms, max_ms}}
+        """
+        result = {}
+        for command, samples in self._samples.items():
+            ordered = sorted(samples)
+            n = len(ordered)
+            stats = {'count': self._counts[command]}
+            for p in PERCENTILES:
+                rank = max(0, min(n - 1, -(-p * n // 100) - 1))
+                stats[f'p{p}_ms'] = round(ordered[rank] * 1000.0, 1)
+            stats['max_ms'] = round(ordered[-1] * 1000.0, 1)
+            result[command] = stats
+        return result
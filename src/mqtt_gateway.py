@@ -0,0 +1,328 @@
+"""
+Multi-charger MQTT gateway: one broker connection for several chargers.
+
+Each charger (channel) gets an ordinary ChargerMQTTClient namespaced under
+<base_topic>/<channel>/..., but none of them opens a connection of its own.
+The gateway owns the single paho client, session and reconnect backoff:
+
+- one client ID and one broker session per process, however many PSUs
+- aggregated subscriptions: <base>/+/cmd/# and the Home Assistant status
+  topic are subscribed once and routed to channels by topic
+- batched publishes: channels queue messages; a flusher thread hands them
+  to paho every batch_interval seconds, dropping retained messages that a
+  newer message on the same topic superseded within the batch
+
+Gateway availability is <base>/gateway/online (the connection's Last Will);
+each channel still publishes <base>/<channel>/status/online itself.
+"""
+
+import re
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from mqtt_client import ChargerMQTTClient
+
+logger = logging.getLogger(__name__)
+
+# Channel names become a topic level; "gateway" is the gateway's own level
+CHANNEL_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+RESERVED_CHANNELS = ('gateway',)
+
+DEFAULT_BATCH_INTERVAL = 0.05  # s
+DEFAULT_BATCH_SIZE = 200  # Messages that trigger an early flush
+
+
+class MQTTGateway(ChargerMQTTClient):
+    """Shared broker connection routing topics to per-channel clients."""
+
+    def __init__(self, config: dict):
+        """
+        Initialize gateway.
+
+        Args:
+            config: MQTT configuration dictionary (broker, credentials,
+                protocol, base_topic); the optional 'gateway' section holds
+                batch_interval and batch_size
+        """
+        base_topic = config.get('base_topic', 'battery-charger')
+        gateway_config = dict(config)
+        gateway_config['lwt_topic'] = f"{base_topic}/gateway/online"
+        gateway_config['spool'] = {'enabled': False}  # Channels spool their own samples
+        super().__init__(gateway_config)
+
+        self._commands.clear()  # Commands belong to the channels
+        self.channels: Dict[str, ChargerMQTTClient] = {}  # Attached channels
+        self._channel_names = set()
+        self._channels_lock = threading.Lock()
+        self._ha_status_topics: List[str] = []
+
+        batch_config = config.get('gateway', {})
+        self.batch_interval = float(batch_config.get('batch_interval', DEFAULT_BATCH_INTERVAL))
+        self.batch_size = int(batch_config.get('batch_size', DEFAULT_BATCH_SIZE))
+        self._outbox: List[tuple] = []
+        self._outbox_lock = threading.Lock()
+        self._send_lock = threading.Lock()  # Serializes paho publishes (topic alias table)
+        self._flush_wakeup = threading.Event()
+        self._flush_stop = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+        self.batch_count = 0
+        self.coalesced_count = 0
+
+    def add_channel(self, name: str, config: Optional[dict] = None) -> ChargerMQTTClient:
+        """
+        Create a channel client sharing this gateway's connection.
+
+        Connection settings in the channel config (broker, client_id,
+        protocol, base_topic) are overridden by the gateway; publishing,
+        spool, deadband and discovery settings are per channel. The spool
+        file gets the channel name as suffix.
+
+        Args:
+            name: Channel name (topic level under base_topic)
+            config: The charger's MQTT configuration dictionary
+
+        Returns:
+            Channel client (call connect() to attach it)
+
+        Raises:
+            ValueError: If the name is invalid or already in use
+        """
+        if not CHANNEL_NAME.match(name) or name in RESERVED_CHANNELS:
+            raise ValueError(f"Invalid gateway channel name '{name}' (letters, digits, '_' and '-' only)")
+        if name in self._channel_names:
+            raise ValueError(f"Gateway channel '{name}' already exists")
+
+        channel_config = dict(config or {})
+        channel_config['base_topic'] = f"{self.base_topic}/{name}"
+        channel_config['protocol'] = '5' if self.mqtt5 else '3.1.1'
+        channel_config.pop('lwt_topic', None)
+        spool_config = dict(channel_config.get('spool') or {})
+        spool_path = Path(spool_config.get('path', 'telemetry_spool.db'))
+        spool_config['path'] = str(spool_path.with_name(f"{spool_path.stem}_{name}{spool_path.suffix}"))
+        channel_config['spool'] = spool_config
+
+        channel = ChargerMQTTClient(channel_config, gateway=self)
+        channel.channel_name = name
+        self._channel_names.add(name)
+        logger.info(f"Gateway channel '{name}' -> {channel.base_topic}")
+        return channel
+
+    def attach(self, channel: ChargerMQTTClient) -> bool:
+        """
+        Attach a channel to the shared connection (its connect()).
+
+        Starts the gateway connection on first use; if the broker is
+        already connected the channel's session starts immediately.
+
+        Args:
+            channel: Channel client created by add_channel()
+
+        Returns:
+            True if the connection process was started
+        """
+        with self._channels_lock:
+            self.channels[channel.channel_name] = channel
+        if self.connected and not channel.connected:
+            self._start_channel(channel, self.client)
+        return self.connect()
+
+    def detach(self, channel: ChargerMQTTClient):
+        """
+        Remove a channel (its disconnect()). Flushes its queued messages.
+
+        Args:
+            channel: Channel client
+        """
+        self._flush()
+        with self._channels_lock:
+            self.channels.pop(channel.channel_name, None)
+        channel.connected = False
+        logger.info(f"Gateway channel '{channel.channel_name}' detached")
+
+    def subscribe_ha_status(self, topic: str):
+        """
+        Subscribe to a Home Assistant status topic once for all channels.
+
+        Args:
+            topic: HA birth/will topic (e.g. homeassistant/status)
+        """
+        if topic in self._ha_status_topics:
+            return
+        self._ha_status_topics.append(topic)
+        if self.connected:
+            self.client.subscribe(topic, self.config.get('qos', 1))
+
+    def connect(self) -> bool:
+        """Start the shared connection and the batch flusher (non-blocking)."""
+        if self.batch_interval > 0 and not (self._flush_thread and self._flush_thread.is_alive()):
+            self._flush_stop.clear()
+            self._flush_thread = threading.Thread(target=self._flush_loop, name='mqtt-gateway-flush', daemon=True)
+            self._flush_thread.start()
+        return super().connect()
+
+    def disconnect(self):
+        """Detach all channels, flush and close the shared connection."""
+        if not self._loop_started:
+            return
+        with self._channels_lock:
+            channels = list(self.channels.values())
+        for channel in channels:
+            channel.disconnect()
+
+        self._flush_stop.set()
+        self._flush_wakeup.set()
+        if self._flush_thread:
+            self._flush_thread.join(timeout=2.0)
+        self._flush()
+        super().disconnect()
+
+    def _start_session(self, client):
+        """Publish gateway availability, subscribe once and start every channel."""
+        self._publish_online_status(True)
+
+        qos = self.config.get('qos', 1)
+        subscriptions = [(f"{self.base_topic}/+/cmd/#", qos)]
+        subscriptions.extend((topic, qos) for topic in self._ha_status_topics)
+        client.subscribe(subscriptions)
+        logger.debug(f"Gateway subscribed to {', '.join(topic for topic, _ in subscriptions)}")
+
+        with self._channels_lock:
+            channels = list(self.channels.values())
+        for channel in channels:
+            self._start_channel(channel, client)
+        logger.info(f"Gateway session started for {len(channels)} channel(s)")
+
+    def _start_channel(self, channel: ChargerMQTTClient, client):
+        """Mark a channel connected and run its session setup."""
+        channel.client = client
+        channel.connected = True
+        try:
+            channel._start_session(client)
+        except Exception as e:
+            logger.error(f"Gateway channel '{channel.channel_name}' session setup failed: {e}")
+
+    def _on_disconnect(self, client, userdata, rc, properties=None):
+        """Connection lost - every channel is offline (and spools) until reconnect."""
+        super()._on_disconnect(client, userdata, rc, properties)
+        with self._channels_lock:
+            for channel in self.channels.values():
+                channel.connected = False
+
+    def _on_message(self, client, userdata, msg):
+        """Route a message to its channel (<base>/<channel>/...) or to all channels."""
+        topic = msg.topic
+        if topic in self._ha_status_topics:
+            with self._channels_lock:
+                channels = list(self.channels.values())
+            for channel in channels:
+                if channel.ha_discovery and channel.ha_discovery.status_topic == topic:
+                    channel._on_message(client, userdata, msg)
+            return
+
+        name = topic[len(self.base_topic) + 1:].split('/', 1)[0]
+        channel = self.channels.get(name)
+        if channel is None:
+            logger.warning(f"MQTT message for unknown gateway channel '{name}': {topic}")
+            return
+        channel._on_message(client, userdata, msg)
+
+    def submit(self, topic: str, payload, qos: int, retain: bool,
+               telemetry: bool = False, properties=None,
+               channel: Optional[ChargerMQTTClient] = None, pending: Optional[dict] = None) -> bool:
+        """
+        Queue a channel's message for the next batch.
+
+        Args:
+            topic: Full MQTT topic
+            payload: Message payload (str or bytes)
+            qos: Quality of Service
+            retain: Retain flag
+            telemetry: High-rate telemetry (MQTT v5 alias/expiry)
+            properties: MQTT v5 publish properties
+            channel: Submitting channel (told if the batch publish fails)
+            pending: Channel status sample the message belongs to
+
+        Returns:
+            True if queued (or published, with batching disabled)
+        """
+        if not self.connected:
+            return False
+        if not self.mqtt5:
+            properties = None
+        if self.batch_interval <= 0:
+            with self._send_lock:
+                return self._publish(topic, payload, qos=qos, retain=retain,
+                                     telemetry=telemetry, properties=properties)
+
+        with self._outbox_lock:
+            self._outbox.append((topic, payload, qos, retain, telemetry, properties, channel, pending))
+            full = len(self._outbox) >= self.batch_size
+        if full:
+            self._flush_wakeup.set()
+        return True
+
+    def _flush_loop(self):
+        """Hand queued messages to paho every batch_interval (background thread)."""
+        while not self._flush_stop.is_set():
+            self._flush_wakeup.wait(self.batch_interval)
+            self._flush_wakeup.clear()
+            self._flush()
+
+    def _flush(self):
+        """
+        Publish the current batch in order.
+
+        A retained message followed by a newer retained message on the
+        same topic in the same batch is dropped: the broker would only keep
+        the newer one anyway. Messages that fail (connection lost after they
+        were queued) are handed back to their channel, which spools the
+        status sample they belong to.
+        """
+        with self._outbox_lock:
+            batch, self._outbox = self._outbox, []
+        if not batch:
+            return
+
+        last_retained = {}
+        for index, message in enumerate(batch):
+            if message[3]:
+                last_retained[message[0]] = index
+
+        sent = 0
+        failed = []
+        with self._send_lock:
+            for index, (topic, payload, qos, retain, telemetry, properties, channel, pending) in enumerate(batch):
+                if retain and last_retained[topic] != index:
+                    self.coalesced_count += 1
+                    continue
+                if self._publish(topic, payload, qos=qos, retain=retain,
+                                 telemetry=telemetry, properties=properties):
+                    sent += 1
+                elif channel is not None:
+                    failed.append((channel, topic, pending))
+        self.batch_count += 1
+        for channel, topic, pending in failed:
+            try:
+                channel._on_publish_failed(topic, pending)
+            except Exception as e:
+                logger.error(f"Gateway channel '{channel.channel_name}' failed-publish handling: {e}")
+        if sent < len(batch):
+            logger.debug(f"Gateway batch: {sent}/{len(batch)} messages published")
+
+    def get_gateway_stats(self) -> dict:
+        """
+        Get gateway statistics.
+
+        Returns:
+            Dictionary with channels, batch counts and connection statistics
+        """
+        return {
+            'channels': sorted(self.channels),
+            'published': self.publish_count,
+            'bytes': self.publish_bytes,
+            'batches': self.batch_count,
+            'coalesced': self.coalesced_count,
+            'connection': self.get_connection_stats()
+        }
@@ -6,10 +6,24 @@ Tested with SPE6205 (62V 5A)
 import serial
 import time
 import logging
-from typing import Optional
+import threading
+from typing import Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+MEAS_ALL_MAX_FAILURES = 3  # Consecutive bad MEAS:ALL? replies before giving up on it
+MEAS_ALL_PROBE_TIMEOUT = 1.0  # s - serial timeout while probing MEAS:ALL? on connect
+
+
+def _parse_values(response: str) -> Optional[list]:
+    """Parse a comma-separated numeric reply, None if empty or not numeric."""
+    if not response:
+        return None
+    try:
+        return [float(value) for value in response.split(',')]
+    except ValueError:
+        return None
+
 
 class OwonPSU:
     """OWON Power Supply SCPI interface."""
@@ -28,6 +42,10 @@ class OwonPSU:
         self.timeout = timeout
         self.serial: Optional[serial.Serial] = None
         self._connected = False
+        # Serializes SCPI transactions (control loop + waveform sampler thread)
+        self._lock = threading.RLock()
+        self._meas_all_supported = False  # MEAS:ALL? (V and I in one round trip), probed on connect
+        self._meas_all_failures = 0  # Consecutive bad MEAS:ALL? replies
 
     def connect(self) -> bool:
         """
@@ -53,6 +71,7 @@ class OwonPSU:
             identity = self.identify()
             if identity:
                 logger.info(f"Connected to: {identity}")
+                self._probe_meas_all()
                 return True
             else:
                 logger.error("Failed to get device identity")
@@ -89,9 +108,10 @@ class OwonPSU:
             raise RuntimeError("Not connected to PSU")
 
         cmd_bytes = f"{command}\n".encode('utf-8')
-        self.serial.write(cmd_bytes)
-        self.serial.flush()
-        time.sleep(0.05)  # Small delay for command processing
+        with self._lock:
+            self.serial.write(cmd_bytes)
+            self.serial.flush()
+            time.sleep(0.05)  # Small delay for command processing
 
     def _query(self, command: str) -> str:
         """
@@ -106,14 +126,17 @@ class OwonPSU:
         if not self.is_connected():
             raise RuntimeError("Not connected to PSU")
 
-        # Clear any pending data
-        self.serial.reset_input_buffer()
+        with self._lock:
+            # Clear any pending data
+            self.serial.reset_input_buffer()
 
-        # Send query
-        self._send_command(command)
+            # Send query - no settle delay: readline() waits for the reply,
+            # which the PSU only sends once the query is processed
+            self.serial.write(f"{command}\n".encode('utf-8'))
+            self.serial.flush()
 
-        # Read response
-        response = self.serial.readline().decode('utf-8').strip()
+            # Read response
+            response = self.serial.readline().decode('utf-8').strip()
         return response
 
     # Device Information
@@ -130,6 +153,41 @@ class OwonPSU:
             logger.error(f"Failed to identify device: {e}")
             return ""
 
+    def _probe_meas_all(self):
+        """
+        Check once, on connect, whether the firmware answers MEAS:ALL?.
+
+        Uses a short serial timeout so firmware that silently ignores the
+        command does not stall the connect. An explicit non-numeric reply
+        marks it unsupported at once; a missing reply only counts if
+        MEAS:VOLT? still answers (the link is fine, the command is not).
+        """
+        supported = False
+        timeout = self.serial.timeout
+        self.serial.timeout = min(timeout, MEAS_ALL_PROBE_TIMEOUT)
+        try:
+            for _ in range(MEAS_ALL_MAX_FAILURES):
+                response = self._query("MEAS:ALL?")
+                values = _parse_values(response)
+                if values and len(values) >= 2:
+                    supported = True
+                    break
+                if response:
+                    break  # Explicit error reply
+                if not _parse_values(self._query("MEAS:VOLT?")):
+                    # Link problem, not the command - let measure_output() decide
+                    supported = True
+                    break
+        except Exception as e:
+            logger.warning(f"MEAS:ALL? probe failed: {e}")
+        finally:
+            self.serial.timeout = timeout
+
+        self._meas_all_supported = supported
+        self._meas_all_failures = 0
+        if not supported:
+            logger.info("MEAS:ALL? not supported - using separate V/I queries")
+
     # Voltage Control
     def set_voltage(self, voltage: float) -> None:
         """
@@ -208,6 +266,49 @@ class OwonPSU:
             logger.error(f"Invalid measured current: {response}")
             return 0.0
 
+    def measure_output(self, blocking: bool = True) -> Optional[Tuple[float, float]]:
+        """
+        Measure output voltage and current in one transaction.
+
+        Uses MEAS:ALL? (one round trip) if the connect-time probe found it;
+        otherwise, and for a bad reply, MEAS:VOLT? + MEAS:CURR?. MEAS:ALL?
+        is only dropped after MEAS_ALL_MAX_FAILURES consecutive bad replies
+        while the separate queries worked, so one serial hiccup does not
+        switch it off.
+
+        Args:
+            blocking: If False, return None instead of waiting while
+                another thread is talking to the PSU
+
+        Returns:
+            (voltage, current), or None if the PSU was busy
+        """
+        if not self._lock.acquire(blocking=blocking):
+            return None
+        try:
+            if self._meas_all_supported:
+                response = self._query("MEAS:ALL?")
+                values = _parse_values(response)
+                if values and len(values) >= 2:
+                    self._meas_all_failures = 0
+                    return values[0], values[1]
+                self._meas_all_failures += 1
+                logger.warning(f"Invalid MEAS:ALL? reply '{response}' - using separate V/I queries")
+
+            voltage = _parse_values(self._query("MEAS:VOLT?"))
+            current = _parse_values(self._query("MEAS:CURR?"))
+            if voltage is None or current is None:
+                logger.error(f"Invalid measured V/I: {voltage}, {current}")
+                return (voltage or [0.0])[0], (current or [0.0])[0]
+
+            if self._meas_all_supported and self._meas_all_failures >= MEAS_ALL_MAX_FAILURES:
+                self._meas_all_supported = False
+                logger.info(f"MEAS:ALL? failed {self._meas_all_failures} times while V/I "
+                            f"queries worked - using separate V/I queries")
+            return voltage[0], current[0]
+        finally:
+            self._lock.release()
+
     def measure_power(self) -> float:
         """
         Measure actual output power.
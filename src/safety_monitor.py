@@ -4,11 +4,19 @@ Safety monitoring for battery charger.
 
 import time
 import logging
-from typing import Optional, Dict
-from dataclasses import dataclass
+from collections import deque
+from typing import Optional, Dict, List
+from dataclasses import dataclass, field
+
+from safety_rules import compile_rules
 
 logger = logging.getLogger(__name__)
 
+# Default capacities for per-session buffers. Float and conditioning sessions
+# can run for days, so anything appended per measurement must be bounded.
+DEFAULT_VIOLATION_HISTORY = 100  # Most recent violation messages kept
+DEFAULT_PLATEAU_MAX_SAMPLES = 4096  # ~5.7h of history at a 5s interval
+
 
 @dataclass
 class SafetyLimits:
@@ -27,6 +35,11 @@ class SafetyLimits:
     plateau_voltage_delta: float = 0.05  # V - Max change to consider plateau
     # Energy accounting
     charging_efficiency: float = 0.83  # Lead-acid efficiency (1/1.2 = 83%)
+    # Buffer capacities (bounded memory for long sessions)
+    violation_history_size: int = DEFAULT_VIOLATION_HISTORY
+    plateau_max_samples: int = DEFAULT_PLATEAU_MAX_SAMPLES
+    # Additional declarative rules from the profile (safety.rules)
+    rules: List[dict] = field(default_factory=list)
 
 
 class SafetyMonitor:
@@ -38,16 +51,27 @@ class SafetyMonitor:
 
         Args:
             limits: Safety limits configuration
+
+        Raises:
+            ValueError: If a profile safety rule is invalid
         """
         self.limits = limits
-        self.violations = []
+        # Built-in limits and profile rules, compiled once into a flat table
+        self.rule_table = compile_rules(limits, limits.rules)
+        self._active_violations: List[str] = []
+        self._active_warnings: List[str] = []
+        # Fixed-capacity buffer of recent messages; totals are kept as counters
+        self.violations = deque(maxlen=limits.violation_history_size)
+        self.violation_total = 0  # All violation messages this session
+        self.warning_total = 0  # All warning messages this session
         self.start_time = 0.0
         self.last_check_time = 0.0
-        self.warning_count = 0
+        self.warning_count = 0  # Checks that produced at least one violation
 
         # Voltage plateau detection (for high-voltage charging >16V)
         # Load settings from config via limits dataclass
-        self.voltage_history = []  # List of (timestamp, voltage) tuples
+        # (timestamp, voltage) tuples, oldest first
+        self.voltage_history = deque(maxlen=limits.plateau_max_samples)
         self.plateau_enabled = limits.plateau_enabled
         self.plateau_threshold_voltage = limits.plateau_threshold_voltage
         self.plateau_time_window = limits.plateau_time_window
@@ -63,9 +87,14 @@ class SafetyMonitor:
         """Start safety monitoring."""
         self.start_time = time.time()
         self.last_check_time = time.time()
-        self.violations = []
+        self.violations.clear()
+        self.violation_total = 0
+        self.warning_total = 0
         self.warning_count = 0
-        self.voltage_history = []  # Clear voltage history
+        self.rule_table.reset()
+        self._active_violations = []
+        self._active_warnings = []
+        self.voltage_history.clear()  # Clear voltage history
 
         # Reset energy accounting
         self.ah_delivered = 0.0
@@ -82,89 +111,82 @@ class SafetyMonitor:
         self,
         voltage: float,
         current: float,
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        power: float = 0.0
     ) -> Dict[str, any]:
         """
         Check all safety conditions.
 
+        Evaluates the compiled rule table. Messages are formatted and logged
+        only when a rule changes state; while a rule stays active its message
+        is reported unchanged in the result.
+
         Args:
             voltage: Current voltage in V
             current: Current current in A
             temperature: Optional battery temperature in °C
+            power: Output power in W (for power rules)
 
         Returns:
             Dictionary with safety status:
             {
                 'safe': bool,
-                'violations': list of violation messages,
-                'warnings': list of warning messages,
+                'violations': list of active violation messages,
+                'warnings': list of active warning messages,
                 'should_stop': bool
             }
         """
-        self.last_check_time = time.time()
-        violations = []
-        warnings = []
-        should_stop = False
-
-        # Check voltage limits
-        if voltage > self.limits.absolute_max_voltage:
-            msg = f"CRITICAL: Voltage {voltage:.2f}V exceeds maximum {self.limits.absolute_max_voltage}V"
-            violations.append(msg)
-            logger.error(msg)
-            should_stop = True
-
-        if voltage < self.limits.min_voltage:
-            msg = f"WARNING: Voltage {voltage:.2f}V below minimum {self.limits.min_voltage}V"
-            warnings.append(msg)
-            logger.warning(msg)
-
-        # Check warning voltage threshold (12.5V - immediate recharge recommended)
-        if voltage < self.limits.warning_voltage and voltage >= self.limits.min_voltage:
-            msg = f"⚠️  RECHARGE RECOMMENDED: Voltage {voltage:.2f}V below {self.limits.warning_voltage}V (risk of permanent damage)"
-            warnings.append(msg)
-            logger.warning(msg)
-
-        # Check current limits
-        if current > self.limits.absolute_max_current:
-            msg = f"CRITICAL: Current {current:.2f}A exceeds maximum {self.limits.absolute_max_current}A"
-            violations.append(msg)
-            logger.error(msg)
-            should_stop = True
-
-        # Check charging duration
+        now = time.time()
+        self.last_check_time = now
         elapsed = self.get_elapsed_time()
-        if elapsed > self.limits.max_charging_duration:
-            msg = f"CRITICAL: Charging duration {elapsed:.0f}s exceeds maximum {self.limits.max_charging_duration}s"
-            violations.append(msg)
-            logger.error(msg)
-            should_stop = True
-
-        # Check temperature limits if available
-        if temperature is not None:
-            if self.limits.max_temperature and temperature > self.limits.max_temperature:
-                msg = f"CRITICAL: Temperature {temperature:.1f}°C exceeds maximum {self.limits.max_temperature}°C"
-                violations.append(msg)
-                logger.error(msg)
-                should_stop = True
-
-            if self.limits.min_temperature and temperature < self.limits.min_temperature:
-                msg = f"WARNING: Temperature {temperature:.1f}°C below minimum {self.limits.min_temperature}°C"
-                warnings.append(msg)
-                logger.warning(msg)
-
-        # Store violations
-        if violations:
-            self.violations.extend(violations)
+
+        table = self.rule_table
+        changes = table.evaluate(now, voltage, current, power, temperature, elapsed)
+        if changes:
+            self._apply_rule_changes(changes)
+
+        if table.critical_active:
             self.warning_count += 1
 
         return {
-            'safe': len(violations) == 0,
-            'violations': violations,
-            'warnings': warnings,
-            'should_stop': should_stop,
+            'safe': table.critical_active == 0,
+            'violations': self._active_violations,
+            'warnings': self._active_warnings,
+            'should_stop': table.critical_active > 0,
             'elapsed_time': elapsed
         }
 
+    def _apply_rule_changes(self, changes):
+        """
+        Format, log and record rule state changes.
+
+        Args:
+            changes: Sequence of (rule index, now_active) from the rule table
+        """
+        table = self.rule_table
+        for index, active in changes:
+            if active:
+                msg = table.format_message(index)
+                table.messages[index] = msg
+                if table.is_critical(index):
+                    logger.error(msg)
+                    # Store violations (bounded buffer, running totals)
+                    self.violations.append(msg)
+                    self.violation_total += 1
+                else:
+                    logger.warning(msg)
+                    self.warning_total += 1
+            else:
+                table.messages[index] = None
+                logger.info(f"Safety rule '{table.rules[index].name}' cleared")
+
+        self._active_violations = [
+            msg for i, msg in enumerate(table.messages) if msg and table.is_critical(i)
+        ]
+        self._active_warnings = [
+            msg for i, msg in enumerate(table.messages) if msg and not table.is_critical(i)
+        ]
+
     def get_elapsed_time(self) -> float:
         """Get elapsed time since monitoring started."""
         if self.start_time == 0:
@@ -219,7 +241,8 @@ class SafetyMonitor:
 
         # Keep only recent history (within time window)
         cutoff_time = now - self.plateau_time_window
-        self.voltage_history = [(t, v) for t, v in self.voltage_history if t >= cutoff_time]
+        while self.voltage_history[0][0] < cutoff_time:
+            self.voltage_history.popleft()
 
         # Need at least 2 data points spanning the time window
         if len(self.voltage_history) < 2:
@@ -414,9 +437,10 @@ class SafetyMonitor:
         return {
             'monitoring': self.start_time > 0,
             'elapsed_time': self.get_elapsed_time(),
-            'violation_count': len(self.violations),
-            'violations': self.violations[-10:],  # Last 10 violations
-            'warning_count': self.warning_count
+            'violation_count': self.violation_total,
+            'violations': list(self.violations)[-10:],  # Last 10 violations
+            'warning_count': self.warning_count,
+            'warning_total': self.warning_total
         }
 
     def is_charging_complete(
@@ -0,0 +1,441 @@
+"""
+Declarative safety rules for battery charger.
+
+Rules are defined per battery profile in the ``safety.rules`` YAML section and
+compiled once at startup into a flat evaluation table. Each sample is then
+checked by a single loop over parallel lists - no per-sample dicts, strings or
+log calls. Messages are only formatted when a rule changes state
+(ok → active or active → cleared).
+
+Example (per-profile YAML):
+
+    safety:
+      rules:
+        - name: gassing_time
+          field: voltage
+          type: duration_above      # max, min, rate, duration_above
+          limit: 15.8
+          duration: 1800            # seconds above limit before tripping
+          severity: warning         # warning or critical
+        - name: max_voltage_temp_comp
+          field: voltage
+          type: max
+          limit: 14.7               # at reference temperature
+          temp_coefficient: -0.018  # V/°C (-18mV/°C for 12V lead-acid)
+          temp_reference: 25.0      # °C
+          severity: critical
+        - name: thermal_runaway
+          field: temperature
+          type: rate
+          limit: 0.5                # units per minute (°C/min)
+          duration: 300             # seconds - rate averaging window
+          severity: critical
+"""
+
+import math
+import logging
+from dataclasses import dataclass
+from typing import Optional, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sample fields rules can reference (index into the sample slots)
+RULE_FIELDS = ('voltage', 'current', 'power', 'temperature', 'elapsed')
+
+# Rule kinds
+RULE_MAX = 0
+RULE_MIN = 1
+RULE_RATE = 2
+RULE_DURATION_ABOVE = 3
+
+RULE_TYPES = {
+    'max': RULE_MAX,
+    'min': RULE_MIN,
+    'rate': RULE_RATE,
+    'duration_above': RULE_DURATION_ABOVE,
+}
+
+SEVERITIES = ('warning', 'critical')
+
+FIELD_UNITS = {
+    'voltage': 'V',
+    'current': 'A',
+    'power': 'W',
+    'temperature': '°C',
+    'elapsed': 's',
+}
+
+# Default message templates per rule type. Available placeholders:
+# {name}, {field}, {value}, {limit}, {unit}, {duration}, {severity}
+DEFAULT_MESSAGES = {
+    'max': "{severity}: {field} {value:.2f}{unit} exceeds {limit:.2f}{unit} ({name})",
+    'min': "{severity}: {field} {value:.2f}{unit} below {limit:.2f}{unit} ({name})",
+    'rate': "{severity}: {field} rising {value:.3f}{unit}/min, limit {limit:.3f}{unit}/min ({name})",
+    'duration_above': "{severity}: {field} {value:.2f}{unit} above {limit:.2f}{unit} for >{duration:.0f}s ({name})",
+}
+
+# Sample arguments for the trial format of profile message templates
+_TEMPLATE_PROBE = {
+    'name': 'rule',
+    'field': 'Voltage',
+    'value': 0.0,
+    'limit': 0.0,
+    'unit': 'V',
+    'duration': 0.0,
+    'severity': 'WARNING',
+}
+
+# What str.format() raises for a bad template or format spec
+_TEMPLATE_ERRORS = (KeyError, IndexError, ValueError, TypeError, AttributeError)
+
+
+@dataclass
+class SafetyRule:
+    """Declarative safety rule definition."""
+    name: str
+    field: str  # One of RULE_FIELDS
+    type: str  # max, min, rate, duration_above
+    limit: float
+    severity: str = 'warning'  # warning or critical (critical stops charging)
+    duration: float = 0.0  # seconds - hold time (duration_above) or window (rate)
+    floor: Optional[float] = None  # min rules: only active while value >= floor
+    hysteresis: float = 0.0  # Clear only once value is this far back inside the limit
+    temp_coefficient: float = 0.0  # limit change per °C (temperature compensation)
+    temp_reference: float = 25.0  # °C - temperature at which limit applies unchanged
+    message: Optional[str] = None  # Optional message template
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SafetyRule':
+        """
+        Create rule from YAML dictionary.
+
+        Raises:
+            ValueError: If the rule definition is invalid
+        """
+        try:
+            rule = cls(
+                name=str(data['name']),
+                field=data['field'],
+                type=data['type'],
+                limit=float(data['limit']),
+                severity=data.get('severity', 'warning'),
+                duration=float(data.get('duration', 0.0)),
+                floor=float(data['floor']) if data.get('floor') is not None else None,
+                hysteresis=float(data.get('hysteresis', 0.0)),
+                temp_coefficient=float(data.get('temp_coefficient', 0.0)),
+                temp_reference=float(data.get('temp_reference', 25.0)),
+                message=data.get('message')
+            )
+        except KeyError as e:
+            raise ValueError(f"Safety rule {data!r} missing required key {e}")
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Safety rule {data!r} has invalid value: {e}")
+
+        rule.validate()
+        return rule
+
+    def validate(self):
+        """
+        Validate rule definition.
+
+        Raises:
+            ValueError: If the rule is invalid
+        """
+        if self.field not in RULE_FIELDS:
+            raise ValueError(f"Rule '{self.name}': unknown field '{self.field}' (valid: {', '.join(RULE_FIELDS)})")
+        if self.type not in RULE_TYPES:
+            raise ValueError(f"Rule '{self.name}': unknown type '{self.type}' (valid: {', '.join(RULE_TYPES)})")
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"Rule '{self.name}': unknown severity '{self.severity}' (valid: {', '.join(SEVERITIES)})")
+        if self.type in ('rate', 'duration_above') and self.duration <= 0:
+            raise ValueError(f"Rule '{self.name}': '{self.type}' rules need a positive duration")
+        if self.hysteresis < 0:
+            raise ValueError(f"Rule '{self.name}': hysteresis must not be negative")
+        if self.message is not None:
+            # Messages are only formatted when a rule trips - catch typos now
+            if not isinstance(self.message, str):
+                raise ValueError(f"Rule '{self.name}': message must be a string")
+            try:
+                self.message.format(**_TEMPLATE_PROBE)
+            except _TEMPLATE_ERRORS as e:
+                raise ValueError(
+                    f"Rule '{self.name}': invalid message template {self.message!r} "
+                    f"({type(e).__name__}: {e}; placeholders: {', '.join(_TEMPLATE_PROBE)})"
+                )
+
+
+class SafetyRuleTable:
+    """
+    Flat, precompiled evaluation table for safety rules.
+
+    All per-rule parameters and state live in parallel lists indexed by rule
+    number, so evaluating a sample only reads floats and flips booleans.
+    """
+
+    def __init__(self, rules: List[SafetyRule]):
+        """
+        Compile rules into the evaluation table.
+
+        Args:
+            rules: Validated safety rules
+        """
+        names = [r.name for r in rules]
+        duplicates = {n for n in names if names.count(n) > 1}
+        if duplicates:
+            raise ValueError(f"Duplicate safety rule names: {', '.join(sorted(duplicates))}")
+
+        self.rules = list(rules)
+        self.count = len(rules)
+
+        # Static table
+        self._kind = [RULE_TYPES[r.type] for r in rules]
+        self._field = [RULE_FIELDS.index(r.field) for r in rules]
+        self._limit = [r.limit for r in rules]
+        self._floor = [r.floor if r.floor is not None else -math.inf for r in rules]
+        self._hysteresis = [r.hysteresis for r in rules]
+        self._duration = [r.duration for r in rules]
+        self._temp_coeff = [r.temp_coefficient for r in rules]
+        self._temp_ref = [r.temp_reference for r in rules]
+        self._critical = [r.severity == 'critical' for r in rules]
+        self._compensated = [r.temp_coefficient != 0.0 for r in rules]
+
+        # Dynamic state
+        self._active = [False] * self.count
+        self._since = [0.0] * self.count  # duration_above: first time over limit
+        self._ref_time = [0.0] * self.count  # rate: start of current window
+        self._ref_value = [math.nan] * self.count  # rate: value at window start
+        self._rate = [0.0] * self.count  # rate: last computed rate (per minute)
+        self._values = [math.nan] * len(RULE_FIELDS)  # Sample slots
+
+        self.critical_active = 0  # Number of active critical rules
+        self.messages: List[Optional[str]] = [None] * self.count  # Active messages
+
+    def reset(self):
+        """Reset all rule state (start of a new session)."""
+        for i in range(self.count):
+            self._active[i] = False
+            self._since[i] = 0.0
+            self._ref_time[i] = 0.0
+            self._ref_value[i] = math.nan
+            self._rate[i] = 0.0
+            self.messages[i] = None
+        self.critical_active = 0
+
+    def evaluate(
+        self,
+        now: float,
+        voltage: float,
+        current: float,
+        power: float,
+        temperature: Optional[float],
+        elapsed: float
+    ) -> Sequence[Tuple[int, bool]]:
+        """
+        Evaluate one sample against all rules.
+
+        Args:
+            now: Sample timestamp (seconds)
+            voltage: Voltage in V
+            current: Current in A
+            power: Power in W
+            temperature: Battery temperature in °C (None if unavailable)
+            elapsed: Elapsed charging time in seconds
+
+        Returns:
+            Sequence of (rule index, now_active) for rules that changed
+            state. The shared empty tuple when nothing changed.
+        """
+        values = self._values
+        values[0] = voltage
+        values[1] = current
+        values[2] = power
+        values[3] = math.nan if temperature is None else temperature
+        values[4] = elapsed
+        temp = values[3]
+
+        kind = self._kind
+        field = self._field
+        limit = self._limit
+        active = self._active
+        changes = None
+
+        for i in range(self.count):
+            value = values[field[i]]
+            if value != value:  # NaN - field not available
+                continue
+
+            lim = limit[i]
+            if self._compensated[i] and temp == temp:
+                lim += self._temp_coeff[i] * (temp - self._temp_ref[i])
+
+            k = kind[i]
+            was_active = active[i]
+            hyst = self._hysteresis[i] if was_active else 0.0
+
+            if k == RULE_MAX:
+                is_active = value > lim - hyst
+            elif k == RULE_MIN:
+                is_active = self._floor[i] <= value < lim + hyst
+            elif k == RULE_DURATION_ABOVE:
+                if value > lim - hyst:
+                    if self._since[i] == 0.0:
+                        self._since[i] = now
+                    is_active = now - self._since[i] >= self._duration[i]
+                else:
+                    self._since[i] = 0.0
+                    is_active = False
+            else:  # RULE_RATE
+                ref_value = self._ref_value[i]
+                if ref_value != ref_value:
+                    self._ref_time[i] = now
+                    self._ref_value[i] = value
+                    continue
+                window = now - self._ref_time[i]
+                if window < self._duration[i]:
+                    continue
+                rate = (value - ref_value) * 60.0 / window
+                self._rate[i] = rate
+                self._ref_time[i] = now
+                self._ref_value[i] = value
+                is_active = rate > lim - hyst
+
+            if is_active != was_active:
+                active[i] = is_active
+                if changes is None:
+                    changes = []
+                changes.append((i, is_active))
+                if self._critical[i]:
+                    self.critical_active += 1 if is_active else -1
+
+        if changes is None:
+            return _NO_CHANGES
+        return changes
+
+    def format_message(self, index: int) -> str:
+        """
+        Format the message for a rule (only called on state changes).
+
+        Falls back to the rule type's default message if the rule's own
+        template fails, so formatting never raises.
+
+        Args:
+            index: Rule index
+
+        Returns:
+            Human-readable message
+        """
+        rule = self.rules[index]
+        value = self._values[RULE_FIELDS.index(rule.field)]
+        limit = rule.limit
+        temp = self._values[3]
+        if rule.temp_coefficient and temp == temp:
+            limit += rule.temp_coefficient * (temp - rule.temp_reference)
+        if rule.type == 'rate':
+            value = self._rate[index]
+
+        args = {
+            'name': rule.name,
+            'field': rule.field.capitalize(),
+            'value': value,
+            'limit': limit,
+            'unit': FIELD_UNITS[rule.field],
+            'duration': rule.duration,
+            'severity': 'CRITICAL' if rule.severity == 'critical' else 'WARNING',
+        }
+        if rule.message:
+            try:
+                return rule.message.format(**args)
+            except _TEMPLATE_ERRORS as e:
+                # Never let a message break the safety path - use the default
+                logger.error(f"Rule '{rule.name}': message template failed ({e!r}), using default")
+        return DEFAULT_MESSAGES[rule.type].format(**args)
+
+    def is_critical(self, index: int) -> bool:
+        """Check whether a rule stops charging when active."""
+        return self._critical[index]
+
+    def is_active(self, index: int) -> bool:
+        """Check whether a rule is currently active."""
+        return self._active[index]
+
+
+_NO_CHANGES: Tuple = ()
+
+
+def builtin_rules(limits) -> List[SafetyRule]:
+    """
+    Express the fixed SafetyLimits as rules.
+
+    Args:
+        limits: SafetyLimits instance
+
+    Returns:
+        List of built-in rules (same messages as the classic checks)
+    """
+    rules = [
+        SafetyRule(
+            name='absolute_max_voltage', field='voltage', type='max',
+            limit=limits.absolute_max_voltage, severity='critical',
+            message="CRITICAL: Voltage {value:.2f}V exceeds maximum {limit}V"
+        ),
+        SafetyRule(
+            name='min_voltage', field='voltage', type='min',
+            limit=limits.min_voltage, severity='warning',
+            message="WARNING: Voltage {value:.2f}V below minimum {limit}V"
+        ),
+        SafetyRule(
+            name='warning_voltage', field='voltage', type='min',
+            limit=limits.warning_voltage, floor=limits.min_voltage, severity='warning',
+            message="⚠️  RECHARGE RECOMMENDED: Voltage {value:.2f}V below {limit}V (risk of permanent damage)"
+        ),
+        SafetyRule(
+            name='absolute_max_current', field='current', type='max',
+            limit=limits.absolute_max_current, severity='critical',
+            message="CRITICAL: Current {value:.2f}A exceeds maximum {limit}A"
+        ),
+        SafetyRule(
+            name='max_charging_duration', field='elapsed', type='max',
+            limit=limits.max_charging_duration, severity='critical',
+            message="CRITICAL: Charging duration {value:.0f}s exceeds maximum {limit}s"
+        ),
+    ]
+
+    if limits.max_temperature:
+        rules.append(SafetyRule(
+            name='max_temperature', field='temperature', type='max',
+            limit=limits.max_temperature, severity='critical',
+            message="CRITICAL: Temperature {value:.1f}°C exceeds maximum {limit}°C"
+        ))
+    if limits.min_temperature:
+        rules.append(SafetyRule(
+            name='min_temperature', field='temperature', type='min',
+            limit=limits.min_temperature, severity='warning',
+            message="WARNING: Temperature {value:.1f}°C below minimum {limit}°C"
+        ))
+
+    return rules
+
+
+def compile_rules(limits, rule_configs: Optional[List[dict]] = None) -> SafetyRuleTable:
+    """
+    Compile built-in limits and profile rules into an evaluation table.
+
+    Args:
+        limits: SafetyLimits instance
+        rule_configs: Rule dictionaries from the profile YAML (safety.rules)
+
+    Returns:
+        SafetyRuleTable
+
+    Raises:
+        ValueError: If any rule is invalid
+    """
+    rules = builtin_rules(limits)
+    for rule_config in rule_configs or []:
+        if not isinstance(rule_config, dict):
+            raise ValueError(f"Safety rule must be a mapping, got {rule_config!r}")
+        rules.append(SafetyRule.from_dict(rule_config))
+
+    table = SafetyRuleTable(rules)
+    logger.info(f"Compiled {table.count} safety rules ({table.count - len(builtin_rules(limits))} from profile)")
+    return table
@@ -0,0 +1,489 @@
+"""
+Binary session log: fixed-width records with a sparse time/stage index.
+
+A 24-48 h session at one row per second is ~170k rows. As CSV that is
+slow to write, large on the card and has to be parsed in full for every
+question. This format is written append-only and read by offset:
+
+    <log>.bclog
+        8 bytes   magic  b'BCSLOG01'
+        4 bytes   JSON header length (uint32 LE)
+        N bytes   JSON header (profile, mode, PSU identity, record layout,
+                  enum tables), space-padded so records start 8-aligned
+        records   fixed RECORD_SIZE bytes each, little-endian, time-ordered
+
+    <log>.bclog.idx  (sparse index, INDEX_ENTRY bytes each)
+        every INDEX_INTERVAL records and at every stage change:
+        (time float64, record number uint32, stage uint8)
+
+The record layout is a plain C struct, so with NumPy the data section
+memory-maps as a structured array (SessionLogReader.to_numpy). Without
+NumPy the reader uses mmap + struct. Time lookups bisect the in-memory
+index and then at most INDEX_INTERVAL records on disk: O(log n) seeks.
+Stage lookups ("the absorption stage") come straight from the index.
+
+A crash can leave a partial last record; readers ignore it.
+
+CSV export is a conversion tool, not the hot path:
+
+    python3 src/session_log.py info logs/charge_20250101_120000.bclog
+    python3 src/session_log.py export logs/charge_20250101_120000.bclog \\
+        --stage absorption -o absorption.csv
+"""
+
+import os
+import csv
+import sys
+import gzip
+import json
+import math
+import mmap
+import struct
+import logging
+from bisect import bisect_right
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from log_fields import compile_fields
+from telemetry_codec import STAGES, STATES
+
+logger = logging.getLogger(__name__)
+
+# Optional NumPy (structured array view of the records)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+MAGIC = b'BCSLOG01'
+FORMAT_VERSION = 1
+LOG_EXTENSION = '.bclog'
+INDEX_SUFFIX = '.idx'
+INDEX_INTERVAL = 256  # records between index entries
+
+# (name, struct code) - names are log_fields names; 'x' = padding
+RECORD_FIELDS = (
+    ('unix_time', 'd'),
+    ('voltage', 'f'),
+    ('current', 'f'),
+    ('power', 'f'),
+    ('voltage_setpoint', 'f'),
+    ('current_setpoint', 'f'),
+    ('elapsed', 'f'),
+    ('ah_delivered', 'f'),
+    ('wh_delivered', 'f'),
+    ('ah_stored', 'f'),
+    ('temperature', 'f'),  # NaN if no sensor
+    ('stage', 'B'),  # STAGES index
+    ('state', 'B'),  # STATES index
+    ('_pad', '6x'),  # 56-byte records (8-aligned)
+)
+
+RECORD_FORMAT = '<' + ''.join(code for _, code in RECORD_FIELDS)
+_RECORD = struct.Struct(RECORD_FORMAT)
+RECORD_SIZE = _RECORD.size
+_STAGE_OFFSET = struct.calcsize('<' + ''.join(code for name, code in RECORD_FIELDS[:-3]))
+_INDEX = struct.Struct('<dIB3x')
+INDEX_ENTRY = _INDEX.size
+
+_NUMPY_TYPES = {'d': '<f8', 'f': '<f4', 'B': 'u1'}
+_STAGE_INDEX = {name: i for i, name in enumerate(STAGES)}
+_STATE_INDEX = {name: i for i, name in enumerate(STATES)}
+
+
+def _numpy_dtype_descr() -> list:
+    """Structured dtype description matching RECORD_FORMAT."""
+    descr = []
+    for name, code in RECORD_FIELDS:
+        if code.endswith('x'):
+            descr.append((name, f'V{int(code[:-1] or 1)}'))
+        else:
+            descr.append((name, _NUMPY_TYPES[code]))
+    return descr
+
+
+def _to_float(value) -> float:
+    """Status value -> float ('' / None / non-numeric -> NaN)."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class BinarySessionSink:
+    """Record encoder/writer for SessionLogger (format: binary)."""
+
+    extension = LOG_EXTENSION
+
+    def __init__(self, path, metadata: Optional[dict] = None):
+        """
+        Initialize sink.
+
+        Args:
+            path: Log file (.bclog); the index goes to <path>.idx
+            metadata: Session description stored in the header
+                (profile, mode, psu, channel, ...)
+        """
+        self.path = Path(path)
+        self.index_path = Path(str(self.path) + INDEX_SUFFIX)
+        self.metadata = metadata or {}
+        # Control thread: one generated function producing the raw values
+        self.extract = compile_fields([name for name, code in RECORD_FIELDS if not code.endswith('x')])
+        self._file = None
+        self._index_file = None
+        self._count = 0
+        self._last_stage = None
+
+    def open(self):
+        """Create the log and index files and write the header."""
+        header = dict(self.metadata)
+        header.update({
+            'format': 'bclog',
+            'version': FORMAT_VERSION,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'record_format': RECORD_FORMAT,
+            'record_size': RECORD_SIZE,
+            'fields': [name for name, code in RECORD_FIELDS if not code.endswith('x')],
+            'numpy_dtype': _numpy_dtype_descr(),
+            'index_interval': INDEX_INTERVAL,
+            'enums': {'stage': list(STAGES), 'state': list(STATES)},
+        })
+        encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        padding = -(len(MAGIC) + 4 + len(encoded)) % 8
+        encoded += b' ' * padding
+
+        self._file = open(self.path, 'wb')
+        self._file.write(MAGIC + struct.pack('<I', len(encoded)) + encoded)
+        self._index_file = open(self.index_path, 'wb')
+
+    def write(self, rows: List[list]):
+        """Encode and append extracted rows (writer thread)."""
+        records = []
+        index = []
+        for row in rows:
+            values = [_to_float(value) for value in row[:-2]]
+            stage = _STAGE_INDEX.get(row[-2], 0)
+            state = _STATE_INDEX.get(row[-1], 0)
+            records.append(_RECORD.pack(*values, stage, state))
+            if self._count % INDEX_INTERVAL == 0 or stage != self._last_stage:
+                index.append(_INDEX.pack(values[0], self._count, stage))
+                self._last_stage = stage
+            self._count += 1
+        self._file.write(b''.join(records))
+        if index:
+            self._index_file.write(b''.join(index))
+
+    def flush(self, sync: bool):
+        """Flush both files (records before index)."""
+        self._file.flush()
+        self._index_file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+            os.fsync(self._index_file.fileno())
+
+    def close(self):
+        """Close both files."""
+        for f in (self._file, self._index_file):
+            if f:
+                f.close()
+
+
+class SessionLogReader:
+    """Random access to a binary session log."""
+
+    def __init__(self, path):
+        """
+        Open a log for reading.
+
+        Args:
+            path: .bclog file, or .bclog.gz (compressed by log retention;
+                decompressed into memory, not memory-mapped)
+
+        Raises:
+            ValueError: If the file is not a session log
+        """
+        self.path = Path(path)
+        self._file = None
+        self._mmap = None
+        if self.path.suffix == '.gz':
+            with gzip.open(self.path, 'rb') as f:
+                self._mmap = f.read()  # bytes support the same unpack_from access
+            self._index_base = self.path.with_suffix('')
+        else:
+            self._file = open(self.path, 'rb')
+            if self.path.stat().st_size:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._index_base = self.path
+        buffer = self._mmap or b''
+
+        if buffer[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a binary session log")
+        header_len = struct.unpack_from('<I', buffer, len(MAGIC))[0]
+        self.data_offset = len(MAGIC) + 4 + header_len
+        self.header: dict = json.loads(bytes(buffer[len(MAGIC) + 4:self.data_offset]).decode('utf-8'))
+        if self.header.get('record_format') != RECORD_FORMAT:
+            self.close()
+            raise ValueError(f"{self.path}: unsupported record layout {self.header.get('record_format')}")
+
+        self.count = max(0, (len(buffer) - self.data_offset) // RECORD_SIZE)  # Ignores a partial last record
+
+        self.fields = [name for name, code in RECORD_FIELDS if not code.endswith('x')]
+        self._index_times: List[float] = []
+        self._index_records: List[int] = []
+        self._index_stages: List[int] = []
+        self._load_index()
+
+    def _load_index(self):
+        """Load the sparse index (rebuilt by scanning if missing or damaged)."""
+        index_path = Path(str(self._index_base) + INDEX_SUFFIX)
+        entries = []
+        if index_path.exists():
+            data = index_path.read_bytes()
+            entries = [e for e in _INDEX.iter_unpack(data[:len(data) - len(data) % INDEX_ENTRY])
+                       if e[1] < self.count]
+        if self.count and (not entries or entries[0][1] != 0):
+            logger.warning(f"{self.path}: index missing or damaged - rebuilding by scan")
+            entries = self._scan_index()
+        for t, record, stage in entries:
+            self._index_times.append(t)
+            self._index_records.append(record)
+            self._index_stages.append(stage)
+
+    def _scan_index(self) -> List[Tuple[float, int, int]]:
+        """Rebuild index entries from the records (O(n), fallback only)."""
+        entries = []
+        last_stage = None
+        for i in range(self.count):
+            offset = self.data_offset + i * RECORD_SIZE
+            stage = self._mmap[offset + _STAGE_OFFSET]
+            if i % INDEX_INTERVAL == 0 or stage != last_stage:
+                entries.append((self._time_at(i), i, stage))
+                last_stage = stage
+        return entries
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _time_at(self, i: int) -> float:
+        return struct.unpack_from('<d', self._mmap, self.data_offset + i * RECORD_SIZE)[0]
+
+    def record(self, i: int) -> dict:
+        """
+        Get one record.
+
+        Args:
+            i: Record number
+
+        Returns:
+            Dictionary (stage/state as names, NaN for missing values)
+        """
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        values = _RECORD.unpack_from(self._mmap, self.data_offset + i * RECORD_SIZE)
+        record = dict(zip(self.fields, values))
+        record['stage'] = STAGES[record['stage']] if record['stage'] < len(STAGES) else ''
+        record['state'] = STATES[record['state']] if record['state'] < len(STATES) else 'unknown'
+        return record
+
+    def iter_records(self, start: int = 0, stop: Optional[int] = None) -> Iterator[dict]:
+        """Iterate records [start, stop)."""
+        stop = self.count if stop is None else min(stop, self.count)
+        for i in range(max(0, start), stop):
+            yield self.record(i)
+
+    def find_time(self, t: float) -> int:
+        """
+        Find the first record at or after time t.
+
+        Bisects the in-memory index, then the records of one index block.
+
+        Args:
+            t: Unix time
+
+        Returns:
+            Record number (len(self) if all records are earlier)
+        """
+        if not self.count:
+            return 0
+        block = bisect_right(self._index_times, t) - 1
+        if block < 0:
+            return 0
+        lo = self._index_records[block]
+        hi = self._index_records[block + 1] if block + 1 < len(self._index_records) else self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._time_at(mid) < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def time_range(self, start: Optional[float] = None, end: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Get the record range [first, stop) with start <= time < end.
+
+        Args:
+            start: Unix time (None = beginning)
+            end: Unix time (None = end of log)
+
+        Returns:
+            (first record, stop record)
+        """
+        first = 0 if start is None else self.find_time(start)
+        stop = self.count if end is None else self.find_time(end)
+        return first, max(first, stop)
+
+    def stage_segments(self) -> List[Tuple[str, int, int]]:
+        """
+        Get the stage timeline from the index.
+
+        Returns:
+            List of (stage name, first record, stop record) in order
+        """
+        segments = []
+        for record, stage in zip(self._index_records, self._index_stages):
+            if segments and segments[-1][0] == stage:
+                continue
+            if segments:
+                segments[-1][2] = record
+            segments.append([stage, record, self.count])
+        return [(STAGES[stage] if stage < len(STAGES) else '', first, stop) for stage, first, stop in segments]
+
+    def stage_ranges(self, stage: str) -> List[Tuple[int, int]]:
+        """
+        Get the record ranges of a stage (e.g. 'absorption').
+
+        Args:
+            stage: Stage name
+
+        Returns:
+            List of (first record, stop record)
+        """
+        return [(first, stop) for name, first, stop in self.stage_segments() if name == stage]
+
+    def to_numpy(self, start: int = 0, stop: Optional[int] = None):
+        """
+        Memory-map records [start, stop) as a NumPy structured array.
+
+        Raises:
+            RuntimeError: If NumPy is not installed
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("NumPy not installed - use iter_records()")
+        if not isinstance(self._mmap, mmap.mmap):
+            records = np.frombuffer(self._mmap, dtype=np.dtype(_numpy_dtype_descr()),
+                                    count=self.count, offset=self.data_offset)
+            return records[start:stop]
+        records = np.memmap(self.path, dtype=np.dtype(_numpy_dtype_descr()), mode='r',
+                            offset=self.data_offset, shape=(self.count,))
+        return records[start:stop]
+
+    def close(self):
+        """Close the file."""
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        if self._file:
+            self._file.close()
+
+
+def export_csv(reader: SessionLogReader, output, start: int = 0, stop: Optional[int] = None,
+               header: bool = True) -> int:
+    """
+    Write records [start, stop) as CSV.
+
+    Args:
+        reader: Open session log
+        output: Text file object
+        start: First record
+        stop: Stop record (None = end)
+        header: Write the header row
+
+    Returns:
+        Number of rows written
+    """
+    writer = csv.writer(output)
+    if header:
+        writer.writerow(['timestamp'] + reader.fields)
+    rows = 0
+    for record in reader.iter_records(start, stop):
+        timestamp = datetime.fromtimestamp(record['unix_time']).isoformat()
+        writer.writerow([timestamp] + [
+            '' if isinstance(record[name], float) and math.isnan(record[name])
+            else round(record[name], 4) if isinstance(record[name], float) and name != 'unix_time'
+            else record[name]
+            for name in reader.fields
+        ])
+        rows += 1
+    return rows
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    """Unix seconds or ISO date/time -> Unix seconds."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line tool: info / export."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Binary session log tool')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    info = sub.add_parser('info', help='Show header, size and stage timeline')
+    info.add_argument('log')
+
+    export = sub.add_parser('export', help='Convert (part of) a log to CSV')
+    export.add_argument('log')
+    export.add_argument('-o', '--output', help='CSV file (default: stdout)')
+    export.add_argument('--stage', help='Only this stage (e.g. absorption)')
+    export.add_argument('--start', help='From time (Unix seconds or ISO 8601)')
+    export.add_argument('--end', help='Until time (Unix seconds or ISO 8601)')
+
+    args = parser.parse_args(argv)
+    reader = SessionLogReader(args.log)
+    try:
+        if args.command == 'info':
+            meta = {k: v for k, v in reader.header.items() if k not in ('numpy_dtype', 'enums', 'fields')}
+            print(json.dumps(meta, indent=2))
+            print(f"records: {len(reader)}")
+            if len(reader):
+                first, last = reader.record(0)['unix_time'], reader.record(len(reader) - 1)['unix_time']
+                print(f"span: {datetime.fromtimestamp(first)} - {datetime.fromtimestamp(last)} "
+                      f"({(last - first) / 3600:.2f} h)")
+            for stage, first, stop in reader.stage_segments():
+                print(f"  {stage or '-':<14} records {first}-{stop - 1} ({stop - first})")
+            return 0
+
+        first, stop = reader.time_range(_parse_time(args.start), _parse_time(args.end))
+        ranges = [(first, stop)]
+        if args.stage:
+            ranges = [(max(a, first), min(b, stop)) for a, b in reader.stage_ranges(args.stage)]
+            ranges = [(a, b) for a, b in ranges if a < b]
+            if not ranges:
+                print(f"No '{args.stage}' records in range", file=sys.stderr)
+                return 1
+
+        output = open(args.output, 'w', newline='') if args.output else sys.stdout
+        try:
+            rows = 0
+            for n, (a, b) in enumerate(ranges):
+                rows += export_csv(reader, output, a, b, header=(n == 0))
+        finally:
+            if args.output:
+                output.close()
+        print(f"Exported {rows} records", file=sys.stderr)
+        return 0
+    finally:
+        reader.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,423 @@
+"""
+Asynchronous buffered session logger.
+
+The control loop hands each log row to a bounded queue and returns; a
+background thread writes rows in batches and flushes on a time/size policy
+(optionally with fsync). A slow SD card therefore never delays a control
+tick: if the writer falls behind and the queue fills, new rows are dropped
+and counted instead of blocking.
+
+The field extractor is compiled once per session (see log_fields.py), so
+logging a row is a handful of dict lookups on the control thread. Encoding
+and writing happen in a sink: CSV (configured fields), JSON Lines (samples
+plus event records) or the binary session log (session_log.py).
+"""
+
+import csv
+import os
+import json
+import math
+import time
+import queue
+import struct
+import logging
+import threading
+from json.encoder import encode_basestring
+from pathlib import Path
+from typing import List, Optional
+
+from log_fields import compile_fields
+from session_log import BinarySessionSink
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 1000  # rows
+DEFAULT_FLUSH_INTERVAL = 5.0  # s
+DEFAULT_FLUSH_ROWS = 50
+
+# Writer thread wakes at least this often to honour flush requests from
+# signal handlers (which must not touch the queue lock)
+MAX_IDLE_WAIT = 1.0  # s
+
+_CLOSE = object()
+
+
+class CsvSessionSink:
+    """CSV writer for SessionLogger (format: csv)."""
+
+    extension = '.csv'
+
+    def __init__(self, path, fields: List[str]):
+        """
+        Initialize sink.
+
+        Args:
+            path: CSV file
+            fields: Column names (see log_fields.py)
+
+        Raises:
+            ValueError: If a field name is unknown
+        """
+        self.path = Path(path)
+        self.fields = list(fields)
+        self.extract = compile_fields(self.fields)
+        self._file = None
+        self._writer = None
+
+    def open(self):
+        """Create the file and write the header row."""
+        self._file = open(self.path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.fields)
+
+    def write(self, rows: List[list]):
+        """Append extracted rows."""
+        self._writer.writerows(rows)
+
+    def flush(self, sync: bool):
+        """Flush, optionally fsync."""
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Close the file."""
+        if self._file:
+            self._file.close()
+
+
+class SessionEvent:
+    """Event record queued between samples (JSON Lines logs only)."""
+
+    __slots__ = ('timestamp', 'event', 'data')
+
+    def __init__(self, timestamp: float, event: str, data: dict):
+        self.timestamp = timestamp
+        self.event = event
+        self.data = data
+
+
+class JsonlSessionSink:
+    """
+    JSON Lines writer for SessionLogger (format: json).
+
+    One object per line: a session header, then samples and events in the
+    order they happened:
+
+        {"type":"session","profile":...,"fields":[...]}
+        {"type":"sample","timestamp":"...","voltage":13.812,...}
+        {"type":"event","event":"stage","t":1718000000.125,"from":"bulk","to":"absorption"}
+
+    Samples are serialized without json.dumps or a per-row dict: the
+    '"key":' fragments are built once per session in configured order and
+    values are encoded by type. Missing values and NaN become null.
+    """
+
+    extension = '.jsonl'
+    supports_events = True
+
+    def __init__(self, path, fields: List[str], metadata: Optional[dict] = None,
+                 float_precision: Optional[int] = None):
+        """
+        Initialize sink.
+
+        Args:
+            path: .jsonl file
+            fields: Sample keys (see log_fields.py)
+            metadata: Session description for the header line
+            float_precision: Decimal places for floats (None = full precision)
+
+        Raises:
+            ValueError: If a field name is unknown
+        """
+        self.path = Path(path)
+        self.fields = list(fields)
+        self.metadata = metadata or {}
+        self.float_precision = float_precision
+        self.extract = compile_fields(self.fields)
+        self._keys = tuple(f',{encode_basestring(name)}:' for name in self.fields)
+        self._file = None
+
+    def open(self):
+        """Create the file and write the session header line."""
+        header = {'type': 'session'}
+        header.update(self.metadata)
+        header['fields'] = self.fields
+        self._file = open(self.path, 'w')
+        self._file.write(json.dumps(header, separators=(',', ':'), default=str) + '\n')
+
+    def write(self, items: list):
+        """Append samples (lists) and events (SessionEvent) in order."""
+        keys = self._keys
+        precision = self.float_precision
+        isfinite = math.isfinite
+        lines = []
+        for item in items:
+            if type(item) is not list:
+                record = {'type': 'event', 'event': item.event, 't': round(item.timestamp, 3)}
+                record.update(item.data)
+                lines.append(json.dumps(record, separators=(',', ':'), default=str))
+                continue
+            parts = ['{"type":"sample"']
+            for key, value in zip(keys, item):
+                kind = type(value)
+                if kind is float:
+                    if not isfinite(value):
+                        value = 'null'
+                    elif precision is not None:
+                        value = repr(round(value, precision))
+                    else:
+                        value = repr(value)
+                elif kind is str:
+                    value = encode_basestring(value) if value else 'null'
+                elif kind is int:
+                    value = str(value)
+                elif value is None:
+                    value = 'null'
+                else:
+                    value = json.dumps(value, default=str)  # bool, nested
+                parts.append(key + value)
+            parts.append('}')
+            lines.append(''.join(parts))
+        lines.append('')
+        self._file.write('\n'.join(lines))
+
+    def flush(self, sync: bool):
+        """Flush, optionally fsync."""
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Close the file."""
+        if self._file:
+            self._file.close()
+
+
+SESSION_LOG_FORMATS = ('csv', 'json', 'binary')
+
+
+def create_session_sink(log_format: str, path_stem, fields: List[str], metadata: Optional[dict] = None,
+                        float_precision: Optional[int] = None):
+    """
+    Create the sink for a session log format.
+
+    Args:
+        log_format: 'csv', 'json' (JSON Lines) or 'binary'
+        path_stem: Output path without extension
+        fields: CSV columns / JSON sample keys (binary logs have a fixed
+            record layout)
+        metadata: Session description (JSON/binary header)
+        float_precision: JSON float decimal places (None = full)
+
+    Returns:
+        Sink instance
+
+    Raises:
+        ValueError: If the format or a field name is unknown
+    """
+    if log_format == 'csv':
+        return CsvSessionSink(f"{path_stem}{CsvSessionSink.extension}", fields)
+    if log_format in ('json', 'jsonl'):
+        return JsonlSessionSink(f"{path_stem}{JsonlSessionSink.extension}", fields, metadata, float_precision)
+    if log_format == 'binary':
+        return BinarySessionSink(f"{path_stem}{BinarySessionSink.extension}", metadata)
+    raise ValueError(f"Unknown log format '{log_format}' (valid: {', '.join(SESSION_LOG_FORMATS)})")
+
+
+class SessionLogger:
+    """Writes one charging session's rows from a background thread."""
+
+    def __init__(self, sink, config: Optional[dict] = None):
+        """
+        Initialize session logger.
+
+        Args:
+            sink: Output sink (see create_session_sink)
+            config: logging configuration dictionary (queue_size,
+                flush_interval, flush_rows, fsync)
+        """
+        config = config or {}
+        self.sink = sink
+        self.path = sink.path
+        self.flush_interval = float(config.get('flush_interval', DEFAULT_FLUSH_INTERVAL))
+        self.flush_rows = int(config.get('flush_rows', DEFAULT_FLUSH_ROWS))
+        self.fsync = bool(config.get('fsync', False))
+
+        self._extract = sink.extract
+        self.sink_supports_events = getattr(sink, 'supports_events', False)
+        self._queue: queue.Queue = queue.Queue(maxsize=int(config.get('queue_size', DEFAULT_QUEUE_SIZE)))
+        self._flush_requested = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.rows_logged = 0
+        self.events_logged = 0
+        self.rows_written = 0  # Sample rows only (what CSV/binary sinks hold)
+        self.events_written = 0
+        self.rows_dropped = 0
+        self.events_dropped = 0
+        self.flush_count = 0
+        self.write_errors = 0
+
+    def start(self):
+        """
+        Open the file, write the header and start the writer thread.
+
+        Raises:
+            OSError: If the file cannot be created
+        """
+        self.sink.open()
+        self._thread = threading.Thread(target=self._run, name='session-logger', daemon=True)
+        self._thread.start()
+
+    def log(self, status: dict) -> bool:
+        """
+        Queue one row (never blocks).
+
+        Args:
+            status: Status dictionary
+
+        Returns:
+            False if the row was dropped (writer behind or stopped)
+        """
+        if not self._thread:
+            return False
+        try:
+            self._queue.put_nowait(self._extract(status))
+        except queue.Full:
+            self.rows_dropped += 1
+            if self.rows_dropped == 1:
+                logger.warning(f"Session log writer falling behind - dropping rows ({self.path})")
+            return False
+        self.rows_logged += 1
+        return True
+
+    def log_event(self, event: str, data: dict) -> bool:
+        """
+        Queue an event record (never blocks; ignored by CSV/binary logs).
+
+        Args:
+            event: Event type (stage, safety, temperature, anomaly...)
+            data: Event fields (may be nested)
+
+        Returns:
+            False if the event was dropped or the format has no events
+        """
+        if not self._thread or not self.sink_supports_events:
+            return False
+        try:
+            self._queue.put_nowait(SessionEvent(time.time(), event, data))
+        except queue.Full:
+            self.events_dropped += 1
+            return False
+        self.events_logged += 1
+        return True
+
+    def request_flush(self):
+        """Ask the writer to flush soon (safe to call from a signal handler)."""
+        self._flush_requested.set()
+
+    def close(self, timeout: float = 5.0):
+        """
+        Write all queued rows, flush, fsync and close the file.
+
+        Args:
+            timeout: Seconds to wait for the writer thread
+        """
+        if not self._thread:
+            return
+        try:
+            self._queue.put(_CLOSE, timeout=timeout)
+        except queue.Full:
+            logger.error("Session log queue stuck - closing without remaining rows")
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            logger.error(f"Session log writer did not finish within {timeout:.0f}s")
+        self._thread = None
+
+    def _run(self):
+        """Writer loop (background thread)."""
+        pending = 0
+        last_flush = time.monotonic()
+        closing = False
+
+        while not closing:
+            if pending:
+                wait = max(0.0, min(MAX_IDLE_WAIT, last_flush + self.flush_interval - time.monotonic()))
+            else:
+                wait = MAX_IDLE_WAIT
+
+            # Take everything that is queued as one batch
+            batch = []
+            try:
+                item = self._queue.get(timeout=wait)
+                while True:
+                    if item is _CLOSE:
+                        closing = True
+                        break
+                    batch.append(item)
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            if batch:
+                pending += self._write_rows(batch)
+
+            now = time.monotonic()
+            if closing or self._flush_requested.is_set() or pending >= self.flush_rows or (
+                pending and now - last_flush >= self.flush_interval
+            ):
+                self._flush_requested.clear()
+                self._flush(sync=self.fsync or closing)
+                pending = 0
+                last_flush = now
+
+        try:
+            self.sink.close()
+        except OSError as e:
+            logger.error(f"Error closing session log: {e}")
+
+    def _write_rows(self, rows: list) -> int:
+        """Write a batch of rows and events (writer thread). Returns items written."""
+        try:
+            self.sink.write(rows)
+        except (OSError, ValueError, struct.error) as e:
+            self.write_errors += 1
+            logger.error(f"Failed to write session log: {e}")
+            return 0
+        events = 0
+        if self.sink_supports_events:
+            events = sum(1 for item in rows if type(item) is not list)
+        self.events_written += events
+        self.rows_written += len(rows) - events
+        return len(rows)
+
+    def _flush(self, sync: bool):
+        """Flush Python buffers, optionally fsync (writer thread)."""
+        try:
+            self.sink.flush(sync)
+            self.flush_count += 1
+        except (OSError, ValueError) as e:
+            self.write_errors += 1
+            logger.error(f"Failed to flush session log: {e}")
+
+    def get_stats(self) -> dict:
+        """
+        Get logger statistics.
+
+        Returns:
+            Dictionary with sample row and event counts, queue depth and
+            flushes ('written' counts sample rows only)
+        """
+        return {
+            'path': str(self.path),
+            'logged': self.rows_logged,
+            'events': self.events_logged,
+            'written': self.rows_written,
+            'events_written': self.events_written,
+            'dropped': self.rows_dropped,
+            'events_dropped': self.events_dropped,
+            'queued': self._queue.qsize(),
+            'flushes': self.flush_count,
+            'errors': self.write_errors
+        }
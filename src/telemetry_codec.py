@@ -0,0 +1,175 @@
+"""
+Compact binary telemetry encoding for battery charger status.
+
+Each sample is packed into a fixed little-endian layout with scaled integers
+(33 bytes instead of ~350 bytes of JSON). The first byte is the schema
+version, so consumers can reject frames they do not understand. The schema
+itself (field names, types, scales, units, enum tables) is published once as
+a retained JSON message; consumers decode with a single struct.unpack.
+
+Bump TELEMETRY_SCHEMA_VERSION whenever TELEMETRY_FIELDS or an enum changes.
+"""
+
+import json
+import struct
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_SCHEMA_VERSION = 1
+
+# Enumerations (index = wire value)
+MODES = ('unknown', 'IUoU', 'CV', 'CC', 'Conditioning', 'Pulse', 'Trickle')
+STATES = ('unknown', 'idle', 'charging', 'completed', 'error', 'stopped')
+STAGES = ('', 'bulk', 'absorption', 'float', 'pulse', 'rest', 'conditioning')
+
+ENUMS = {
+    'mode': MODES,
+    'state': STATES,
+    'stage': STAGES,
+}
+
+# (name, struct code, scale, unit) - wire value = round(value / scale)
+TELEMETRY_FIELDS = (
+    ('timestamp', 'I', 1, 's'),  # Unix time
+    ('voltage', 'H', 0.001, 'V'),
+    ('current', 'H', 0.001, 'A'),
+    ('power', 'H', 0.01, 'W'),
+    ('elapsed', 'I', 1, 's'),
+    ('progress', 'B', 1, '%'),
+    ('ah_delivered', 'I', 0.001, 'Ah'),
+    ('wh_delivered', 'I', 0.01, 'Wh'),
+    ('ah_stored', 'I', 0.001, 'Ah'),
+    ('temperature', 'h', 0.01, '°C'),  # TEMPERATURE_MISSING if no sensor
+    ('mode', 'B', None, None),  # Enum
+    ('state', 'B', None, None),  # Enum
+    ('stage', 'B', None, None),  # Enum
+)
+
+TEMPERATURE_MISSING = -32768
+
+_TYPE_NAMES = {
+    'B': 'uint8', 'H': 'uint16', 'I': 'uint32',
+    'b': 'int8', 'h': 'int16', 'i': 'int32',
+}
+_TYPE_RANGES = {
+    'B': (0, 0xFF), 'H': (0, 0xFFFF), 'I': (0, 0xFFFFFFFF),
+    'b': (-0x80, 0x7F), 'h': (-0x7FFF, 0x7FFF), 'i': (-0x7FFFFFFF, 0x7FFFFFFF),
+}
+
+TELEMETRY_FORMAT = '<B' + ''.join(code for _, code, _, _ in TELEMETRY_FIELDS)
+_STRUCT = struct.Struct(TELEMETRY_FORMAT)
+TELEMETRY_FRAME_SIZE = _STRUCT.size
+
+
+def build_schema() -> dict:
+    """
+    Build the schema document describing the binary frame.
+
+    Returns:
+        Schema dictionary (published retained as JSON)
+    """
+    fields = []
+    for name, code, scale, unit in TELEMETRY_FIELDS:
+        field = {'name': name, 'type': _TYPE_NAMES[code]}
+        if scale is not None:
+            field['scale'] = scale
+            field['unit'] = unit
+        else:
+            field['enum'] = name
+        fields.append(field)
+
+    return {
+        'version': TELEMETRY_SCHEMA_VERSION,
+        'byte_order': 'little',
+        'struct_format': TELEMETRY_FORMAT,
+        'frame_size': TELEMETRY_FRAME_SIZE,
+        'header': [{'name': 'version', 'type': 'uint8'}],
+        'fields': fields,
+        'enums': {name: list(values) for name, values in ENUMS.items()},
+        'missing': {'temperature': TEMPERATURE_MISSING},
+    }
+
+
+class TelemetryEncoder:
+    """Encodes status dictionaries into binary telemetry frames."""
+
+    def __init__(self):
+        # Precompute per-field packing info once
+        self._enum_index = {
+            name: {value: i for i, value in enumerate(values)}
+            for name, values in ENUMS.items()
+        }
+        self._numeric = [
+            (name, 1.0 / scale, _TYPE_RANGES[code])
+            for name, code, scale, _ in TELEMETRY_FIELDS
+            if scale is not None and name not in ('timestamp', 'temperature')
+        ]
+        self._temp_scale = 1.0 / 0.01
+        self._temp_range = _TYPE_RANGES['h']
+        self.schema_json = json.dumps(build_schema(), separators=(',', ':'))
+
+    def encode(self, status: dict, timestamp: float) -> bytes:
+        """
+        Encode one status sample.
+
+        Args:
+            status: Status dictionary (as passed to publish_status)
+            timestamp: Sample time (Unix seconds)
+
+        Returns:
+            Binary frame
+        """
+        values = [TELEMETRY_SCHEMA_VERSION, int(timestamp)]
+        for name, inv_scale, (low, high) in self._numeric:
+            raw = status.get(name) or 0.0
+            if raw != raw:  # NaN
+                raw = 0.0
+            wire = int(round(raw * inv_scale))
+            values.append(low if wire < low else high if wire > high else wire)
+
+        temperature = status.get('temperature')
+        if temperature is None or temperature != temperature:
+            values.append(TEMPERATURE_MISSING)
+        else:
+            low, high = self._temp_range
+            wire = int(round(temperature * self._temp_scale))
+            values.append(low if wire < low else high if wire > high else wire)
+
+        enum_index = self._enum_index
+        values.append(enum_index['mode'].get(status.get('mode'), 0))
+        values.append(enum_index['state'].get(status.get('state'), 0))
+        values.append(enum_index['stage'].get(status.get('stage', status.get('phase', '')), 0))
+
+        return _STRUCT.pack(*values)
+
+
+def decode_frame(payload: bytes) -> Optional[dict]:
+    """
+    Decode a binary telemetry frame.
+
+    Args:
+        payload: Frame bytes
+
+    Returns:
+        Dictionary with decoded values, or None if version/size mismatch
+    """
+    if len(payload) != TELEMETRY_FRAME_SIZE or payload[0] != TELEMETRY_SCHEMA_VERSION:
+        logger.warning(f"Unsupported telemetry frame ({len(payload)} bytes, version {payload[:1].hex()})")
+        return None
+
+    raw = _STRUCT.unpack(payload)
+    result = {'version': raw[0]}
+    for (name, code, scale, _), value in zip(TELEMETRY_FIELDS, raw[1:]):
+        if scale is None:
+            values = ENUMS[name]
+            result[name] = values[value] if value < len(values) else None
+        elif name == 'temperature' and value == TEMPERATURE_MISSING:
+            result[name] = None
+        elif scale == 1:
+            result[name] = value
+        else:
+            result[name] = round(value * scale, 6)
+    return result
+
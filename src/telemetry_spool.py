@@ -0,0 +1,215 @@
+"""
+Disk-backed telemetry spool for MQTT outages.
+
+While the broker is unreachable, status samples are appended to a small
+SQLite database instead of being dropped. After reconnecting they are
+replayed oldest-first to a backfill topic with their original timestamps.
+
+The spool is bounded on disk, not just by payload: max_bytes covers the
+database file plus its write-ahead log. A WAL_SHARE slice is reserved for
+the WAL (auto-checkpoint and journal_size_limit keep it there); the rest
+is the page budget of the database. The database uses incremental
+auto-vacuum, so after evicting the oldest samples the freed pages are
+returned and a truncating checkpoint shrinks both files. An outage of any
+length therefore cannot fill the SD card.
+"""
+
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fraction of the cap freed per eviction pass (amortizes DELETE cost)
+EVICTION_HEADROOM = 0.1
+# Fraction of max_bytes reserved for the write-ahead log
+WAL_SHARE = 0.05
+MIN_WAL_BYTES = 64 * 1024
+
+
+class TelemetrySpool:
+    """Bounded on-disk FIFO of (timestamp, topic, payload) records."""
+
+    def __init__(self, path: str = "telemetry_spool.db", max_bytes: int = 50 * 1024 * 1024):
+        """
+        Open (or create) the spool.
+
+        Args:
+            path: SQLite database file
+            max_bytes: Disk cap (database + WAL); oldest records are
+                evicted beyond it
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        # auto_vacuum must be set before the first table exists; an older
+        # spool without it is converted by one VACUUM (it is small)
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        converted = self._db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+        if converted:
+            self._db.execute("VACUUM")
+            logger.info(f"Telemetry spool {self.path}: enabled incremental auto-vacuum")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+
+        self.page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        wal_bytes = max(MIN_WAL_BYTES, int(max_bytes * WAL_SHARE))
+        # Checkpoint at half the WAL share: frame headers and the commit that
+        # crosses the threshold must still fit
+        self._db.execute(f"PRAGMA wal_autocheckpoint={max(1, wal_bytes // (2 * self.page_size))}")
+        self._db.execute(f"PRAGMA journal_size_limit={wal_bytes}")
+        self.db_max_bytes = max(max_bytes - wal_bytes, 4 * self.page_size)
+
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "ts REAL NOT NULL, "
+            "topic TEXT NOT NULL, "
+            "payload BLOB NOT NULL)"
+        )
+        self._db.commit()
+
+        row = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM spool").fetchone()
+        self.count, self.size_bytes = row
+        self.evicted = 0  # Records dropped by the size cap
+        if self.count:
+            logger.info(f"Telemetry spool {self.path}: {self.count} samples pending backfill")
+
+    def append(self, timestamp: float, topic: str, payload):
+        """
+        Append a record, evicting the oldest records if over the cap.
+
+        Args:
+            timestamp: Original sample time (Unix seconds)
+            topic: Topic suffix the record belongs to
+            payload: Message payload (str or bytes)
+        """
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT INTO spool (ts, topic, payload) VALUES (?, ?, ?)",
+                    (timestamp, topic, payload)
+                )
+                self.count += 1
+                self.size_bytes += len(payload)
+                evict = self._used_bytes() > self.db_max_bytes
+                if evict:
+                    self._evict()
+                self._db.commit()
+                if evict:
+                    self._shrink()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to spool telemetry: {e}")
+
+    def _used_bytes(self) -> int:
+        """Database pages in use (excluding free pages), in bytes."""
+        pages = self._db.execute("PRAGMA page_count").fetchone()[0]
+        free = self._db.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * self.page_size
+
+    def _shrink(self):
+        """Return free pages and truncate the database and WAL (lock held, after commit)."""
+        # executescript steps the pragma to completion (execute() would
+        # free a single page)
+        self._db.executescript("PRAGMA incremental_vacuum;")
+        self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _evict(self):
+        """Drop oldest records until the used pages are below the cap (lock held)."""
+        target = self.db_max_bytes * (1.0 - EVICTION_HEADROOM)
+        first = self.evicted == 0
+        while self.count > 0 and self._used_bytes() > target:
+            batch = max(1, self.count // 10)
+            rows = self._db.execute(
+                "SELECT id, LENGTH(payload) FROM spool ORDER BY id LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                break
+            self._db.execute("DELETE FROM spool WHERE id <= ?", (rows[-1][0],))
+            self.count -= len(rows)
+            self.size_bytes -= sum(size for _, size in rows)
+            self.evicted += len(rows)
+        if first:
+            logger.warning(f"Telemetry spool full ({self.max_bytes} bytes) - evicting oldest samples")
+        else:
+            logger.debug(f"Telemetry spool evicted {self.evicted} samples so far")
+
+    def peek(self, limit: int = 50) -> List[Tuple[int, float, str, bytes]]:
+        """
+        Get the oldest records without removing them.
+
+        Args:
+            limit: Maximum number of records
+
+        Returns:
+            List of (id, timestamp, topic, payload), oldest first
+        """
+        with self._lock:
+            try:
+                return self._db.execute(
+                    "SELECT id, ts, topic, payload FROM spool ORDER BY id LIMIT ?", (limit,)
+                ).fetchall()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to read telemetry spool: {e}")
+                return []
+
+    def ack(self, last_id: int):
+        """
+        Remove all records up to and including last_id (after replay).
+
+        Args:
+            last_id: Highest replayed record id
+        """
+        with self._lock:
+            try:
+                row = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM spool WHERE id <= ?",
+                    (last_id,)
+                ).fetchone()
+                self._db.execute("DELETE FROM spool WHERE id <= ?", (last_id,))
+                self._db.commit()
+                self.count -= row[0]
+                self.size_bytes -= row[1]
+                if self.count == 0:
+                    self._shrink()  # Backfill done - give the space back
+            except sqlite3.Error as e:
+                logger.error(f"Failed to acknowledge spooled telemetry: {e}")
+
+    def is_empty(self) -> bool:
+        """Check whether anything is waiting for backfill."""
+        return self.count == 0
+
+    def get_stats(self) -> dict:
+        """Get spool statistics."""
+        return {
+            'pending': self.count,
+            'bytes': self.size_bytes,
+            'disk_bytes': self._disk_bytes(),
+            'max_bytes': self.max_bytes,
+            'evicted': self.evicted
+        }
+
+    def _disk_bytes(self) -> int:
+        """Size of the database file and its WAL."""
+        total = 0
+        for path in (self.path, self.path.with_name(self.path.name + '-wal')):
+            try:
+                total += path.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            try:
+                self._db.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing telemetry spool: {e}")
@@ -0,0 +1,283 @@
+"""
+Opt-in high-rate V/I waveform streaming for pulse tuning and diagnostics.
+
+While enabled, a sampler thread reads voltage and current from the PSU at
+up to `rate` Hz and publishes batched frames every `frame_interval`
+seconds. Timestamps are delta-encoded in milliseconds against the frame
+start, so a 2 s frame at 5 Hz is ~10 small integers instead of 10 floats.
+
+Frame (JSON):
+    {"seq": 12, "t0": 1718000000.125, "dt": [0, 101, 99, ...],
+     "v": [13.812, ...], "i": [2.503, ...]}
+
+    sample n time = t0 + sum(dt[0..n]) / 1000
+
+The stream switches itself off after `timeout` seconds (re-enable to extend)
+and reports the new state through on_state. The sampler thread only exists
+while streaming, so it costs nothing when idle.
+
+Each sample is one SCPI transaction (MEAS:ALL?, see OwonPSU.measure_output)
+and the control loop always has priority over the PSU: the sampler never
+queues on the PSU lock (a busy PSU skips the sample), and after every
+sample it stays off the PSU for at least as long as the query took. The
+sampler therefore holds the PSU at most half the time, and the achievable
+rate is 1 / (2 x measured query time), e.g. 5 Hz for a 100 ms round
+trip. The status reports the measured query time and that limit.
+"""
+
+import json
+import time
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_RATE = 10.0  # Hz - request limit; the achievable rate is measured (see max_rate)
+MIN_IDLE_RATIO = 1.0  # Off the PSU for at least this x the last query time
+QUERY_TIME_ALPHA = 0.2  # EWMA weight of the newest query time
+MIN_FRAME_INTERVAL = 0.5  # s
+MAX_FRAME_INTERVAL = 60.0  # s
+MAX_TIMEOUT = 3600.0  # s
+
+
+class WaveformStreamer:
+    """Samples the PSU in a background thread and publishes batched V/I frames."""
+
+    def __init__(
+        self,
+        psu,
+        publish: Callable[[str], None],
+        config: Optional[dict] = None,
+        on_state: Optional[Callable[[dict], None]] = None
+    ):
+        """
+        Initialize waveform streamer.
+
+        Args:
+            psu: PSU instance (measure_output)
+            publish: Callback receiving each JSON frame
+            config: stream configuration dictionary (defaults for cmd/stream)
+            on_state: Callback receiving the stream state when the stream
+                switches itself off (timeout)
+        """
+        config = config or {}
+        self.psu = psu
+        self.publish = publish
+        self.on_state = on_state
+        self.rate = float(config.get('rate', 5.0))
+        self.frame_interval = float(config.get('frame_interval', 2.0))
+        self.timeout = float(config.get('timeout', 300.0))
+
+        self.enabled = False
+        self.expires_at = 0.0
+        self.frames_sent = 0
+        self.samples_sent = 0
+        self.read_errors = 0
+        self.samples_skipped = 0  # PSU busy with the control loop
+        self.query_time: Optional[float] = None  # s, EWMA of one V/I transaction
+        self._rate_warned = False
+        self._seq = 0
+        # Each run gets its own stop event, so a sampler still stuck in a PSU
+        # read after stop() exits on its own even if a new run has started
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def configure(self, params: dict) -> dict:
+        """
+        Apply a stream command.
+
+        Args:
+            params: Any of enabled (bool), rate (Hz), frame_interval (s),
+                    timeout (s). Missing keys keep their current value;
+                    missing 'enabled' means enable.
+
+        Returns:
+            Current stream state
+
+        Raises:
+            ValueError: If a parameter is out of range
+        """
+        rate = float(params.get('rate', self.rate))
+        frame_interval = float(params.get('frame_interval', self.frame_interval))
+        timeout = float(params.get('timeout', self.timeout))
+
+        if not 0.0 < rate <= MAX_RATE:
+            raise ValueError(f"Stream rate must be in (0, {MAX_RATE:.0f}] Hz, got {rate}")
+        if not MIN_FRAME_INTERVAL <= frame_interval <= MAX_FRAME_INTERVAL:
+            raise ValueError(
+                f"Stream frame_interval must be {MIN_FRAME_INTERVAL}-{MAX_FRAME_INTERVAL}s, got {frame_interval}"
+            )
+        if not 0.0 < timeout <= MAX_TIMEOUT:
+            raise ValueError(f"Stream timeout must be in (0, {MAX_TIMEOUT:.0f}]s, got {timeout}")
+
+        if rate != self.rate:
+            self._rate_warned = False
+        self.rate = rate
+        self.frame_interval = frame_interval
+        self.timeout = timeout
+
+        if params.get('enabled', True):
+            self.start()
+        else:
+            self.stop()
+        return self.get_status()
+
+    def start(self):
+        """Start (or extend) streaming."""
+        self.expires_at = time.time() + self.timeout
+        self.enabled = True
+        if self._thread and self._thread.is_alive() and not self._stop.is_set():
+            logger.info(f"Waveform stream extended ({self.rate:.1f}Hz, {self.timeout:.0f}s)")
+            return
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(self._stop,), name='waveform-stream', daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Waveform stream started ({self.rate:.1f}Hz, frames every "
+                    f"{self.frame_interval:.1f}s, auto-off in {self.timeout:.0f}s)")
+
+    def stop(self):
+        """Stop streaming (flushes the current frame)."""
+        self.enabled = False
+        self._stop.set()
+        thread = self._thread
+        if thread and thread is not threading.current_thread():
+            thread.join(timeout=2.0)
+        if thread and not thread.is_alive():
+            self._thread = None
+        # else: still in a PSU read - it exits on its (set) stop event
+
+    def _run(self, stop: threading.Event):
+        """
+        Sampler loop (background thread).
+
+        Args:
+            stop: This run's stop event
+        """
+        timed_out = False
+        t0 = None
+        last_ms = 0
+        dt, volts, amps = [], [], []
+        frame_start = time.monotonic()
+        next_sample = frame_start
+
+        while not stop.is_set():
+            if time.time() >= self.expires_at:
+                logger.info("Waveform stream timed out - stopping")
+                self.enabled = False
+                stop.set()
+                timed_out = True
+                break
+
+            voltage = None
+            query_time = 0.0
+            started = time.monotonic()
+            try:
+                reading = self.psu.measure_output(blocking=False)
+                query_time = time.monotonic() - started
+                if reading is None:
+                    self.samples_skipped += 1
+                else:
+                    voltage, current = reading
+                    sample_time = time.time()
+                    self._update_query_time(query_time)
+            except Exception as e:
+                query_time = time.monotonic() - started
+                self.read_errors += 1
+                logger.debug(f"Waveform sample failed: {e}")
+
+            if voltage is not None:
+                ms = int(round(sample_time * 1000))
+                if t0 is None:
+                    t0 = sample_time
+                    last_ms = ms
+                dt.append(ms - last_ms)
+                last_ms = ms
+                volts.append(round(voltage, 3))
+                amps.append(round(current, 3))
+
+            now = time.monotonic()
+            if now - frame_start >= self.frame_interval:
+                self._flush(t0, dt, volts, amps)
+                t0 = None
+                dt, volts, amps = [], [], []
+                frame_start = now
+
+            # Fixed-rate schedule, but always stay off the PSU (lock
+            # released) for at least MIN_IDLE_RATIO x the query time so a
+            # control-loop read waiting on the lock gets the PSU first
+            now = time.monotonic()
+            next_sample += 1.0 / self.rate
+            min_idle = query_time * MIN_IDLE_RATIO
+            if next_sample - now < min_idle:
+                next_sample = now + min_idle
+            stop.wait(next_sample - now)
+
+        self._flush(t0, dt, volts, amps)
+        if timed_out and self.on_state:
+            try:
+                self.on_state(self.get_status())
+            except Exception as e:
+                logger.error(f"Failed to publish stream state: {e}")
+
+    def _update_query_time(self, query_time: float):
+        """Track the PSU transaction time and warn once if the rate is unreachable."""
+        if self.query_time is None:
+            self.query_time = query_time
+        else:
+            self.query_time += QUERY_TIME_ALPHA * (query_time - self.query_time)
+        max_rate = self.get_max_rate()
+        if max_rate and self.rate > max_rate and not self._rate_warned:
+            self._rate_warned = True
+            logger.warning(
+                f"Waveform stream rate {self.rate:.1f}Hz exceeds what the PSU allows "
+                f"({self.query_time * 1000:.0f}ms per query) - streaming at ~{max_rate:.1f}Hz"
+            )
+
+    def get_max_rate(self) -> Optional[float]:
+        """
+        Get the achievable sample rate from the measured query time.
+
+        Returns:
+            Hz, or None before the first sample
+        """
+        if not self.query_time:
+            return None
+        return 1.0 / (self.query_time * (1.0 + MIN_IDLE_RATIO))
+
+    def _flush(self, t0: Optional[float], dt: list, volts: list, amps: list):
+        """Publish one frame (no-op if empty)."""
+        if not dt:
+            return
+        frame = {'seq': self._seq, 't0': round(t0, 3), 'dt': dt, 'v': volts, 'i': amps}
+        self._seq += 1
+        try:
+            self.publish(json.dumps(frame, separators=(',', ':')))
+            self.frames_sent += 1
+            self.samples_sent += len(dt)
+        except Exception as e:
+            logger.error(f"Failed to publish waveform frame: {e}")
+
+    def get_status(self) -> dict:
+        """
+        Get stream state.
+
+        Returns:
+            Status dictionary
+        """
+        return {
+            'enabled': self.enabled,
+            'rate': self.rate,
+            'frame_interval': self.frame_interval,
+            'timeout': self.timeout,
+            'expires_in': round(max(0.0, self.expires_at - time.time()), 1) if self.enabled else 0,
+            'frames_sent': self.frames_sent,
+            'samples_sent': self.samples_sent,
+            'read_errors': self.read_errors,
+            'samples_skipped': self.samples_skipped,
+            'query_ms': round(self.query_time * 1000.0, 1) if self.query_time else None,
+            'max_rate': round(self.get_max_rate(), 1) if self.query_time else None
+        }
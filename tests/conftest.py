@@ -0,0 +1,11 @@
+"""
+Shared test setup.
+
+The charger modules live flat in src/ and import each other by module name
+(as when run from src/ by the service), so src/ goes on sys.path.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
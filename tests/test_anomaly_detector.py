@@ -0,0 +1,34 @@
+"""Tests for the anomaly detector on filtered measurements."""
+
+from anomaly_detector import AnomalyDetector
+from measurement_filter import MeasurementFilter
+
+
+def run(samples, filtered):
+    detector = AnomalyDetector({'voltage_step': {'action': 'derate'}})
+    measurement_filter = MeasurementFilter()
+    events = []
+    for n, (voltage, current) in enumerate(samples):
+        m = measurement_filter.update(voltage, current, voltage * current)
+        if filtered:
+            if not measurement_filter.ready:
+                continue
+            voltage, current = m.voltage, m.current
+        events += detector.update(voltage, current, mode='CC', now=1000.0 + n) or []
+    return events
+
+
+def cc_samples(dropout_at):
+    samples = [(12.5 + 0.001 * n, 4.4) for n in range(60)]
+    samples[dropout_at] = (0.0, 4.4)  # Voltage parse error
+    return samples
+
+
+def test_raw_dropout_looks_like_voltage_step():
+    kinds = {e.kind for e in run(cc_samples(40), filtered=False)}
+    assert {'voltage_step', 'noise_burst'} <= kinds
+
+
+def test_filtered_dropout_raises_no_event():
+    assert run(cc_samples(40), filtered=True) == []
+    assert run(cc_samples(0), filtered=True) == []
@@ -0,0 +1,111 @@
+"""Tests for cron parsing and the heap-based charge scheduler."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from charge_scheduler import BUSY_RETRY_INTERVAL, ChargeScheduler, CronSpec
+
+# Far enough ahead that add_job's "now" never matters
+BASE = datetime(2035, 3, 1, 12, 0)  # Thursday
+
+
+class Recorder:
+    """Scheduler callbacks that record what was started."""
+
+    def __init__(self, scheduler):
+        self.events = []
+        scheduler.set_callbacks(
+            on_start=lambda: self.events.append('start'),
+            on_stop=lambda: self.events.append('stop'),
+            on_profile=lambda profile: self.events.append(f'profile:{profile}'),
+            on_mode=lambda mode: self.events.append(f'mode:{mode}')
+        )
+
+
+@pytest.mark.parametrize('expression, after, expected', [
+    ('0 2 * * 6', BASE, datetime(2035, 3, 3, 2, 0)),  # Next Saturday 02:00
+    ('*/15 * * * *', BASE, datetime(2035, 3, 1, 12, 15)),
+    ('30 12 1 * *', BASE, datetime(2035, 3, 1, 12, 30)),
+    ('0 0 29 2 *', BASE, datetime(2036, 2, 29, 0, 0)),  # Leap day
+    ('@daily', BASE, datetime(2035, 3, 2, 0, 0)),
+    ('0 6 1 * 1', BASE, datetime(2035, 3, 5, 6, 0)),  # Day fields OR: Monday
+])
+def test_cron_next_after(expression, after, expected):
+    assert CronSpec(expression).next_after(after) == expected
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '0 0 30 2 *', 'a * * * *'])
+def test_cron_invalid(expression):
+    with pytest.raises(ValueError):
+        CronSpec(expression).next_after(BASE)
+
+
+def test_jobs_start_in_due_order():
+    scheduler = ChargeScheduler()
+    recorder = Recorder(scheduler)
+    late = scheduler.add_job(start_time=BASE + timedelta(hours=2), profile='late')
+    early = scheduler.add_job(start_time=BASE + timedelta(hours=1), profile='early')
+    assert scheduler.next_deadline() == (BASE + timedelta(hours=1)).timestamp()
+
+    scheduler.update(now=BASE + timedelta(hours=1), charging=False)
+    assert scheduler.active_job.job_id == early
+    scheduler.update(now=BASE + timedelta(hours=1, minutes=30), charging=False)  # Finished
+    scheduler.update(now=BASE + timedelta(hours=2), charging=False)
+    assert scheduler.active_job.job_id == late
+    assert recorder.events == ['profile:early', 'start', 'profile:late', 'start']
+
+
+def test_due_job_waits_while_busy():
+    scheduler = ChargeScheduler()
+    recorder = Recorder(scheduler)
+    scheduler.add_job(start_time=BASE)
+    scheduler.update(now=BASE, charging=True)
+    assert recorder.events == []
+    assert scheduler.next_deadline() == BASE.timestamp() + BUSY_RETRY_INTERVAL
+    scheduler.update(now=BASE + timedelta(seconds=BUSY_RETRY_INTERVAL), charging=False)
+    assert recorder.events == ['start']
+
+
+def test_cancelled_job_dropped_lazily():
+    scheduler = ChargeScheduler()
+    recorder = Recorder(scheduler)
+    first = scheduler.add_job(start_time=BASE)
+    second = scheduler.add_job(start_time=BASE + timedelta(minutes=5))
+    assert scheduler.cancel_schedule(first)
+    assert scheduler.next_deadline() == (BASE + timedelta(minutes=5)).timestamp()
+    scheduler.update(now=BASE + timedelta(minutes=5), charging=False)
+    assert scheduler.active_job.job_id == second
+    assert recorder.events == ['start']
+    assert not scheduler.cancel_schedule(first)
+
+
+def test_duration_and_ah_target_stop_the_run():
+    scheduler = ChargeScheduler()
+    recorder = Recorder(scheduler)
+    scheduler.add_job(start_time=BASE, duration=3600)
+    scheduler.update(now=BASE, charging=False)
+    assert scheduler.next_deadline() == BASE.timestamp() + 3600
+    scheduler.update(now=BASE + timedelta(hours=1), charging=True)
+    assert recorder.events == ['start', 'stop']
+
+    scheduler.add_job(start_time=BASE + timedelta(hours=2), ah_target=10)
+    scheduler.update(now=BASE + timedelta(hours=2), charging=False)
+    scheduler.update(now=BASE + timedelta(hours=3), charging=True, ah_delivered=10.5)
+    assert recorder.events == ['start', 'stop', 'start', 'stop']
+
+
+def test_recurring_jobs_requeue():
+    scheduler = ChargeScheduler()
+    Recorder(scheduler)
+    cron_job = scheduler.add_job(start_time=BASE, cron='0 2 * * 6')
+    every_job = scheduler.add_job(start_time=BASE, every_days=30)
+    assert scheduler.jobs[cron_job].next_run == datetime(2035, 3, 3, 2, 0)
+
+    scheduler.update(now=BASE, charging=False)  # every_days job is due first
+    scheduler.update(now=BASE + timedelta(hours=1), charging=False)
+    assert scheduler.jobs[every_job].next_run == BASE + timedelta(days=30)
+
+    scheduler.update(now=datetime(2035, 3, 3, 2, 0), charging=False)
+    assert scheduler.jobs[cron_job].runs == 1
+    assert scheduler.jobs[cron_job].next_run == datetime(2035, 3, 10, 2, 0)
@@ -0,0 +1,28 @@
+"""Tests for the session log field registry."""
+
+import pytest
+
+from log_fields import compile_fields
+
+
+def test_status_alias_and_computed_fields():
+    extract = compile_fields(['voltage_measured', 'stage', 'voltage_setpoint', 'ah_delivered'])
+    status = {'voltage': 13.2, 'phase': 'pulse', 'target_voltage': 15.5}
+    assert extract(status) == [13.2, 'pulse', 15.5, '']
+
+
+def test_unknown_field_rejected():
+    with pytest.raises(ValueError, match='nonsense'):
+        compile_fields(['voltage', 'nonsense'])
+
+
+def test_current_setpoint_prefers_psu_limit():
+    extract = compile_fields(['current_setpoint'])
+    # Derated to half of the mode's bulk current
+    assert extract({'bulk_current': 5.0, 'current_setpoint': 2.5}) == [2.5]
+
+
+def test_current_setpoint_falls_back_to_mode_keys():
+    extract = compile_fields(['current_setpoint'])
+    assert extract({'bulk_current': 5.0, 'current_setpoint': None}) == [5.0]
+    assert extract({'target_current': 4.4}) == [4.4]
@@ -0,0 +1,101 @@
+"""Tests for measurement filtering and the dropout handling of the modes."""
+
+from measurement_filter import ChannelFilter, MeasurementFilter
+from charging_modes import ConstantVoltageMode, IUoUMode
+
+
+class FakePSU:
+    """PSU double returning scripted (voltage, current) readings."""
+
+    def __init__(self, readings):
+        self.readings = list(readings)
+        self.voltage = None
+        self.current = None
+        self.output = False
+        self._sample = (0.0, 0.0)
+
+    def set_voltage(self, voltage):
+        self.voltage = voltage
+
+    def set_current(self, current):
+        self.current = current
+
+    def set_output(self, enabled):
+        self.output = enabled
+
+    def set_display_text(self, text):
+        pass
+
+    def measure_voltage(self):
+        self._sample = self.readings.pop(0)
+        return self._sample[0]
+
+    def measure_current(self):
+        return self._sample[1]
+
+    def measure_power(self):
+        return self._sample[0] * self._sample[1]
+
+
+def test_median_rejects_single_spike():
+    channel = ChannelFilter(median_window=3)
+    outputs = [channel.update(v) for v in (13.0, 13.0, 20.0, 13.0)]
+    assert outputs[-2:] == [13.0, 13.0]
+
+
+def test_zero_dropout_held():
+    f = MeasurementFilter()
+    for _ in range(3):
+        f.update(13.5, 4.0, 54.0)
+    m = f.update(0.0, 0.0, 0.0)
+    assert m.voltage == 13.5
+    assert m.current == 4.0
+    assert m.voltage_raw == 0.0
+    assert f.get_stats()['current_dropouts'] == 1
+
+
+def test_persistent_zero_accepted_after_hold():
+    channel = ChannelFilter(median_window=1, reject_zero=True, dropout_hold=2)
+    channel.update(2.0)
+    assert [channel.update(0.0) for _ in range(3)] == [2.0, 2.0, 0.0]
+
+
+def test_not_ready_until_window_full():
+    f = MeasurementFilter({'median_window': 3})
+    f.update(13.0, 0.0, 0.0)  # Leading dropout: left out of the window
+    f.update(13.0, 4.0, 52.0)
+    f.update(13.0, 4.0, 52.0)
+    assert not f.ready
+    f.update(13.0, 4.0, 52.0)
+    assert f.ready
+
+
+def test_cv_first_sample_dropout_keeps_charging():
+    psu = FakePSU([(13.8, 0.0)] + [(13.8, 3.0)] * 4)
+    mode = ConstantVoltageMode(psu, {'voltage': 13.8, 'max_current': 5.0, 'min_current': 0.5})
+    assert mode.start()
+    for _ in range(5):
+        mode.update()
+        assert mode.state == "charging"
+
+
+def test_cv_completes_on_real_low_current():
+    psu = FakePSU([(13.8, 0.2)] * 3)
+    mode = ConstantVoltageMode(psu, {'voltage': 13.8, 'max_current': 5.0, 'min_current': 0.5})
+    mode.start()
+    states = []
+    for _ in range(3):
+        mode.update()
+        states.append(mode.state)
+    assert states == ["charging", "charging", "completed"]
+
+
+def test_iuou_dropout_does_not_leave_absorption():
+    psu = FakePSU([(14.4, 3.0)] * 3 + [(14.4, 0.0)] + [(14.4, 3.0)] * 2)
+    mode = IUoUMode(psu, {'bulk_current': 5.0, 'absorption_voltage': 14.4,
+                          'absorption_current_threshold': 1.0})
+    mode.start()
+    for _ in range(6):
+        mode.update()
+    assert mode.stage == "absorption"
+    assert mode.state == "charging"
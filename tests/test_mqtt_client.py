@@ -0,0 +1,109 @@
+"""Tests for change-driven status publishing and spool backfill."""
+
+import json
+
+import paho.mqtt.client as mqtt
+import pytest
+
+import mqtt_client
+from mqtt_client import ChargerMQTTClient
+
+
+class FakeInfo:
+    def __init__(self, rc):
+        self.rc = rc
+
+
+class FakeClient:
+    """paho client double; publishes fail while `up` is False."""
+
+    def __init__(self):
+        self.up = True
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        if not self.up:
+            return FakeInfo(mqtt.MQTT_ERR_NO_CONN)
+        self.published.append((topic, payload))
+        return FakeInfo(mqtt.MQTT_ERR_SUCCESS)
+
+    def topics(self, suffix):
+        return [payload for topic, payload in self.published if topic.endswith(suffix)]
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(mqtt_client.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = ChargerMQTTClient({
+        'base_topic': 'bc',
+        'update_interval': 0,
+        'heartbeat_interval': 60,
+        'spool': {'path': str(tmp_path / 'spool.db'), 'backfill_rate': 0},
+    })
+    client.client = FakeClient()
+    client.connected = True
+    yield client
+    client.spool.close()
+
+
+def status(voltage, current=2.0):
+    return {'voltage': voltage, 'current': current, 'power': voltage * current,
+            'mode': 'CV', 'state': 'charging'}
+
+
+def publish(client, clock, sample, dt=5.0):
+    clock.now += dt
+    client.publish_status(sample)
+
+
+def test_deadband_suppresses_small_changes(client, clock):
+    publish(client, clock, status(13.500))
+    publish(client, clock, status(13.502))  # Inside the 5 mV deadband
+    publish(client, clock, status(13.510))
+    assert client.client.topics('/status/voltage') == ['13.5', '13.51']
+    assert client.suppressed_count > 0
+
+
+def test_heartbeat_republishes_unchanged_value(client, clock):
+    publish(client, clock, status(13.5))
+    publish(client, clock, status(13.5), dt=30)
+    publish(client, clock, status(13.5), dt=31)  # 61 s since the last publish
+    assert client.client.topics('/status/voltage') == ['13.5', '13.5']
+
+
+def test_failed_publish_not_cached(client, clock):
+    publish(client, clock, status(13.5))
+    client.client.up = False
+    publish(client, clock, status(13.6))  # Lost
+    client.client.up = True
+    publish(client, clock, status(13.6))
+    assert client.client.topics('/status/voltage') == ['13.5', '13.6']
+
+
+def test_spool_backfill_round_trip(client, clock):
+    client.connected = False
+    publish(client, clock, status(12.9))
+    publish(client, clock, status(13.0))
+    assert client.spool.count == 2
+
+    client.connected = True
+    client._backfill_loop()
+    replayed = [json.loads(payload) for payload in client.client.topics('/backfill/json')]
+    assert [doc['voltage'] for doc in replayed] == [12.9, 13.0]
+    assert replayed[0]['timestamp'] < replayed[1]['timestamp']
+    assert client.spool.is_empty()
+    assert client.backfill_count == 2
@@ -0,0 +1,78 @@
+"""Tests for the multi-charger MQTT gateway batching."""
+
+import json
+
+import paho.mqtt.client as mqtt
+
+from mqtt_gateway import MQTTGateway
+
+
+class FakeInfo:
+    def __init__(self, rc):
+        self.rc = rc
+
+
+class FakeClient:
+    """paho client double; publishes fail while `up` is False."""
+
+    def __init__(self):
+        self.up = True
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        if not self.up:
+            return FakeInfo(mqtt.MQTT_ERR_NO_CONN)
+        self.published.append((topic, payload))
+        return FakeInfo(mqtt.MQTT_ERR_SUCCESS)
+
+
+def make_gateway(tmp_path):
+    gateway = MQTTGateway({'base_topic': 'bc', 'gateway': {'batch_interval': 0.05}})
+    channel = gateway.add_channel('a', {
+        'update_interval': 0,
+        'spool': {'path': str(tmp_path / 'spool.db')}
+    })
+    gateway.client = FakeClient()
+    gateway.connected = True
+    channel.connected = True
+    return gateway, channel
+
+
+STATUS = {'voltage': 13.5, 'current': 2.0, 'power': 27.0, 'mode': 'CV', 'state': 'charging'}
+
+
+def test_batch_published_in_order(tmp_path):
+    gateway, channel = make_gateway(tmp_path)
+    channel.publish_status(STATUS)
+    gateway._flush()
+    topics = [topic for topic, _ in gateway.client.published]
+    assert topics[0] == 'bc/a/status/voltage'
+    assert topics[-1] == 'bc/a/status/json'
+    assert channel.spool.is_empty()
+    channel.spool.close()
+
+
+def test_retained_superseded_in_batch_coalesced(tmp_path):
+    gateway, channel = make_gateway(tmp_path)
+    gateway.submit('bc/a/status/mode', 'CV', 1, True)
+    gateway.submit('bc/a/status/mode', 'CC', 1, True)
+    gateway._flush()
+    assert gateway.client.published == [('bc/a/status/mode', 'CC')]
+    assert gateway.coalesced_count == 1
+    channel.spool.close()
+
+
+def test_queued_sample_spooled_when_connection_drops(tmp_path):
+    gateway, channel = make_gateway(tmp_path)
+    channel.publish_status(STATUS)  # Queued while connected
+    gateway.client.up = False  # Connection lost before the flush
+    gateway._flush()
+
+    records = channel.spool.peek(10)
+    assert len(records) == 1  # One sample, however many of its messages failed
+    _, _, topic, payload = records[0]
+    assert topic == 'json'
+    document = json.loads(payload)
+    assert document['voltage'] == 13.5
+    assert 'timestamp' in document
+    channel.spool.close()
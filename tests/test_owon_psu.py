@@ -0,0 +1,84 @@
+"""Tests for the MEAS:ALL? handling of the PSU driver."""
+
+from owon_psu import OwonPSU, MEAS_ALL_MAX_FAILURES
+
+
+class FakeSerial:
+    """Serial double answering SCPI queries from a reply table."""
+
+    def __init__(self, replies):
+        self.replies = replies  # command -> reply string or list of replies
+        self.timeout = 5.0
+        self.is_open = True
+        self.sent = []
+        self._pending = b''
+
+    def reset_input_buffer(self):
+        self._pending = b''
+
+    def write(self, data):
+        command = data.decode().strip()
+        self.sent.append(command)
+        reply = self.replies.get(command, '')
+        if isinstance(reply, list):
+            reply = reply.pop(0) if reply else ''
+        self._pending = f"{reply}\n".encode() if reply else b''
+
+    def flush(self):
+        pass
+
+    def readline(self):
+        return self._pending
+
+
+def make_psu(replies):
+    psu = OwonPSU('/dev/null')
+    psu.serial = FakeSerial(replies)
+    psu._connected = True
+    return psu
+
+
+def test_probe_detects_support():
+    psu = make_psu({'MEAS:ALL?': '13.500,2.100,28.35'})
+    psu._probe_meas_all()
+    assert psu._meas_all_supported
+    assert psu.serial.timeout == 5.0
+    assert psu.measure_output() == (13.5, 2.1)
+
+
+def test_probe_explicit_error_reply():
+    psu = make_psu({'MEAS:ALL?': 'ERR', 'MEAS:VOLT?': '13.5'})
+    psu._probe_meas_all()
+    assert not psu._meas_all_supported
+    assert psu.serial.sent == ['MEAS:ALL?']
+
+
+def test_probe_silent_firmware():
+    psu = make_psu({'MEAS:VOLT?': '13.5'})
+    psu._probe_meas_all()
+    assert not psu._meas_all_supported
+
+
+def test_single_hiccup_keeps_meas_all():
+    psu = make_psu({'MEAS:ALL?': ['', '13.5,2.0'], 'MEAS:VOLT?': '13.4', 'MEAS:CURR?': '2.1'})
+    psu._meas_all_supported = True
+    assert psu.measure_output() == (13.4, 2.1)  # Fallback for this sample
+    assert psu._meas_all_supported
+    assert psu.measure_output() == (13.5, 2.0)
+    assert psu._meas_all_failures == 0
+
+
+def test_repeated_failures_with_working_fallback_disable_meas_all():
+    psu = make_psu({'MEAS:VOLT?': '13.4', 'MEAS:CURR?': '2.1'})
+    psu._meas_all_supported = True
+    for _ in range(MEAS_ALL_MAX_FAILURES):
+        psu.measure_output()
+    assert not psu._meas_all_supported
+
+
+def test_failures_without_working_fallback_keep_meas_all():
+    psu = make_psu({})  # Link down: nothing answers
+    psu._meas_all_supported = True
+    for _ in range(MEAS_ALL_MAX_FAILURES + 1):
+        assert psu.measure_output() == (0.0, 0.0)
+    assert psu._meas_all_supported
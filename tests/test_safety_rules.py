@@ -0,0 +1,106 @@
+"""Tests for safety rule compilation and evaluation."""
+
+import pytest
+
+from safety_monitor import SafetyLimits, SafetyMonitor
+from safety_rules import SafetyRule, SafetyRuleTable, compile_rules
+
+
+def make_limits(rules=None):
+    return SafetyLimits(
+        absolute_max_voltage=16.0,
+        absolute_max_current=10.0,
+        min_voltage=10.5,
+        warning_voltage=12.0,
+        max_charging_duration=86400,
+        rules=rules or []
+    )
+
+
+def test_compile_builtin_and_profile_rules():
+    table = compile_rules(make_limits(), [
+        {'name': 'gassing', 'field': 'voltage', 'type': 'max', 'limit': 14.8},
+    ])
+    assert [r.name for r in table.rules][-1] == 'gassing'
+    assert table.count == 6
+
+
+@pytest.mark.parametrize('rule', [
+    {'name': 'x', 'field': 'pressure', 'type': 'max', 'limit': 1},
+    {'name': 'x', 'field': 'voltage', 'type': 'above', 'limit': 1},
+    {'name': 'x', 'field': 'voltage', 'type': 'rate', 'limit': 1},
+    {'name': 'x', 'field': 'voltage', 'type': 'max'},
+    {'name': 'x', 'field': 'voltage', 'type': 'max', 'limit': 1,
+     'message': '{name} too high: {volts:.2f}'},
+    {'name': 'x', 'field': 'voltage', 'type': 'max', 'limit': 1,
+     'message': '{severity:.2f}'},
+])
+def test_invalid_rule_rejected(rule):
+    with pytest.raises(ValueError):
+        compile_rules(make_limits(), [rule])
+
+
+def test_duplicate_names_rejected():
+    rule = SafetyRule(name='a', field='voltage', type='max', limit=1.0)
+    with pytest.raises(ValueError):
+        SafetyRuleTable([rule, rule])
+
+
+def test_max_rule_transitions_with_hysteresis():
+    table = SafetyRuleTable([SafetyRule(
+        name='hot', field='voltage', type='max', limit=14.0,
+        hysteresis=0.2, severity='critical'
+    )])
+    assert table.evaluate(0, 13.9, 1, 0, None, 0) == ()
+    assert table.evaluate(1, 14.1, 1, 0, None, 0) == [(0, True)]
+    assert table.critical_active == 1
+    assert table.evaluate(2, 13.9, 1, 0, None, 0) == ()  # Inside hysteresis
+    assert table.evaluate(3, 13.7, 1, 0, None, 0) == [(0, False)]
+    assert table.critical_active == 0
+
+
+def test_duration_above_trips_after_hold_time():
+    table = SafetyRuleTable([SafetyRule(
+        name='gassing', field='voltage', type='duration_above', limit=15.0, duration=10
+    )])
+    assert table.evaluate(100, 15.5, 1, 0, None, 0) == ()
+    assert table.evaluate(105, 15.5, 1, 0, None, 0) == ()
+    assert table.evaluate(110, 15.5, 1, 0, None, 0) == [(0, True)]
+
+
+def test_rate_rule_uses_window():
+    table = SafetyRuleTable([SafetyRule(
+        name='runaway', field='temperature', type='rate', limit=0.5, duration=60
+    )])
+    assert table.evaluate(0, 13, 1, 0, 25.0, 0) == ()
+    assert table.evaluate(30, 13, 1, 0, 26.0, 0) == ()
+    assert table.evaluate(60, 13, 1, 0, 26.0, 0) == [(0, True)]
+    assert 'rising 1.000' in table.format_message(0)
+
+
+def test_temperature_compensated_limit():
+    table = SafetyRuleTable([SafetyRule(
+        name='comp', field='voltage', type='max', limit=14.7,
+        temp_coefficient=-0.018, temp_reference=25.0
+    )])
+    assert table.evaluate(0, 14.6, 1, 0, 35.0, 0) == [(0, True)]  # Limit 14.52 V
+
+
+def test_bad_template_falls_back_to_default():
+    rule = SafetyRule(name='v', field='voltage', type='max', limit=14.0,
+                      severity='critical')
+    table = SafetyRuleTable([rule])
+    rule.message = '{name} too high: {volts:.2f}'  # Bypasses validate()
+    table.evaluate(0, 15.0, 1, 0, None, 0)
+    assert table.format_message(0) == 'CRITICAL: Voltage 15.00V exceeds 14.00V (v)'
+
+
+def test_monitor_stops_on_critical_profile_rule():
+    monitor = SafetyMonitor(make_limits([
+        {'name': 'gassing', 'field': 'voltage', 'type': 'max', 'limit': 14.8,
+         'severity': 'critical', 'message': '{name}: {value:.2f}{unit} > {limit:.2f}{unit}'},
+    ]))
+    monitor.start_monitoring()
+    result = monitor.check_safety(15.0, 2.0)
+    assert result['should_stop']
+    assert 'gassing: 15.00V > 14.80V' in result['violations']
@@ -0,0 +1,87 @@
+"""Tests for the binary session log writer and reader."""
+
+import gzip
+import math
+import shutil
+
+import pytest
+
+from session_log import INDEX_INTERVAL, RECORD_SIZE, BinarySessionSink, SessionLogReader
+
+T0 = 1900000000.0
+
+
+def make_rows(count, absorption_from):
+    rows = []
+    for i in range(count):
+        stage = 'bulk' if i < absorption_from else 'absorption'
+        # unix_time, V, I, P, V set, I set, elapsed, Ah, Wh, Ah stored, temp, stage, state
+        rows.append([T0 + i, 13.0 + i * 0.001, 4.0, 52.0, 14.4, 4.0, float(i),
+                     i / 3600.0, 0.0, 0.0, '', stage, 'charging'])
+    return rows
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = tmp_path / 'session.bclog'
+    sink = BinarySessionSink(path, {'profile': 'test'})
+    sink.open()
+    rows = make_rows(1000, absorption_from=600)
+    sink.write(rows[:500])
+    sink.write(rows[500:])
+    sink.flush(sync=True)
+    sink.close()
+    return path
+
+
+def test_round_trip(log_path):
+    reader = SessionLogReader(log_path)
+    assert len(reader) == 1000
+    assert reader.header['profile'] == 'test'
+    record = reader.record(600)
+    assert record['unix_time'] == T0 + 600
+    assert record['voltage'] == pytest.approx(13.6, abs=1e-5)
+    assert record['stage'] == 'absorption'
+    assert record['state'] == 'charging'
+    assert math.isnan(record['temperature'])
+    reader.close()
+
+
+def test_time_and_stage_lookup(log_path):
+    reader = SessionLogReader(log_path)
+    assert reader.find_time(T0 + 300.5) == 301
+    assert reader.find_time(T0 - 1) == 0
+    assert reader.find_time(T0 + 5000) == 1000
+    assert reader.time_range(T0 + 10, T0 + 20) == (10, 20)
+    assert reader.stage_segments() == [('bulk', 0, 600), ('absorption', 600, 1000)]
+    assert reader.stage_ranges('absorption') == [(600, 1000)]
+    reader.close()
+
+
+def test_partial_record_and_missing_index(log_path):
+    with open(log_path, 'ab') as f:
+        f.write(b'\x00' * (RECORD_SIZE // 2))  # Crash mid-record
+    (log_path.parent / (log_path.name + '.idx')).unlink()
+
+    reader = SessionLogReader(log_path)
+    assert len(reader) == 1000
+    assert reader.stage_ranges('absorption') == [(600, 1000)]
+    assert reader.find_time(T0 + INDEX_INTERVAL + 3) == INDEX_INTERVAL + 3
+    reader.close()
+
+
+def test_compressed_log(log_path):
+    gz_path = log_path.parent / (log_path.name + '.gz')
+    with open(log_path, 'rb') as src, gzip.open(gz_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    reader = SessionLogReader(gz_path)
+    assert len(reader) == 1000
+    assert reader.record(999)['unix_time'] == T0 + 999
+    reader.close()
+
+
+def test_not_a_log(tmp_path):
+    path = tmp_path / 'other.bclog'
+    path.write_bytes(b'timestamp,voltage\n')
+    with pytest.raises(ValueError):
+        SessionLogReader(path)
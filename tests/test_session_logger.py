@@ -0,0 +1,43 @@
+"""Tests for the buffered session logger."""
+
+import csv
+import json
+
+from session_logger import SessionLogger, create_session_sink
+
+FIELDS = ['timestamp', 'voltage', 'current', 'stage']
+
+
+def run_session(sink):
+    session = SessionLogger(sink, {'flush_rows': 2})
+    session.start()
+    for n in range(5):
+        session.log({'voltage': 13.0 + n / 10, 'current': 2.0, 'stage': 'bulk'})
+        if n == 2:
+            session.log_event('stage', {'from': 'bulk', 'to': 'absorption'})
+    session.close()
+    return session.get_stats()
+
+
+def test_jsonl_counts_samples_and_events_separately(tmp_path):
+    sink = create_session_sink('json', tmp_path / 'session', FIELDS, {'profile': 'test'})
+    stats = run_session(sink)
+
+    records = [json.loads(line) for line in sink.path.read_text().splitlines()]
+    kinds = [record['type'] for record in records]
+    assert kinds == ['session'] + ['sample'] * 3 + ['event'] + ['sample'] * 2
+    assert records[2]['voltage'] == 13.1
+    assert stats['written'] == 5
+    assert stats['events_written'] == 1
+    assert stats['dropped'] == 0
+
+
+def test_csv_written_matches_rows(tmp_path):
+    sink = create_session_sink('csv', tmp_path / 'session', FIELDS)
+    stats = run_session(sink)
+
+    with open(sink.path, newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == FIELDS
+    assert len(rows) - 1 == stats['written'] == 5
+    assert stats['events'] == 0  # CSV has no event records
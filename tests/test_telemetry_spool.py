@@ -0,0 +1,50 @@
+"""Tests for the disk-backed telemetry spool."""
+
+import pytest
+
+from telemetry_spool import TelemetrySpool
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = TelemetrySpool(str(tmp_path / 'spool.db'), 512 * 1024)
+    yield spool
+    spool.close()
+
+
+def test_fifo_peek_and_ack(spool):
+    for i in range(5):
+        spool.append(1000.0 + i, 'json', f'{{"n":{i}}}')
+    records = spool.peek(3)
+    assert [payload for _, _, _, payload in records] == [b'{"n":0}', b'{"n":1}', b'{"n":2}']
+    assert records[0][1:3] == (1000.0, 'json')
+
+    spool.ack(records[-1][0])
+    assert spool.count == 2
+    assert [payload for _, _, _, payload in spool.peek(10)] == [b'{"n":3}', b'{"n":4}']
+    spool.ack(spool.peek(10)[-1][0])
+    assert spool.is_empty()
+
+
+def test_pending_survives_reopen(tmp_path):
+    path = str(tmp_path / 'spool.db')
+    spool = TelemetrySpool(path, 512 * 1024)
+    spool.append(1000.0, 'json', '{}')
+    spool.close()
+
+    reopened = TelemetrySpool(path, 512 * 1024)
+    assert reopened.count == 1
+    reopened.close()
+
+
+def test_disk_use_bounded_and_oldest_evicted(spool):
+    payload = 'x' * 400
+    for i in range(5000):  # ~2 MB of payload into a 512 KB cap
+        spool.append(float(i), 'json', payload)
+        assert spool._disk_bytes() <= spool.max_bytes
+    assert spool.evicted > 0
+    oldest = spool.peek(1)[0]
+    assert oldest[1] >= spool.evicted  # Oldest records went first
+
+    spool.ack(spool.peek(100000)[-1][0])
+    assert spool.get_stats()['disk_bytes'] < spool.max_bytes / 4  # Space given back
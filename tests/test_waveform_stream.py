@@ -0,0 +1,79 @@
+"""Tests for the waveform streamer thread lifecycle."""
+
+import json
+import threading
+import time
+
+from waveform_stream import WaveformStreamer
+
+
+class FakePSU:
+    """PSU double; measure_output blocks while `gate` is cleared."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.calls = 0
+
+    def measure_output(self, blocking=True):
+        self.calls += 1
+        self.gate.wait()
+        return 13.5, 2.0
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_timeout_publishes_state():
+    frames, states = [], []
+    streamer = WaveformStreamer(FakePSU(), frames.append, on_state=states.append)
+    streamer.configure({'rate': 10, 'frame_interval': 0.5, 'timeout': 0.3})
+    assert wait_for(lambda: states)
+    assert states[-1]['enabled'] is False
+    assert frames and json.loads(frames[0])['v'][0] == 13.5
+
+
+def test_restart_after_stuck_stop_runs_one_sampler():
+    psu = FakePSU()
+    frames = []
+    streamer = WaveformStreamer(psu, frames.append)
+    streamer.configure({'rate': 10, 'frame_interval': 0.5, 'timeout': 60})
+    assert wait_for(lambda: psu.calls > 0)
+
+    psu.gate.clear()  # Sampler stuck in a PSU read
+    calls = psu.calls
+    assert wait_for(lambda: psu.calls > calls)
+    stuck = streamer._thread
+    streamer._stop.set()  # Same as stop(), without the 2 s join
+    streamer.enabled = False
+    assert stuck.is_alive()
+
+    streamer.start()
+    assert streamer._thread is not stuck
+    psu.gate.set()
+    stuck.join(timeout=2.0)
+    assert not stuck.is_alive()  # Old run exited on its own stop event
+    assert streamer._thread.is_alive()
+    streamer.stop()
+    assert streamer._thread is None
+
+
+def test_stop_keeps_reference_while_thread_alive():
+    psu = FakePSU()
+    streamer = WaveformStreamer(psu, lambda frame: None)
+    streamer.configure({'rate': 10, 'frame_interval': 0.5, 'timeout': 60})
+    assert wait_for(lambda: psu.calls > 0)
+    psu.gate.clear()
+    calls = psu.calls
+    assert wait_for(lambda: psu.calls > calls)
+    streamer.stop()  # Join times out after 2 s
+    assert streamer._thread is not None and streamer._thread.is_alive()
+    psu.gate.set()
+    streamer._thread.join(timeout=2.0)
+    assert not streamer._thread.is_alive()